@@ -0,0 +1,21 @@
+from dataclasses import asdict
+
+from fastapi import APIRouter, Query
+from fastapi.encoders import jsonable_encoder
+
+from ..infrastructure.slow_queries import slow_queries
+from ..shared.settings import settings
+
+router = APIRouter()
+
+@router.get("/debug/slow-queries", summary="Recent slow /stats queries (this process), newest first")
+async def debug_slow_queries(
+    limit: int = Query(default=50, ge=1, le=1000),
+    fingerprint: str | None = Query(default=None, description="only this SQL shape"),
+):
+    entries = [e for e in slow_queries.entries() if fingerprint is None or e.fingerprint == fingerprint]
+    return {
+        "threshold_ms": settings.slow_query_ms,
+        "explain_sample": settings.slow_query_explain_sample,
+        "queries": jsonable_encoder([asdict(e) for e in entries[:limit]]),
+    }
@@ -1,13 +1,32 @@
-from datetime import datetime, timezone
-from typing import List, Dict, Any
+import csv
+import functools
+import io
+import time
+import zlib
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timezone
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Response
-from pydantic import BaseModel, Field, model_validator
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from psycopg.types.json import Json
 from prometheus_client import Counter, Histogram  # +++
+from starlette.background import BackgroundTask
 
-from ..infrastructure.db import get_conn
+from ..application import ingest_buffer
+from ..infrastructure.db import connection
+from ..infrastructure.invalidation import publish_invalidation
+from ..infrastructure.partitions import ensure_partitions_for
+from ..infrastructure.rollups import with_rollups
+from ..shared.cache import normalize_segment
+from ..shared.metrics import INGEST_STAGE
+from ..shared.segment import SegmentError, build_segment_filter
+from ..shared.settings import settings
+from . import ingest_decode
+from .ingest_decode import Row
 
 router = APIRouter()
 
@@ -41,47 +60,363 @@ class IngestResult(BaseModel):
     ingested: int
     duplicates: int
 
-@router.post("/events", response_model=IngestResult, summary="Batch ingest events (idempotent)")
-async def ingest_events(events: List[EventIn], response: Response):
-    if not events:
-        raise HTTPException(status_code=400, detail="Empty payload")
-    if len(events) > 10_000:
-        raise HTTPException(status_code=413, detail="Too many events in a single batch (max 10k)")
+# один statement на весь батч: масиви колонок -> unnest -> INSERT (+ денні агрегати)
+INSERT_SQL = with_rollups("""
+    INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
+    SELECT * FROM unnest(
+        %(event_id)s::uuid[],
+        %(occurred_at)s::timestamptz[],
+        %(user_id)s::text[],
+        %(event_type)s::text[],
+        %(properties)s::jsonb[]
+    )
+    ON CONFLICT DO NOTHING
+    RETURNING occurred_at, user_id, event_type
+""")
 
-    conn = await get_conn()
+def _row(e: EventIn) -> Row:
+    return e.event_id, e.occurred_at, e.user_id, e.event_type, e.properties
 
-    inserted = 0
-    sql = """
-        INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
-        VALUES (%(event_id)s, %(occurred_at)s, %(user_id)s, %(event_type)s, %(properties)s)
-        ON CONFLICT (event_id) DO NOTHING;
+async def insert_rows(events: List[Row], count_errors: bool = True) -> int:
     """
+    Один батч = один statement (атомарно). Повертає кількість вставлених, решта — дублі.
+    count_errors=False — помилки рахує викликач (буфер: раз на кожну остаточно відкинуту подію).
+    """
+    # дублі event_id всередині батчу відсікаємо ще до БД (перший виграє)
+    unique: Dict[UUID, Row] = {}
+    for e in events:
+        unique.setdefault(e[0], e)
+    batch = list(unique.values())
+
+    params = {
+        "event_id": [e[0] for e in batch],
+        "occurred_at": [e[1] for e in batch],
+        "user_id": [e[2] for e in batch],
+        "event_type": [e[3] for e in batch],
+        "properties": [Json(e[4]) for e in batch],
+    }
 
     with INGEST_BATCH.time():  # вимірюємо час батчу
-        async with conn.cursor() as cur:
-            for e in events:
-                try:
-                    params = {
-                        "event_id": e.event_id,
-                        "occurred_at": e.occurred_at,
-                        "user_id": e.user_id,
-                        "event_type": e.event_type,
-                        "properties": Json(e.properties),
-                    }
-                    await cur.execute(sql, params)
-                    if cur.rowcount and cur.rowcount > 0:
-                        inserted += 1
-                        INGEST_EVENTS.labels("inserted").inc()
-                    else:
-                        INGEST_EVENTS.labels("duplicate").inc()
-                except Exception:
-                    INGEST_EVENTS.labels("error").inc()
-                    raise
-
-    
+        async with connection() as conn, conn.cursor() as cur:
+            started = time.perf_counter()  # без очікування на пул — його видно в db_pool_wait_seconds
+            try:
+                await ensure_partitions_for(conn, params["occurred_at"])
+                await cur.execute(INSERT_SQL, params)
+                per_day = await cur.fetchall()
+                inserted = sum(r["inserted"] for r in per_day)
+                if per_day:
+                    # кеш /stats: скидаємо лише записи, що перетинають змінені дні
+                    await publish_invalidation(cur, [r["day"] for r in per_day])
+            except Exception:
+                if count_errors:
+                    INGEST_EVENTS.labels("error").inc(len(events))
+                raise
+            finally:
+                INGEST_STAGE.labels("api", "db_write").observe(time.perf_counter() - started)
+
+    INGEST_EVENTS.labels("inserted").inc(inserted)
+    INGEST_EVENTS.labels("duplicate").inc(len(events) - inserted)
+    return inserted
+
+def make_ingest_buffer(max_events: int, flush_events: int, flush_interval: float) -> ingest_buffer.IngestBuffer:
+    """Write-behind буфер поверх insert_rows; повтори й бісекція не роздувають ingest_events_total{result="error"}."""
+    return ingest_buffer.IngestBuffer(
+        functools.partial(insert_rows, count_errors=False),
+        max_events=max_events,
+        flush_events=flush_events,
+        flush_interval=flush_interval,
+        on_drop=lambda row: INGEST_EVENTS.labels("error").inc(),
+    )
+
+def _check_batch_size(n: int) -> None:
+    if not n:
+        raise HTTPException(status_code=400, detail="Empty payload")
+    if n > 10_000:
+        raise HTTPException(status_code=413, detail="Too many events in a single batch (max 10k)")
+
+class IngestRoute(APIRoute):
+    """
+    З INGEST_FAST_PATH=1 JSON-тіло POST /events декодується одним validate_json
+    прямо в рядки (див. ingest_decode.py), минаючи EventIn. Невалідне тіло
+    (і не-JSON content-type) обробляє звичайний обробник — відповіді ті самі.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        stock = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            started = time.perf_counter()
+            body = await request.body()
+            started = _stage("decode", started)
+            if settings.ingest_fast_path and _is_json(request):
+                # validate_json розбирає й валідує за один прохід — обидва потрапляють у validate
+                rows = ingest_decode.decode_events(body)
+                if rows is not None:
+                    _stage("validate", started)
+                    _check_batch_size(len(rows))
+                    buffer = ingest_buffer.get_buffer()
+                    if buffer is not None:
+                        return _enqueue(buffer, rows)
+                    inserted = await insert_rows(rows)
+                    started = time.perf_counter()
+                    response = JSONResponse(
+                        status_code=201 if inserted == len(rows) else 200,
+                        content=IngestResult(ingested=inserted, duplicates=len(rows) - inserted).model_dump(),
+                    )
+                    _stage("response", started)
+                    return response
+            # тіло вже закешоване в request — stock-обробник прочитає його ще раз без I/O;
+            # json.loads + EventIn він робить до виклику ingest_events, серіалізацію — після
+            request.state.ingest_started = started
+            response = await stock(request)
+            if (written := getattr(request.state, "ingest_written", None)) is not None:
+                _stage("response", written)
+            return response
+
+        return handler
+
+def _stage(stage: str, started: float) -> float:
+    now = time.perf_counter()
+    INGEST_STAGE.labels("api", stage).observe(now - started)
+    return now
+
+def _is_json(request: Request) -> bool:
+    ct = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    return ct == "application/json"
+
+class AcceptedResult(BaseModel):
+    accepted: int
+
+def _enqueue(buffer: ingest_buffer.IngestBuffer, rows: List[Row]) -> JSONResponse:
+    """INGEST_ASYNC: події йдуть у write-behind буфер, відповідь — 202 без очікування БД."""
+    if not buffer.offer(rows):
+        raise HTTPException(status_code=503, detail="ingest buffer full", headers={"Retry-After": "1"})
+    return JSONResponse(status_code=202, content=AcceptedResult(accepted=len(rows)).model_dump())
+
+async def ingest_events(events: List[EventIn], request: Request, response: Response):
+    if (started := getattr(request.state, "ingest_started", None)) is not None:
+        _stage("validate", started)
+    _check_batch_size(len(events))
+
+    buffer = ingest_buffer.get_buffer()
+    if buffer is not None:
+        return _enqueue(buffer, [_row(e) for e in events])
+
+    inserted = await insert_rows([_row(e) for e in events])
+    request.state.ingest_written = time.perf_counter()
+
     if inserted == len(events):
         response.status_code = 201
     else:
         response.status_code = 200
 
     return IngestResult(ingested=inserted, duplicates=len(events) - inserted)
+
+router.add_api_route(
+    "/events", ingest_events, methods=["POST"],
+    response_model=IngestResult, summary="Batch ingest events (idempotent)",
+    responses={202: {"model": AcceptedResult, "description": "Queued for write-behind (INGEST_ASYNC=1)"}},
+    route_class_override=IngestRoute,
+)
+
+class LineError(BaseModel):
+    line: int
+    error: str
+
+class StreamIngestResult(IngestResult):
+    rejected: int = 0
+    errors: List[LineError] = Field(default_factory=list)
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+MAX_LINE_BYTES = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+
+@router.post(
+    "/events/stream",
+    response_model=StreamIngestResult,
+    summary="Streaming NDJSON ingest (one event per line, no batch size cap)",
+)
+async def ingest_events_stream(request: Request, response: Response):
+    """
+    Тіло читається інкрементально; кожні INGEST_STREAM_CHUNK валідних рядків
+    пишуться окремим батчем, тож пам'ять не залежить від розміру payload.
+
+    Невалідні рядки пропускаються й повертаються в errors (номер рядка з 1).
+    Батчі комітяться незалежно: якщо запит обірвався посередині, його можна
+    просто повторити — вже записані події стануть дублями.
+    """
+    content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    if content_type not in NDJSON_TYPES:
+        raise HTTPException(status_code=415, detail="Content-Type must be application/x-ndjson")
+
+    chunk_size = settings.ingest_stream_chunk
+    total = inserted = rejected = 0
+    errors: List[LineError] = []
+    pending: List[Row] = []
+    lineno = 0
+
+    def reject(n: int, msg: str) -> None:
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(LineError(line=n, error=msg))
+
+    fast = settings.ingest_fast_path
+
+    def take_line(raw: bytes) -> None:
+        nonlocal lineno
+        lineno += 1
+        if not raw.strip():
+            return
+        if fast:
+            row = ingest_decode.decode_event(raw)
+            if row is not None:
+                pending.append(row)
+                return
+        try:
+            pending.append(_row(EventIn.model_validate_json(raw)))
+        except ValidationError as e:
+            err = e.errors(include_url=False)[0]
+            loc = ".".join(str(x) for x in err["loc"])
+            reject(lineno, f"{loc}: {err['msg']}" if loc else err["msg"])
+
+    async def flush() -> None:
+        nonlocal total, inserted
+        if pending:
+            inserted += await insert_rows(pending)
+            total += len(pending)
+            pending.clear()
+
+    buf = bytearray()
+    skipping = False  # поточний рядок задовгий — відкидаємо до наступного \n
+    async for piece in request.stream():
+        buf += piece
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            if skipping:
+                skipping = False
+            else:
+                take_line(bytes(buf[start:nl]))
+            start = nl + 1
+            if len(pending) >= chunk_size:
+                await flush()
+        del buf[:start]
+        if len(buf) > MAX_LINE_BYTES:
+            if not skipping:
+                lineno += 1
+                reject(lineno, f"line exceeds {MAX_LINE_BYTES} bytes")
+                skipping = True
+            buf.clear()
+    if buf and not skipping:
+        take_line(bytes(buf))
+    await flush()
+
+    if total == 0 and rejected == 0:
+        raise HTTPException(status_code=400, detail="Empty payload")
+    response.status_code = 201 if rejected == 0 and inserted == total else 200
+    return StreamIngestResult(
+        ingested=inserted, duplicates=total - inserted, rejected=rejected, errors=errors,
+    )
+
+EXPORT_ROWS = Counter("export_rows_total", "Rows streamed by GET /events/export", ["format"])
+
+EXPORT_CSV_HEADER = "event_id,occurred_at,user_id,event_type,properties_json\r\n"
+
+# NDJSON-рядок збирає сам Postgres; properties::text — без розбору JSONB у Python
+EXPORT_SQL = """
+SELECT {columns}
+FROM events
+WHERE occurred_at >= %(from)s::date
+  AND occurred_at < (%(to)s::date + INTERVAL '1 day')
+  {seg_sql}
+ORDER BY occurred_at;
+"""
+EXPORT_COLUMNS = {
+    "csv": "event_id::text AS event_id, occurred_at, user_id, event_type, properties::text AS properties",
+    "ndjson": (
+        "json_build_object('event_id', event_id, 'occurred_at', occurred_at, 'user_id', user_id,"
+        " 'event_type', event_type, 'properties', properties)::text AS line"
+    ),
+}
+
+def _csv_chunk(rows: List[Dict[str, Any]]) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow((r["event_id"], r["occurred_at"].isoformat(), r["user_id"], r["event_type"], r["properties"]))
+    return buf.getvalue()
+
+def _ndjson_chunk(rows: List[Dict[str, Any]]) -> str:
+    return "".join(r["line"] + "\n" for r in rows)
+
+@router.get("/events/export", summary="Stream raw events as CSV or NDJSON (constant memory)")
+async def export_events(
+    from_: date = Query(alias="from"),
+    to_: date = Query(alias="to"),
+    segment: Optional[str] = Query(default=None, description="same syntax as /stats/*"),
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(default=False, description="Content-Encoding: gzip, compressed on the fly"),
+):
+    """
+    Рядки читаються серверним курсором по EXPORT_FETCH_SIZE і одразу віддаються
+    клієнтові: пам'ять не залежить від обсягу, перші байти йдуть без очікування
+    всього результату. CSV — у форматі імпортера (properties_json).
+    """
+    if from_ > to_:
+        raise HTTPException(status_code=400, detail="'from' must be <= 'to'")
+    try:
+        seg_sql, seg_params = build_segment_filter(normalize_segment(segment))
+    except SegmentError as e:
+        raise HTTPException(status_code=400, detail=f"invalid segment: {e}")
+
+    sql = EXPORT_SQL.format(columns=EXPORT_COLUMNS[format], seg_sql=seg_sql)
+    params = {"from": str(from_), "to": str(to_), **seg_params}
+    fetch_size = settings.export_fetch_size
+
+    # з'єднання й курсор відкриваємо до відповіді: помилка БД — це ще 5xx, а не обірваний 200
+    stack = AsyncExitStack()
+    try:
+        conn = await stack.enter_async_context(connection())
+        await stack.enter_async_context(conn.transaction())  # серверний курсор живе в транзакції
+        cur = await stack.enter_async_context(conn.cursor(name="events_export"))
+        await cur.execute(sql, params)
+        first = await cur.fetchmany(fetch_size)
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    encode = _csv_chunk if format == "csv" else _ndjson_chunk
+    rows_metric = EXPORT_ROWS.labels(format)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        try:
+            if format == "csv":
+                yield EXPORT_CSV_HEADER.encode()
+            rows = first
+            while rows:
+                rows_metric.inc(len(rows))
+                yield encode(rows).encode()
+                if len(rows) < fetch_size:
+                    break
+                rows = await cur.fetchmany(fetch_size)
+        finally:
+            # закриття ідемпотентне: ще раз — у background відповіді
+            await stack.aclose()
+
+    async def gzipped(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip-обгортка
+        async for piece in body:
+            # SYNC_FLUSH на кожен батч: клієнт отримує дані одразу, а не коли наповниться вікно
+            yield z.compress(piece) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+
+    filename = f"events_{from_.isoformat()}_{to_.isoformat()}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    body: AsyncIterator[bytes] = chunks()
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = gzipped(body)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    # клієнт може відключитись ще до першої ітерації chunks() — тоді її finally не виконається,
+    # а background Starlette запускає й після disconnect: з'єднання повертається в пул
+    return StreamingResponse(body, media_type=media_type, headers=headers, background=BackgroundTask(stack.aclose))
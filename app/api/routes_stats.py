@@ -1,23 +1,124 @@
-from datetime import date, datetime, timedelta
-from typing import List, Dict, Any, Optional
+import math
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple
 
 from fastapi import APIRouter, Query, HTTPException
-from ..infrastructure.db import get_conn
-from ..shared.segment import build_segment_filter
+from prometheus_client import Histogram
+from psycopg import AsyncCursor
+from ..application.funnel import FunnelCounter
+from ..infrastructure import cold
+from ..infrastructure.db import read_connection
+from ..infrastructure.rollups import load_daily_sketches
+from ..infrastructure.slow_queries import slow_queries
+from ..shared import hll
+from ..shared.cache import normalize_segment, stats_cache
+from ..shared.segment import SegmentError, build_segment_filter, event_types_segment, parse_segment
 
 router = APIRouter()
 
+# ----- Prometheus metrics -----
+# backend: "postgres" — запит до БД (без очікування на пул), "duckdb" — холодний шар у процесі
+STATS_QUERY = Histogram(
+    "stats_query_seconds",
+    "Execution time of /stats/* queries",
+    ["endpoint", "backend"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+STATS_ROWS = Histogram(
+    "stats_query_rows",
+    "Rows returned by /stats/* queries",
+    ["endpoint", "backend"],
+    buckets=(1, 10, 100, 1_000, 10_000, 100_000),
+)
+
+async def _fetch(cur: AsyncCursor, endpoint: str, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    await cur.execute(sql, params)
+    rows = await cur.fetchall()
+    _observe(endpoint, "postgres", started, len(rows))
+    slow_queries.observe(endpoint, sql, params, time.perf_counter() - started)
+    return rows
+
+def _observe(endpoint: str, backend: str, started: float, rows: int) -> None:
+    STATS_QUERY.labels(endpoint, backend).observe(time.perf_counter() - started)
+    STATS_ROWS.labels(endpoint, backend).observe(rows)
+
+def _segment_param(segment: Optional[str]) -> Optional[str]:
+    """Нормалізований сегмент; синтаксична помилка — 400 ще до кешу й БД."""
+    segment = normalize_segment(segment)
+    try:
+        parse_segment(segment)
+    except SegmentError as e:
+        raise HTTPException(status_code=400, detail=f"invalid segment: {e}")
+    return segment
+
 @router.get("/stats/dau", summary="Daily Active Users per day in range")
 async def stats_dau(
     from_: date = Query(alias="from"),
     to_: date = Query(alias="to"),
-    segment: Optional[str] = Query(default=None, description="e.g., event_type:purchase or properties.country=UA"),
+    segment: Optional[str] = Query(default=None, description="e.g., event_type:purchase or event_type IN (login, purchase) AND properties.country=UA"),
+    approx: bool = Query(default=False, description="HyperLogLog estimate (±0.81% std. error), no segment"),
 ):
     if from_ > to_:
         raise HTTPException(status_code=400, detail="'from' must be <= 'to'")
+    if approx and segment:
+        raise HTTPException(status_code=400, detail="approx mode does not support segment")
+
+    segment = _segment_param(segment)
+    return await stats_cache.get_or_compute(
+        "dau", (from_, to_, segment, approx), from_, to_,
+        lambda: _dau(from_, to_, segment, approx),
+    )
+
+async def _dau(from_: date, to_: date, segment: Optional[str], approx: bool) -> List[Dict[str, Any]]:
+    if approx:
+        async with read_connection() as conn:
+            started = time.perf_counter()
+            sketches = await load_daily_sketches(conn, from_, to_)
+            _observe("dau", "postgres", started, len(sketches))
+        return [
+            {"date": (from_ + timedelta(days=i)).isoformat(), "dau": round(hll.estimate(sk))}
+            for i, sk in enumerate(sketches)
+        ]
+
+    cold_files: Dict[date, str] = {}
+    async with read_connection() as conn, conn.cursor() as cur:
+        if not segment:
+            # без сегмента — відповідь з агрегату daily_dau: ціна ~ кількість днів
+            # (агрегати холодних днів лишаються в Postgres і після purge)
+            sql = """
+            SELECT d.d::date AS date, COALESCE(r.dau, 0) AS dau
+            FROM generate_series(%(from)s::date, %(to)s::date, interval '1 day') AS d
+            LEFT JOIN daily_dau r ON r.day = d.d::date
+            ORDER BY d.d;
+            """
+            params: Dict[str, Any] = {"from": str(from_), "to": str(to_)}
+        else:
+            cold_files = await cold.days_between(conn, from_, to_)
+            sql, params = _dau_raw_query(from_, to_, segment, list(cold_files))
+        rows = await _fetch(cur, "dau", sql, params)
+
+    result = {r["date"]: r["dau"] for r in rows}
+    if cold_files:
+        result.update(await _cold("dau", cold.dau(cold_files, segment)))
+    return [{"date": d.isoformat(), "dau": n} for d, n in result.items()]
+
+async def _cold(endpoint: str, query: Awaitable[Dict[Any, int]]) -> Dict[Any, int]:
+    """Запит до холодного шару; без duckdb/файлів — 503, а не тиха недостача даних."""
+    started = time.perf_counter()
+    try:
+        result = await query
+    except cold.ColdStorageError as e:
+        raise HTTPException(status_code=503, detail=f"cold storage unavailable: {e}")
+    _observe(endpoint, "duckdb", started, len(result))
+    return result
 
+def _dau_raw_query(
+    from_: date, to_: date, segment: Optional[str], cold_days: Sequence[date] = ()
+) -> Tuple[str, Dict[str, Any]]:
+    """Сирі події з Postgres; дні з холодного шару пропускаються — їх рахує DuckDB."""
     seg_sql, seg_params = build_segment_filter(segment)
-    conn = await get_conn()
     sql = f"""
     WITH dates AS (
         SELECT generate_series(%(from)s::date, %(to)s::date, interval '1 day') AS d
@@ -27,6 +128,7 @@ async def stats_dau(
         FROM events
         WHERE occurred_at >= %(from)s::date
           AND occurred_at < (%(to)s::date + INTERVAL '1 day')
+          AND occurred_at::date <> ALL(%(cold_days)s::date[])
           {seg_sql}
         GROUP BY occurred_at::date
     )
@@ -35,14 +137,51 @@ async def stats_dau(
     LEFT JOIN agg a ON a.day = d.d::date
     ORDER BY d.d;
     """
-    params = {"from": str(from_), "to": str(to_)}
+    params: Dict[str, Any] = {"from": str(from_), "to": str(to_), "cold_days": list(cold_days)}
     params.update(seg_params)
+    return sql, params
 
-    async with (await get_conn()).cursor() as cur:
-        await cur.execute(sql, params)
-        rows = await cur.fetchall()
+@router.get("/stats/active-users", summary="Approximate DAU / WAU / MAU and stickiness (HyperLogLog)")
+async def stats_active_users(
+    from_: date = Query(alias="from"),
+    to_: date = Query(alias="to"),
+):
+    """
+    WAU/MAU — ковзні 7/30-денні вікна, що закінчуються в цей день; рахуються
+    об'єднанням денних HLL-скетчів, без сканування events.
+    Стандартна відносна похибка кожного значення ≈ 0.81%.
+    """
+    if from_ > to_:
+        raise HTTPException(status_code=400, detail="'from' must be <= 'to'")
+    if (to_ - from_).days > 366:
+        raise HTTPException(status_code=400, detail="range must be <= 366 days")
+
+    lookback = 29
+    return await stats_cache.get_or_compute(
+        "active-users", (from_, to_), from_ - timedelta(days=lookback), to_,
+        lambda: _active_users(from_, to_, lookback),
+    )
+
+async def _active_users(from_: date, to_: date, lookback: int) -> List[Dict[str, Any]]:
+    async with read_connection() as conn:
+        started = time.perf_counter()
+        sketches = await load_daily_sketches(conn, from_ - timedelta(days=lookback), to_)
+        _observe("active-users", "postgres", started, len(sketches))
+    weekly = hll.rolling_union(sketches, 7)
+    monthly = hll.rolling_union(sketches, 30)
 
-    return [{"date": r["date"].isoformat(), "dau": r["dau"]} for r in rows]
+    result: List[Dict[str, Any]] = []
+    for i in range(lookback, len(sketches)):
+        dau = round(hll.estimate(sketches[i]))
+        mau = round(hll.estimate(monthly[i]))
+        result.append({
+            "date": (from_ + timedelta(days=i - lookback)).isoformat(),
+            "dau": dau,
+            "wau": round(hll.estimate(weekly[i])),
+            "mau": mau,
+            "stickiness": round(dau / mau, 4) if mau else 0.0,
+        })
+    return result
 
 @router.get("/stats/top-events", summary="Top event types in range")
 async def stats_top_events(
@@ -56,23 +195,59 @@ async def stats_top_events(
     if not (1 <= limit <= 1000):
         raise HTTPException(status_code=400, detail="limit must be 1..1000")
 
-    seg_sql, seg_params = build_segment_filter(segment)
-    sql = f"""
-    SELECT event_type, COUNT(*) AS cnt
-    FROM events
-    WHERE occurred_at >= %(from)s::date
-      AND occurred_at < (%(to)s::date + INTERVAL '1 day')
-      {seg_sql}
-    GROUP BY event_type
-    ORDER BY cnt DESC
-    LIMIT %(limit)s;
-    """
-    params = {"from": str(from_), "to": str(to_), "limit": limit}
-    params.update(seg_params)
+    segment = _segment_param(segment)
+    return await stats_cache.get_or_compute(
+        "top-events", (from_, to_, segment, limit), from_, to_,
+        lambda: _top_events(from_, to_, limit, segment),
+    )
 
-    async with (await get_conn()).cursor() as cur:
-        await cur.execute(sql, params)
-        rows = await cur.fetchall()
+async def _top_events(from_: date, to_: date, limit: int, segment: Optional[str]) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = {"from": str(from_), "to": str(to_), "limit": limit}
+    seg_event_types = event_types_segment(segment)
+    cold_files: Dict[date, str] = {}
+    if not segment or seg_event_types is not None:
+        # без сегмента або з фільтром лише по event_type — з агрегату daily_event_counts
+        type_sql = ""
+        if seg_event_types is not None:
+            type_sql = "AND event_type = ANY(%(seg_event_types)s)"
+            params["seg_event_types"] = seg_event_types
+        sql = f"""
+        SELECT event_type, SUM(events)::bigint AS cnt
+        FROM daily_event_counts
+        WHERE day BETWEEN %(from)s::date AND %(to)s::date
+          {type_sql}
+        GROUP BY event_type
+        ORDER BY cnt DESC
+        LIMIT %(limit)s;
+        """
+    else:
+        seg_sql, seg_params = build_segment_filter(segment)
+        # з холодними днями LIMIT — лише після злиття з DuckDB (типів подій небагато)
+        sql = f"""
+        SELECT event_type, COUNT(*) AS cnt
+        FROM events
+        WHERE occurred_at >= %(from)s::date
+          AND occurred_at < (%(to)s::date + INTERVAL '1 day')
+          AND occurred_at::date <> ALL(%(cold_days)s::date[])
+          {seg_sql}
+        GROUP BY event_type
+        ORDER BY cnt DESC
+        LIMIT CASE WHEN cardinality(%(cold_days)s::date[]) = 0 THEN %(limit)s END;
+        """
+        params.update(seg_params)
+
+    async with read_connection() as conn, conn.cursor() as cur:
+        if segment and seg_event_types is None:
+            cold_files = await cold.days_between(conn, from_, to_)
+            params["cold_days"] = list(cold_files)
+        rows = await _fetch(cur, "top-events", sql, params)
+
+    if cold_files:
+        counts = {r["event_type"]: r["cnt"] for r in rows}
+        for event_type, n in (await _cold("top-events", cold.event_counts(cold_files, segment))).items():
+            counts[event_type] = counts.get(event_type, 0) + n
+        top = sorted(counts.items(), key=lambda kv: -kv[1])[:limit]
+        return [{"event_type": t, "count": n} for t, n in top]
 
     return [{"event_type": r["event_type"], "count": r["cnt"]} for r in rows]
 
@@ -88,85 +263,169 @@ async def stats_retention(
 
     # крок в днях
     step_days = 7 if window_size == "weekly" else 1
-    seg_sql, seg_params = build_segment_filter(segment)
+    segment = _segment_param(segment)
+    # когорта залежить від user_first_seen, а його може зсунути backfill будь-якого ранішого дня
+    return await stats_cache.get_or_compute(
+        "retention", (start_date, windows, step_days, segment),
+        date.min, start_date + timedelta(days=windows * step_days - 1),
+        lambda: _retention(start_date, windows, step_days, segment),
+    )
+
+async def _retention(start_date: date, windows: int, step_days: int, segment: Optional[str]) -> List[Dict[str, Any]]:
+    matrix = await _retention_matrix(start_date, 1, windows, step_days, segment)
+    row = matrix[0]
+    result: Dict[str, Any] = {"cohort_start_date": row["cohort_start_date"], "size": row["size"]}
+    for w, rate in enumerate(row["retention"]):
+        result[f"w{w}"] = rate
+    return [result]
 
+@router.get("/stats/retention/matrix", summary="Cohort retention matrix: N cohorts x M windows in one query")
+async def stats_retention_matrix(
+    from_: date = Query(alias="from"),
+    cohorts: int = 12,
+    windows: int = 12,
+    window_size: str = Query(default="weekly", pattern="^(daily|weekly)$"),
+    segment: Optional[str] = Query(default=None),
+):
+    """
+    Когорта — юзери, чия перша подія за всю історію (user_first_seen) припала на
+    її період; з сегментом — ще й мали подію сегмента в цьому періоді.
+    retention[w] — частка когорти, активна у w-му вікні від початку когорти.
+    """
+    if not (1 <= cohorts <= 60):
+        raise HTTPException(status_code=400, detail="cohorts must be 1..60")
+    if not (1 <= windows <= 60):
+        raise HTTPException(status_code=400, detail="windows must be 1..60")
+
+    step_days = 7 if window_size == "weekly" else 1
+    segment = _segment_param(segment)
+    hi = from_ + timedelta(days=(cohorts + windows - 1) * step_days - 1)
+    return await stats_cache.get_or_compute(
+        "retention-matrix", (from_, cohorts, windows, step_days, segment), date.min, hi,
+        lambda: _retention_matrix(from_, cohorts, windows, step_days, segment),
+    )
+
+async def _retention_matrix(
+    start_date: date, cohorts: int, windows: int, step_days: int, segment: Optional[str]
+) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = {"start": str(start_date), "step": step_days, "cohorts": cohorts, "windows": windows}
+    if segment:
+        seg_sql, seg_params = build_segment_filter(segment)
+        params.update(seg_params)
+        activity_sql = f"""
+            SELECT occurred_at::date AS day, user_id
+            FROM events
+            WHERE occurred_at >= %(start)s::date
+              AND occurred_at <  %(start)s::date + ((%(cohorts)s + %(windows)s - 1) * %(step)s) * INTERVAL '1 day'
+              {seg_sql}
+        """
+    else:
+        # без сегмента активність береться з агрегату (день, юзер), events не читаємо
+        activity_sql = """
+            SELECT day, user_id
+            FROM daily_user_activity
+            WHERE day >= %(start)s::date
+              AND day <  %(start)s::date + (%(cohorts)s + %(windows)s - 1) * %(step)s
+        """
+
+    # один прохід по активності всіх когорт: (когорта, вікно, юзер) -> COUNT по (когорта, вікно)
     sql = f"""
-    WITH bounds AS (
-        SELECT
-            %(start)s::date AS start_date,
-            %(step)s::int    AS step_days,
-            %(windows)s::int AS windows
+    WITH cohort AS (
+        SELECT user_id, (first_day - %(start)s::date) / %(step)s AS c
+        FROM user_first_seen
+        WHERE first_day >= %(start)s::date
+          AND first_day <  %(start)s::date + %(cohorts)s * %(step)s
     ),
-    win AS (
-        SELECT
-          g AS w,
-          (SELECT start_date FROM bounds) + (g * (SELECT step_days FROM bounds)) * INTERVAL '1 day' AS w_start,
-          (SELECT start_date FROM bounds) + ((g+1) * (SELECT step_days FROM bounds)) * INTERVAL '1 day' AS w_end
-        FROM generate_series(0, (SELECT windows FROM bounds)-1) AS g
-    ),
-    period AS (
-        SELECT (SELECT start_date FROM bounds) AS p_start,
-               (SELECT start_date FROM bounds) + ((SELECT windows FROM bounds) * (SELECT step_days FROM bounds)) * INTERVAL '1 day' AS p_end
-    ),
-    events_f AS (
-        SELECT user_id, occurred_at
-        FROM events, period
-        WHERE occurred_at >= p_start
-          AND occurred_at <  p_end
-          {seg_sql}
-    ),
-    first_event AS (
-        SELECT user_id, MIN(occurred_at) AS first_at
-        FROM events_f GROUP BY user_id
-    ),
-    cohort AS (
-        -- юзери, чия перша подія припала на перше вікно [start, start+step)
-        SELECT fe.user_id
-        FROM first_event fe, bounds
-        WHERE fe.first_at >= (SELECT start_date FROM bounds)
-          AND fe.first_at  < (SELECT start_date FROM bounds) + (SELECT step_days FROM bounds) * INTERVAL '1 day'
-    ),
-    activity AS (
-        SELECT w.w AS window, COUNT(DISTINCT e.user_id) AS active
-        FROM win w
-        JOIN events_f e
-          ON e.occurred_at >= w.w_start AND e.occurred_at < w.w_end
-        JOIN cohort c ON c.user_id = e.user_id
-        GROUP BY w.w
-    ),
-    cohort_size AS (SELECT COUNT(*) AS size FROM cohort)
-    SELECT w.w AS window,
-           w.w_start::date AS w_start,
-           COALESCE(a.active, 0) AS active,
-           (SELECT size FROM cohort_size) AS size
-    FROM win w
-    LEFT JOIN activity a ON a.window = w.w
-    ORDER BY w.w;
+    act AS (
+        SELECT DISTINCT c.c, (a.day - %(start)s::date) / %(step)s - c.c AS w, a.user_id
+        FROM ({activity_sql}) a
+        JOIN cohort c ON c.user_id = a.user_id
+    )
+    SELECT a.c AS cohort, a.w AS window, COUNT(*) AS active
+    FROM act a
+    WHERE a.w BETWEEN 0 AND %(windows)s - 1
+      -- у когорті лише ті, хто був активний у її першому вікні (важливо для сегмента)
+      AND EXISTS (SELECT 1 FROM act a0 WHERE a0.c = a.c AND a0.user_id = a.user_id AND a0.w = 0)
+    GROUP BY a.c, a.w;
+    """
+
+    async with read_connection() as conn, conn.cursor() as cur:
+        rows = await _fetch(cur, "retention", sql, params)
+
+    active = {(int(r["cohort"]), int(r["window"])): int(r["active"]) for r in rows}
+    result: List[Dict[str, Any]] = []
+    for c in range(cohorts):
+        size = active.get((c, 0), 0)
+        result.append({
+            "cohort_start_date": (start_date + timedelta(days=c * step_days)).isoformat(),
+            "size": size,
+            "retention": [
+                round(active.get((c, w), 0) / size, 4) if size > 0 else 0.0
+                for w in range(windows)
+            ],
+        })
+    return result
+
+FUNNEL_FETCH_SIZE = 10_000
+MAX_FUNNEL_STEPS = 10
+
+@router.get("/stats/funnel", summary="Ordered conversion funnel with a conversion window")
+async def stats_funnel(
+    from_: date = Query(alias="from"),
+    to_: date = Query(alias="to"),
+    steps: str = Query(description="event types in order, comma-separated, e.g. login,view_item,add_to_cart,purchase"),
+    window_hours: int = Query(default=24, ge=1, le=24 * 90, description="max time from the first step to the last"),
+    segment: Optional[str] = Query(default=None),
+):
+    """
+    Вхід у воронку — подія першого кроку в [from, to]; наступні кроки — у тому ж порядку
+    не пізніше window_hours від входу (можуть виходити за `to`). users[k] — скільки юзерів
+    дійшли щонайменше до кроку k; медіани — в секундах, за першим досягненням кроку.
+    Сегмент фільтрує події всіх кроків. Дні, видалені в холодний шар (--purge), не враховуються.
+    """
+    if from_ > to_:
+        raise HTTPException(status_code=400, detail="'from' must be <= 'to'")
+    step_list = [s.strip() for s in steps.split(",")]
+    if not (2 <= len(step_list) <= MAX_FUNNEL_STEPS) or not all(step_list):
+        raise HTTPException(status_code=400, detail=f"steps must list 2..{MAX_FUNNEL_STEPS} event types")
+
+    segment = _segment_param(segment)
+    hi = to_ + timedelta(days=math.ceil(window_hours / 24))
+    return await stats_cache.get_or_compute(
+        "funnel", (from_, to_, tuple(step_list), window_hours, segment), from_, hi,
+        lambda: _funnel(from_, to_, step_list, timedelta(hours=window_hours), segment),
+    )
+
+async def _funnel(
+    from_: date, to_: date, steps: List[str], window: timedelta, segment: Optional[str]
+) -> List[Dict[str, Any]]:
+    lo = datetime.combine(from_, dtime.min, tzinfo=timezone.utc)
+    entry_before = datetime.combine(to_ + timedelta(days=1), dtime.min, tzinfo=timezone.utc)
+    seg_sql, seg_params = build_segment_filter(segment)
+    # один прохід у порядку idx_events_user_time (user_id, occurred_at): Merge Append по партиціях
+    # + incremental sort за event_id; серверний курсор ще й схиляє планувальник до fast-start плану
+    sql = f"""
+    SELECT user_id, occurred_at, event_type
+    FROM events
+    WHERE occurred_at >= %(lo)s
+      AND occurred_at < %(hi)s
+      AND event_type = ANY(%(steps)s::text[])
+      {seg_sql}
+    ORDER BY user_id, occurred_at, event_id;
     """
-    params = {"start": str(start_date), "step": step_days, "windows": windows}
+    params: Dict[str, Any] = {"lo": lo, "hi": entry_before + window, "steps": list(set(steps))}
     params.update(seg_params)
 
-    async with (await get_conn()).cursor() as cur:
+    counter = FunnelCounter(steps, window, entry_before=entry_before)
+    rows = 0
+    started = time.perf_counter()
+    # серверний курсор: пам'ять не залежить від кількості подій у діапазоні
+    async with read_connection() as conn, conn.transaction(), conn.cursor(name="stats_funnel") as cur:
         await cur.execute(sql, params)
-        rows = await cur.fetchall()
-
-    if not rows:
-        
-        return [{
-            "cohort_start_date": start_date.isoformat(),
-            "size": 0,
-            **{f"w{i}": 0.0 for i in range(windows)},
-        }]
-
-    size = rows[0]["size"] or 0
-    result = {
-        "cohort_start_date": start_date.isoformat(),
-        "size": int(size),
-    }
-    for r in rows:
-        w = int(r["window"])
-        active = int(r["active"])
-        rate = (active / size) if size > 0 else 0.0
-        result[f"w{w}"] = round(rate, 4)
-
-    return [result]
\ No newline at end of file
+        while batch := await cur.fetchmany(FUNNEL_FETCH_SIZE):
+            for r in batch:
+                counter.feed(r["user_id"], r["occurred_at"], r["event_type"])
+            rows += len(batch)
+    _observe("funnel", "postgres", started, rows)
+    slow_queries.observe("funnel", sql, params, time.perf_counter() - started)
+    return counter.result()
@@ -0,0 +1,73 @@
+"""
+Воронка за один упорядкований прохід по подіях (user_id, occurred_at).
+
+Юзер проходить крок k, якщо в нього є події steps[0], ..., steps[k] саме в такому
+порядку і від першої до останньої минуло не більше window. Для кожного рівня
+тримаємо ланцюжок з найпізнішим стартом (як windowFunnel у ClickHouse): він лишає
+найбільше часу на наступні кроки, тож жадібний прохід дає максимальну глибину.
+
+Вхід мусить бути впорядкований за (user_id, occurred_at); пам'ять — O(кроків) на
+поточного юзера плюс тривалості для медіан.
+"""
+from datetime import datetime, timedelta
+from statistics import median
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class FunnelCounter:
+    def __init__(self, steps: Sequence[str], window: timedelta, entry_before: Optional[datetime] = None) -> None:
+        """entry_before — старт воронки (перший крок) лише до цього моменту; наступні кроки можуть бути пізніше."""
+        self.steps = list(steps)
+        self.window = window
+        self.entry_before = entry_before
+        self.users = [0] * len(self.steps)
+        # тривалості першого досягнення кроку: від входу у воронку і від попереднього кроку
+        self._from_start: List[List[float]] = [[] for _ in self.steps]
+        self._from_prev: List[List[float]] = [[] for _ in self.steps]
+        # подія може бути кількома кроками (view -> view): рівні від старшого до молодшого
+        self._levels: Dict[str, List[int]] = {}
+        for i, s in reversed(list(enumerate(self.steps))):
+            self._levels.setdefault(s, []).append(i)
+        self._user: Any = None
+        self._chains: List[Optional[Tuple[datetime, ...]]] = []
+        self._reached = 0
+
+    def feed(self, user_id: Any, occurred_at: datetime, event_type: str) -> None:
+        if user_id != self._user:
+            self._user = user_id
+            self._chains = [None] * len(self.steps)
+            self._reached = 0
+        for i in self._levels.get(event_type, ()):
+            if i == 0:
+                if self.entry_before is None or occurred_at < self.entry_before:
+                    self._advance(0, (occurred_at,))
+                continue
+            prev = self._chains[i - 1]
+            if prev is not None and occurred_at - prev[0] <= self.window:
+                self._advance(i, prev + (occurred_at,))
+
+    def _advance(self, i: int, chain: Tuple[datetime, ...]) -> None:
+        self._chains[i] = chain
+        if i < self._reached:
+            return
+        # рівні досягаються по одному, тож i == self._reached
+        self._reached = i + 1
+        self.users[i] += 1
+        if i:
+            self._from_start[i].append((chain[-1] - chain[0]).total_seconds())
+            self._from_prev[i].append((chain[-1] - chain[-2]).total_seconds())
+
+    def result(self) -> List[Dict[str, Any]]:
+        entered = self.users[0] if self.steps else 0
+        out: List[Dict[str, Any]] = []
+        for i, step in enumerate(self.steps):
+            prev = self.users[i - 1] if i else entered
+            out.append({
+                "step": step,
+                "users": self.users[i],
+                "conversion": round(self.users[i] / entered, 4) if entered else 0.0,
+                "conversion_from_previous": round(self.users[i] / prev, 4) if prev else 0.0,
+                "median_seconds_from_start": median(self._from_start[i]) if self._from_start[i] else None,
+                "median_seconds_from_previous": median(self._from_prev[i]) if self._from_prev[i] else None,
+            })
+        return out
@@ -0,0 +1,164 @@
+"""
+Write-behind буфер інгесту (INGEST_ASYNC=1).
+
+POST /events кладе події в обмежену чергу в пам'яті процесу й одразу відповідає 202;
+фоновий flusher збирає їх у великі батчі (за розміром або за часом) і пише тим самим
+INSERT ... unnest, що й синхронний шлях. Переповнена черга -> 503 (backpressure).
+
+Батч, який БД відкидає через самі дані (DataError, IntegrityError), ділиться навпіл,
+доки не лишаться окремі погані рядки; їх відкидаємо в лог з метрикою, решту пишемо.
+Будь-яка інша помилка (мережа, пул, права, read-only, відсутня таблиця) — системна:
+батч повертається в чергу й повторюється з backoff, прийняті з 202 події не губляться.
+
+Події, прийняті з 202, живуть лише в пам'яті до флашу: на штатній зупинці буфер
+дописується, при падінні процесу — губляться (клієнт, якому це критично, шле синхронно).
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Tuple
+
+import psycopg
+import structlog
+from prometheus_client import Counter, Gauge, Histogram
+
+log = structlog.get_logger()
+
+# (event_id, occurred_at, user_id, event_type, properties) — як у INSERT інгесту
+Row = Tuple[Any, ...]
+
+BUFFER_DEPTH = Gauge("ingest_buffer_depth", "Events waiting in the write-behind ingest buffer")
+BUFFER_LAST_FLUSH = Gauge("ingest_buffer_last_flush_seconds", "Duration of the most recent buffer flush")
+BUFFER_FLUSH = Histogram(
+    "ingest_buffer_flush_seconds",
+    "Latency of write-behind buffer flushes",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+BUFFER_REJECTED = Counter("ingest_buffer_rejected_total", "Events rejected because the buffer was full")
+BUFFER_FLUSH_ERRORS = Counter("ingest_buffer_flush_errors_total", "Failed buffer flushes (retried)")
+BUFFER_DROPPED = Counter(
+    "ingest_buffer_dropped_total", "Accepted events dropped because the database rejects them permanently"
+)
+
+# помилки через самі рядки: лише їх бісекція доводить до відкидання
+DATA_ERRORS = (psycopg.errors.DataError, psycopg.errors.IntegrityError)
+
+
+class IngestBuffer:
+    def __init__(
+        self,
+        insert: Callable[[List[Row]], Awaitable[int]],
+        max_events: int,
+        flush_events: int,
+        flush_interval: float,
+        on_drop: Optional[Callable[[Row], None]] = None,
+    ) -> None:
+        self._insert = insert
+        self._on_drop = on_drop
+        self.max_events = max_events
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self._queue: Deque[Row] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def offer(self, rows: List[Row]) -> bool:
+        """Приймає всі рядки або жодного (False — черга переповнена чи буфер зупиняється)."""
+        if self._closing or len(self._queue) + len(rows) > self.max_events:
+            BUFFER_REJECTED.inc(len(rows))
+            return False
+        self._queue.extend(rows)
+        BUFFER_DEPTH.set(len(self._queue))
+        if len(self._queue) >= self.flush_events:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Перестає приймати нові події й дописує чергу (не довше timeout секунд)."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None:
+            self.start()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            log.error("ingest_buffer_dropped", events=len(self._queue))
+        self._task = None
+        log.info("ingest_buffer_closed")
+
+    async def _run(self) -> None:
+        backoff = 0.0
+        while not (self._closing and not self._queue):
+            if backoff:
+                await asyncio.sleep(backoff)
+            elif len(self._queue) < self.flush_events and not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if not self._queue:
+                continue
+            ok = await self._flush_once()
+            backoff = 0.0 if ok else min(max(backoff * 2, 0.1), 5.0)
+
+    async def _flush_once(self) -> bool:
+        n = min(len(self._queue), self.flush_events)
+        batch = [self._queue.popleft() for _ in range(n)]
+        started = time.perf_counter()
+        try:
+            await self._insert_or_drop(batch)
+        except asyncio.CancelledError:
+            # INSERT міг і закомітитись — повтор безпечний, дублі відсіче ON CONFLICT
+            self._queue.extendleft(reversed(batch))
+            raise
+        except Exception as e:
+            # події вже підтверджені 202 — повертаємо їх у голову черги й повторюємо
+            self._queue.extendleft(reversed(batch))
+            BUFFER_FLUSH_ERRORS.inc()
+            log.warning("ingest_buffer_flush_failed", events=n, error=str(e))
+            return False
+        finally:
+            BUFFER_DEPTH.set(len(self._queue))
+        elapsed = time.perf_counter() - started
+        BUFFER_FLUSH.observe(elapsed)
+        BUFFER_LAST_FLUSH.set(elapsed)
+        return True
+
+    async def _insert_or_drop(self, rows: List[Row]) -> None:
+        """
+        INSERT; на помилці даних — бісекція до поганих рядків, які відкидаються.
+        Решта помилок летить у _flush_once (повтор); уже вставлені половини відсіче ON CONFLICT.
+        """
+        try:
+            await self._insert(rows)
+        except DATA_ERRORS as e:
+            if len(rows) == 1:
+                BUFFER_DROPPED.inc()
+                if self._on_drop is not None:
+                    self._on_drop(rows[0])
+                log.error("ingest_buffer_event_dropped", event_id=str(rows[0][0]), error=str(e))
+                return
+            mid = len(rows) // 2
+            await self._insert_or_drop(rows[:mid])
+            await self._insert_or_drop(rows[mid:])
+
+
+_buffer: Optional[IngestBuffer] = None
+
+
+def get_buffer() -> Optional[IngestBuffer]:
+    return _buffer
+
+
+def set_buffer(buffer: Optional[IngestBuffer]) -> None:
+    global _buffer
+    _buffer = buffer
@@ -1,20 +1,31 @@
+import asyncio
 import csv
 import hashlib
 import json
 import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Iterable
+from typing import Any, BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from urllib.parse import urlparse
 import urllib.request
 import glob
 
+import psycopg
 import typer
-from psycopg.types.json import Json
 
-from ..infrastructure.db import get_conn
+from ..infrastructure import cold
+from ..infrastructure.db import connect, get_conn
+from ..infrastructure.invalidation import publish_invalidation
+from ..infrastructure.partitions import detach_partitions_before, ensure_partitions_for, migrate_to_partitioned
+from ..infrastructure.promoted import backfill as backfill_promoted, ensure_promoted
+from ..infrastructure.rollups import rebuild_rollups, with_rollups
 from ..shared.logging import setup_logging
+from ..shared.metrics import INGEST_STAGE
 
 app = typer.Typer(add_completion=False)
 setup_logging()
@@ -58,23 +69,107 @@ def _iter_input_paths(path_or_url: str, glob_pattern: Optional[str]) -> Iterable
     # single file
     yield p
 
+STAGE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS events_stage (LIKE events INCLUDING DEFAULTS)
+    ON COMMIT DELETE ROWS;
+"""
+
+COPY_SQL = """
+    COPY events_stage (event_id, occurred_at, user_id, event_type, properties)
+    FROM STDIN (FORMAT BINARY);
+"""
+
+MERGE_SQL = with_rollups("""
+    INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
+    SELECT event_id, occurred_at, user_id, event_type, properties
+    FROM events_stage
+    ORDER BY event_id  -- однаковий порядок блокувань у паралельних воркерів
+    ON CONFLICT DO NOTHING
+    RETURNING occurred_at, user_id, event_type
+""")
+
+CHECKPOINT_SQL = """
+    INSERT INTO import_checkpoints (file_sha256, path, rows_committed, byte_offset, completed, updated_at)
+    VALUES (%(sha)s, %(path)s, %(rows)s, %(offset)s, %(completed)s, now())
+    ON CONFLICT (file_sha256) DO UPDATE
+    SET path = EXCLUDED.path,
+        rows_committed = EXCLUDED.rows_committed,
+        byte_offset = EXCLUDED.byte_offset,
+        completed = EXCLUDED.completed,
+        updated_at = now()
+    -- writer-и можуть комітити не по порядку: checkpoint лише росте
+    WHERE import_checkpoints.rows_committed <= EXCLUDED.rows_committed;
+"""
+
+async def _copy_merge(
+    conn: psycopg.AsyncConnection,
+    rows: List[Tuple[Any, ...]],
+    checkpoint: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Один батч = одна транзакція: binary COPY у staging + один INSERT ... SELECT
+    (разом з оновленням денних агрегатів) + checkpoint файлу, якщо передано.
+    Повертає кількість реально вставлених рядків (решта — дублі).
+    """
+    await ensure_partitions_for(conn, (r[1] for r in rows))
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            async with cur.copy(COPY_SQL) as copy:
+                copy.set_types(["uuid", "timestamptz", "text", "text", "jsonb"])
+                for r in rows:
+                    await copy.write_row(r)
+            await cur.execute(MERGE_SQL)
+            per_day = await cur.fetchall()
+            if per_day:
+                # NOTIFY піде разом з комітом батчу — API скине кеш /stats за ці дні
+                await publish_invalidation(cur, [r["day"] for r in per_day])
+            if checkpoint is not None:
+                await cur.execute(CHECKPOINT_SQL, checkpoint)
+            return sum(r["inserted"] for r in per_day)
+
 @app.command("import_events")
 def import_events(
     src: str = typer.Argument(..., help="Файл/папка/URL. Напр.: /workspace/events.csv або /workspace/data *.csv або https://..."),
     idempotency_key: Optional[str] = typer.Option(None, "--idempotency-key", "-k", help="Захист від повторного імпорту"),
     batch_size: int = typer.Option(1000, "--batch-size", "-b"),
     glob_pattern: Optional[str] = typer.Option(None, "--glob", help="маска для папки, напр. *.csv"),
+    workers: int = typer.Option(1, "--workers", "-w", min=1, max=64, help="скільки файлів імпортувати паралельно (кожен — своє з'єднання)"),
+    restart: bool = typer.Option(False, "--restart", help="ігнорувати checkpoint-и і читати файли з початку"),
+    writers: int = typer.Option(1, "--writers", min=1, max=16, help="скільки паралельних COPY-з'єднань на один файл"),
+    parse_procs: int = typer.Option(0, "--parse-procs", min=0, max=64, help="процеси для парсингу CSV (0 — у треді поруч з event loop)"),
+    queue_depth: int = typer.Option(4, "--queue-depth", min=1, max=256, help="скільки розпарсених батчів може чекати на запис"),
 ):
     """
     Підтримує:
       - локальний файл у контейнері: /workspace/events_sample.csv
       - папку + маску: /workspace/data --glob '*.csv'
       - URL: https://example.com/events.csv
+
+    Прогрес кожного файлу (sha256 + зсув) комітиться разом з батчем: перезапуск
+    перерваного імпорту пропускає вже завершені файли і продовжує перерваний з останнього
+    checkpoint-у. Успішний запуск checkpoint-и прибирає — "лише один раз" дає --idempotency-key.
+
+    Парсинг і запис у БД йдуть конвеєром: поки один батч пишеться COPY-ем,
+    наступні вже читаються й парсяться (--parse-procs, --writers, --queue-depth).
     """
-    import asyncio
-    asyncio.run(_run_import(src, idempotency_key, batch_size, glob_pattern))
+    asyncio.run(
+        _run_import(
+            src, idempotency_key, batch_size, glob_pattern, workers, restart,
+            writers=writers, parse_procs=parse_procs, queue_depth=queue_depth,
+        )
+    )
 
-async def _run_import(src: str, idempotency_key: Optional[str], batch_size: int, glob_pattern: Optional[str]):
+async def _run_import(
+    src: str,
+    idempotency_key: Optional[str],
+    batch_size: int,
+    glob_pattern: Optional[str],
+    workers: int = 1,
+    restart: bool = False,
+    writers: int = 1,
+    parse_procs: int = 0,
+    queue_depth: int = 4,
+):
     conn = await get_conn()
     async with conn.cursor() as cur:
         # перевірка idempotency_key: якщо вже імпортовано — виходимо
@@ -84,73 +179,432 @@ async def _run_import(src: str, idempotency_key: Optional[str], batch_size: int,
                 typer.secho(f"[OK] idempotency_key '{idempotency_key}' already imported. skipping.", fg=typer.colors.GREEN)
                 return
 
-        total_inserted = 0
-        total_duplicates = 0
-
-        sql = """
-            INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
-            VALUES (%(event_id)s, %(occurred_at)s, %(user_id)s, %(event_type)s, %(properties)s)
-            ON CONFLICT (event_id) DO NOTHING;
-        """
-
-        for path in _iter_input_paths(src, glob_pattern):
-            if not path.exists():
-                typer.secho(f"[WARN] skip, not found: {path}", fg=typer.colors.YELLOW)
-                continue
-            checksum = sha256_file(path)
-            typer.echo(f"[INFO] reading: {path} (sha256={checksum[:12]}...)")
-
-            inserted = 0
-            duplicates = 0
-            buf: List[Dict[str, Any]] = []
-
-            async def flush():
-                nonlocal inserted, duplicates
-                for e in buf:
-                    await cur.execute(sql, e)
-                    if cur.rowcount and cur.rowcount > 0:
-                        inserted += 1
-                    else:
-                        duplicates += 1
-                buf.clear()
-
-            with path.open("r", encoding="utf-8", newline="") as f:
-                reader = csv.DictReader(f)
-                required = {"event_id", "occurred_at", "user_id", "event_type", "properties_json"}
-                if not reader.fieldnames or not required.issubset(set(reader.fieldnames)):
-                    raise RuntimeError(f"CSV missing columns; required: {', '.join(sorted(required))}")
-
-                for row in reader:
-                    try:
-                        event_id = UUID(row["event_id"])
-                        occurred_at = datetime.fromisoformat(row["occurred_at"])
-                        user_id = str(row["user_id"])
-                        event_type = str(row["event_type"])
-                        props = json.loads(row["properties_json"] or "{}")
-                    except Exception as e:
-                        raise RuntimeError(f"Bad row parse: {e}; row={row}") from e
-
-                    buf.append({
-                        "event_id": event_id,
-                        "occurred_at": occurred_at,
-                        "user_id": user_id,
-                        "event_type": event_type,
-                        "properties": Json(props),
-                    })
-                    if len(buf) >= batch_size:
-                        await flush()
-
-                if buf:
-                    await flush()
-
-            total_inserted += inserted
-            total_duplicates += duplicates
-            typer.secho(f"[DONE] file={path.name} inserted={inserted}, duplicates={duplicates}", fg=typer.colors.GREEN)
+    paths: List[Path] = []
+    for path in _iter_input_paths(src, glob_pattern):
+        if not path.exists():
+            typer.secho(f"[WARN] skip, not found: {path}", fg=typer.colors.YELLOW)
+            continue
+        paths.append(path)
+
+    started = time.perf_counter()
+    # один пул процесів на весь імпорт — спільний для всіх файлів і воркерів
+    executor = ProcessPoolExecutor(max_workers=parse_procs) if parse_procs > 0 else None
+    opts = _Pipeline(
+        batch_size=batch_size, restart=restart, writers=writers,
+        queue_depth=queue_depth, parse_procs=parse_procs, executor=executor,
+    )
+    try:
+        if workers <= 1 or len(paths) <= 1:
+            results = [await _import_file(conn, path, opts) for path in paths]
+        else:
+            results = await _import_parallel(paths, opts, workers)
+    finally:
+        if executor is not None:
+            # shutdown чекає, доки процеси парсера доживуть поточні чанки, — не блокуємо цим event loop
+            await asyncio.to_thread(executor.shutdown, cancel_futures=True)
+
+    total_inserted = sum(r[0] for r in results)
+    total_duplicates = sum(r[1] for r in results)
+    checksums = sorted(r[2] for r in results)
+    if len(checksums) == 1:
+        batch_checksum = checksums[0]
+    else:
+        # кілька файлів — sha256 від відсортованих sha256 файлів
+        batch_checksum = hashlib.sha256("\n".join(checksums).encode()).hexdigest()
 
+    async with conn.transaction(), conn.cursor() as cur:
+        # ключ фіксуємо лише коли всі файли успішно імпортовані
         if idempotency_key:
             await cur.execute(
                 "INSERT INTO batch_uploads (idempotency_key, file_checksum) VALUES (%(k)s, %(c)s) ON CONFLICT (idempotency_key) DO NOTHING;",
-                {"k": idempotency_key, "c": "multi"},  # якщо було кілька файлів, checksum ставимо умовним
+                {"k": idempotency_key, "c": batch_checksum},
             )
+        # checkpoint-и — лише для resume цього запуску: інакше файл, чиї рядки потім видалили
+        # (purge, detach_partitions), мовчки пропускався б при повторному імпорті
+        await cur.execute("DELETE FROM import_checkpoints WHERE file_sha256 = ANY(%(s)s);", {"s": checksums})
+
+    elapsed = time.perf_counter() - started
+    typer.secho(
+        f"[TOTAL] inserted={total_inserted}, duplicates={total_duplicates} "
+        f"files={len(paths)} elapsed={elapsed:.1f}s",
+        fg=typer.colors.CYAN,
+    )
+
+async def _import_parallel(
+    paths: List[Path], opts: "_Pipeline", workers: int
+) -> List[Tuple[int, int, str]]:
+    """N воркерів, у кожного своє з'єднання; файли роздаються з черги по одному."""
+    queue: "asyncio.Queue[Path]" = asyncio.Queue()
+    for p in paths:
+        queue.put_nowait(p)
+    results: List[Tuple[int, int, str]] = []
+
+    async def worker(n: int):
+        wconn = await connect()
+        try:
+            while True:
+                try:
+                    path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await _import_file(wconn, path, opts, prefix=f"[w{n}] "))
+        finally:
+            await wconn.close()
+
+    # перша ж помилка скасовує решту воркерів; ключ ідемпотентності тоді не записується
+    async with asyncio.TaskGroup() as tg:
+        for n in range(min(workers, len(paths))):
+            tg.create_task(worker(n))
+    return results
+
+REQUIRED_COLUMNS = {"event_id", "occurred_at", "user_id", "event_type", "properties_json"}
+
+def _iter_csv_rows(f: BinaryIO, start_offset: int) -> Iterator[Tuple[Dict[str, str], int]]:
+    """
+    Рядки CSV разом зі зсувом у байтах одразу після кожного запису.
+    Заголовок завжди читається з початку файлу; якщо start_offset більший —
+    далі читання йде з нього (resume).
+    """
+    offset = 0
+
+    def lines() -> Iterator[str]:
+        nonlocal offset
+        while True:
+            raw = f.readline()
+            if not raw:
+                return
+            offset += len(raw)
+            yield raw.decode("utf-8")
+
+    src = lines()
+    header = next(csv.reader(src), None)
+    if not header or not REQUIRED_COLUMNS.issubset(set(header)):
+        raise RuntimeError(f"CSV missing columns; required: {', '.join(sorted(REQUIRED_COLUMNS))}")
+    if start_offset > offset:
+        f.seek(start_offset)
+        offset = start_offset
+
+    # csv.reader тягне рівно стільки рядків, скільки потрібно для одного запису
+    for row in csv.DictReader(src, fieldnames=header):
+        yield row, offset
+
+async def _load_checkpoint(conn: psycopg.AsyncConnection, checksum: str) -> Optional[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(
+            "SELECT rows_committed, byte_offset, completed FROM import_checkpoints WHERE file_sha256 = %(sha)s;",
+            {"sha": checksum},
+        )
+        return await cur.fetchone()
+
+def _parse_rows(rows: List[Dict[str, str]]) -> List[Tuple[Any, ...]]:
+    """CSV-рядки -> кортежі для COPY. Верхньорівнева функція, щоб працювала в ProcessPoolExecutor."""
+    out: List[Tuple[Any, ...]] = []
+    for row in rows:
+        try:
+            event_id = UUID(row["event_id"])
+            occurred_at = datetime.fromisoformat(row["occurred_at"])
+            if occurred_at.tzinfo is None:
+                # як і в POST /events: "naive" дата — це UTC
+                occurred_at = occurred_at.replace(tzinfo=timezone.utc)
+            user_id = str(row["user_id"])
+            event_type = str(row["event_type"])
+            props = json.loads(row["properties_json"] or "{}")
+        except Exception as e:
+            raise RuntimeError(f"Bad row parse: {e}; row={row}") from e
+        out.append((event_id, occurred_at, user_id, event_type, props))
+    return out
+
+def _parse_timed(rows: List[Dict[str, str]]) -> Tuple[List[Tuple[Any, ...]], float]:
+    """_parse_rows + власний час парсингу (у процесі парсера, без черги executor-а)."""
+    started = time.perf_counter()
+    out = _parse_rows(rows)
+    return out, time.perf_counter() - started
+
+def _take(rows: Iterator[Tuple[Dict[str, str], int]], n: int, offset: int) -> Tuple[List[Dict[str, str]], int]:
+    """Наступні n сирих рядків і зсув після останнього з них."""
+    chunk: List[Dict[str, str]] = []
+    for row, offset in rows:
+        chunk.append(row)
+        if len(chunk) >= n:
+            break
+    return chunk, offset
+
+@dataclass
+class _Pipeline:
+    """Налаштування конвеєра parse -> queue -> writers для одного файлу."""
+    batch_size: int
+    restart: bool = False
+    writers: int = 1
+    queue_depth: int = 4
+    parse_procs: int = 0
+    executor: Optional[ProcessPoolExecutor] = None  # None — парсинг у треді
+
+class _Progress:
+    """
+    Checkpoint = найдовший неперервний префікс закомічених батчів.
+    Батчі можуть комітитись не по порядку (кілька writer-ів), тож зсув
+    у checkpoint-і ніколи не випереджає дані, що вже в БД.
+    """
+
+    def __init__(self, rows: int, offset: int) -> None:
+        self.rows = rows
+        self.offset = offset
+        self._next = 0
+        self._done: Dict[int, Tuple[int, int]] = {}
+
+    def _advance(self, done: Dict[int, Tuple[int, int]]) -> Tuple[int, int, int]:
+        rows, offset, k = self.rows, self.offset, self._next
+        while k in done:
+            n, offset = done[k]
+            rows += n
+            k += 1
+        return rows, offset, k
+
+    def if_committed(self, seq: int, n: int, offset: int) -> Tuple[int, int]:
+        """(rows, offset) для checkpoint-у, що пишеться в одній транзакції з батчем seq."""
+        rows, off, _ = self._advance({**self._done, seq: (n, offset)})
+        return rows, off
+
+    def commit(self, seq: int, n: int, offset: int) -> None:
+        self._done[seq] = (n, offset)
+        self.rows, self.offset, k = self._advance(self._done)
+        for i in range(self._next, k):
+            del self._done[i]
+        self._next = k
+
+async def _import_file(
+    conn: psycopg.AsyncConnection, path: Path, opts: _Pipeline, prefix: str = ""
+) -> Tuple[int, int, str]:
+    """
+    Імпорт одного CSV. Повертає (inserted, duplicates, sha256).
+
+    Читання+парсинг (producer) і запис у БД (writers) працюють паралельно через
+    обмежену чергу: пам'ять не залежить від розміру файлу, а швидкість тягнеться
+    до повільнішої зі стадій, а не до їх суми.
+    """
+    checksum = sha256_file(path)
+    if opts.restart:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM import_checkpoints WHERE file_sha256 = %(sha)s;", {"sha": checksum})
+        cp = None
+    else:
+        cp = await _load_checkpoint(conn, checksum)
+    if cp and cp["completed"]:
+        typer.secho(
+            f"{prefix}[SKIP] file={path.name} already imported by the interrupted run being resumed "
+            f"(sha256={checksum[:12]}...); pass --restart to read it again",
+            fg=typer.colors.GREEN,
+        )
+        return 0, 0, checksum
+
+    rows_before = cp["rows_committed"] if cp else 0
+    start_offset = cp["byte_offset"] if cp else 0
+    if rows_before:
+        typer.echo(f"{prefix}[INFO] resuming: {path} from row {rows_before} (byte {start_offset})")
+    else:
+        typer.echo(f"{prefix}[INFO] reading: {path} (sha256={checksum[:12]}...)")
+    started = time.perf_counter()
 
-        typer.secho(f"[TOTAL] inserted={total_inserted}, duplicates={total_duplicates}", fg=typer.colors.CYAN)
+    progress = _Progress(rows_before, start_offset)
+    queue: "asyncio.Queue[Optional[Tuple[int, List[Tuple[Any, ...]], int]]]" = asyncio.Queue(maxsize=opts.queue_depth)
+    inserted = 0
+    duplicates = 0
+    # сумарний час стадій; вони йдуть паралельно, тож найбільша — вузьке місце, а не сума
+    stages = {"decode": 0.0, "validate": 0.0, "db_write": 0.0}
+
+    def stage(name: str, seconds: float) -> None:
+        stages[name] += seconds
+        INGEST_STAGE.labels("cli", name).observe(seconds)
+
+    async def parsed(fut: "asyncio.Future[Tuple[List[Tuple[Any, ...]], float]]") -> List[Tuple[Any, ...]]:
+        batch, seconds = await fut
+        stage("validate", seconds)
+        return batch
+
+    def checkpoint(rows: int, offset: int, completed: bool = False) -> Dict[str, Any]:
+        return {"sha": checksum, "path": str(path), "rows": rows, "offset": offset, "completed": completed}
+
+    async def produce():
+        loop = asyncio.get_running_loop()
+        # одночасно в роботі стільки чанків, скільки процесів парсингу (мінімум один)
+        window = max(1, opts.parse_procs)
+        pending: Deque[Tuple[int, "asyncio.Future[Tuple[List[Tuple[Any, ...]], float]]", int]] = deque()
+        with path.open("rb") as f:
+            rows = _iter_csv_rows(f, start_offset)
+            offset = start_offset
+            seq = 0
+            while True:
+                # читання CSV теж у треді — event loop лишається вільним для writer-ів
+                started = time.perf_counter()
+                chunk, offset = await asyncio.to_thread(_take, rows, opts.batch_size, offset)
+                if not chunk:
+                    break
+                stage("decode", time.perf_counter() - started)
+                if opts.executor is not None:
+                    fut = loop.run_in_executor(opts.executor, _parse_timed, chunk)
+                else:
+                    fut = asyncio.ensure_future(asyncio.to_thread(_parse_timed, chunk))
+                pending.append((seq, fut, offset))
+                seq += 1
+                if len(pending) >= window:
+                    s_, fut_, off_ = pending.popleft()
+                    await queue.put((s_, await parsed(fut_), off_))
+            while pending:
+                s_, fut_, off_ = pending.popleft()
+                await queue.put((s_, await parsed(fut_), off_))
+        for _ in range(opts.writers):
+            await queue.put(None)
+
+    async def write(wconn: psycopg.AsyncConnection):
+        nonlocal inserted, duplicates
+        # staging-таблиця живе в межах сесії; рядки зникають після коміту кожного батчу
+        async with wconn.cursor() as cur:
+            await cur.execute(STAGE_DDL)
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            seq, batch, offset = item
+            rows, off = progress.if_committed(seq, len(batch), offset)
+            started = time.perf_counter()
+            n = await _copy_merge(wconn, batch, checkpoint(rows, off))
+            stage("db_write", time.perf_counter() - started)
+            progress.commit(seq, len(batch), offset)
+            inserted += n
+            duplicates += len(batch) - n
+
+    extra: List[psycopg.AsyncConnection] = []
+    try:
+        for _ in range(opts.writers - 1):
+            extra.append(await connect())
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            for wconn in [conn, *extra]:
+                tg.create_task(write(wconn))
+    except BaseExceptionGroup as eg:
+        # назовні — перша справжня помилка (bad row, обрив з'єднання), а не ExceptionGroup
+        raise eg.exceptions[0] from None
+    finally:
+        for c in extra:
+            await c.close()
+
+    # усі батчі закомічені — позначаємо файл завершеним
+    async with conn.cursor() as cur:
+        await cur.execute(CHECKPOINT_SQL, checkpoint(progress.rows, progress.offset, completed=True))
+
+    elapsed = time.perf_counter() - started
+    rate = (inserted + duplicates) / elapsed if elapsed > 0 else 0.0
+    typer.secho(
+        f"{prefix}[DONE] file={path.name} inserted={inserted}, duplicates={duplicates} "
+        f"({elapsed:.1f}s, {rate:.0f} rows/s; read {stages['decode']:.1f}s, "
+        f"parse {stages['validate']:.1f}s, db {stages['db_write']:.1f}s)",
+        fg=typer.colors.GREEN,
+    )
+    return inserted, duplicates, checksum
+
+
+@app.command("rebuild_rollups")
+def rebuild_rollups_cmd(
+    from_: Optional[datetime] = typer.Option(None, "--from", formats=["%Y-%m-%d"], help="перший день (включно)"),
+    to_: Optional[datetime] = typer.Option(None, "--to", formats=["%Y-%m-%d"], help="останній день (включно)"),
+):
+    """
+    Перераховує денні агрегати (DAU, top-events) з сирих events.
+    Без --from/--to — уся історія.
+    """
+    asyncio.run(_run_rebuild(from_.date() if from_ else None, to_.date() if to_ else None))
+
+async def _run_rebuild(from_: Optional[date], to_: Optional[date]):
+    conn = await get_conn()
+    await rebuild_rollups(conn, from_, to_)
+    async with conn.cursor() as cur:
+        days = None
+        if from_ and to_:
+            days = [from_ + timedelta(days=i) for i in range((to_ - from_).days + 1)]
+        await publish_invalidation(cur, days)
+    typer.secho(f"[OK] rollups rebuilt for {from_ or '-inf'}..{to_ or '+inf'}", fg=typer.colors.GREEN)
+
+
+@app.command("partition_events")
+def partition_events_cmd():
+    """
+    Одноразова міграція: звичайна таблиця events -> партиціонована по occurred_at
+    (інтервал з EVENTS_PARTITION_INTERVAL). Бере ACCESS EXCLUSIVE lock на час копіювання.
+    """
+    asyncio.run(_run_partition())
+
+async def _run_partition():
+    conn = await get_conn()
+    moved = await migrate_to_partitioned(conn)
+    typer.secho(f"[OK] events partitioned, rows moved={moved}; old table kept as events_unpartitioned", fg=typer.colors.GREEN)
+    if moved:
+        # нова таблиця — без promoted-колонок; додаємо їх, дані — через promote_properties
+        await ensure_promoted(conn)
+        typer.echo("[INFO] run `promote_properties` to backfill promoted property columns")
+
+@app.command("detach_partitions")
+def detach_partitions_cmd(
+    before: datetime = typer.Option(..., "--before", formats=["%Y-%m-%d"], help="від'єднати партиції, що закінчуються до цієї дати"),
+    drop: bool = typer.Option(False, "--drop", help="одразу видалити від'єднані партиції"),
+):
+    """Дешево прибирає старі дані з events: DETACH PARTITION без переписування рядків."""
+    asyncio.run(_run_detach(before.date(), drop))
+
+async def _run_detach(before: date, drop: bool):
+    conn = await get_conn()
+    names = await detach_partitions_before(conn, before, drop)
+    if names:
+        async with conn.cursor() as cur:
+            await publish_invalidation(cur, None)
+    typer.secho(f"[OK] detached: {', '.join(names) or '-'}", fg=typer.colors.GREEN)
+
+@app.command("promote_properties")
+def promote_properties_cmd(
+    keys: Optional[List[str]] = typer.Argument(None, help="ключі з PROMOTED_PROPERTIES (за замовчуванням — усі)"),
+    days_per_batch: int = typer.Option(7, "--days-per-batch", min=1, help="скільки днів events оновлювати однією транзакцією"),
+):
+    """
+    Створює колонки для PROMOTED_PROPERTIES і заповнює їх для вже наявних рядків.
+    Після цього сегменти properties.<key> ідуть у колонку з btree-індексом
+    (API підхоплює це на наступному старті).
+    """
+    asyncio.run(_run_promote(keys or None, days_per_batch))
+
+async def _run_promote(keys: Optional[List[str]], days_per_batch: int):
+    conn = await get_conn()
+    await ensure_promoted(conn)
+    try:
+        updated = await backfill_promoted(conn, keys, days_per_batch)
+    except ValueError as e:
+        typer.secho(f"[ERROR] {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    summary = ", ".join(f"{k}={n}" for k, n in updated.items()) or "-"
+    typer.secho(f"[OK] promoted properties backfilled: {summary}", fg=typer.colors.GREEN)
+
+@app.command("archive_events")
+def archive_events_cmd(
+    before: datetime = typer.Option(..., "--before", formats=["%Y-%m-%d"], help="архівувати дні, що закінчились до цієї дати"),
+    purge: bool = typer.Option(False, "--purge", help="після архівації видалити ці дні з events"),
+):
+    """
+    Переносить закриті дні events у Parquet (COLD_STORAGE_DIR/events/day=...).
+    /stats/dau і /stats/top-events із сегментом читають їх через DuckDB.
+    """
+    asyncio.run(_run_archive(before.date(), purge))
+
+async def _run_archive(before: date, purge: bool):
+    if not cold.enabled():
+        typer.secho("[ERROR] COLD_STORAGE_DIR is not set", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    if before > datetime.now(timezone.utc).date():
+        typer.secho("[ERROR] --before is in the future: only closed days can be archived", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    conn = await get_conn()
+    try:
+        done = await cold.archive_before(conn, before, purge)
+    except cold.ColdStorageError as e:
+        typer.secho(f"[ERROR] {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    for day, rows, purged in done:
+        typer.echo(f"[{'PURGED' if purged else 'ARCHIVED'}] {day} rows={rows}")
+    typer.secho(f"[OK] {len(done)} day(s) before {before}", fg=typer.colors.GREEN)
@@ -0,0 +1,283 @@
+"""
+Холодний шар: закриті дні events у Parquet на локальному диску (COLD_STORAGE_DIR).
+
+    <dir>/events/day=YYYY-MM-DD/events.parquet
+
+Реєстр — таблиця cold_days: день там з'являється лише після того, як файл повністю
+записано й звірено кількість рядків, тож будь-який день обслуговує рівно один шар:
+дні з cold_days читає DuckDB з Parquet, решту — Postgres. Після --purge рядки дня
+видаляються з events; денні агрегати (rollups) лишаються й більше не перераховуються.
+
+Інгест не забороняє пізні події в уже архівовані дні. Такий день видно з розбіжності
+cold_days.rows із daily_event_counts: поки його не видалено з events, він читається
+з Postgres (там повні дані); наступний archive_events переписує Parquet, а для вже
+видаленого дня — дописує пізні рядки до файлу й видаляє їх з events.
+
+Залежності опційні (requirements-cold.txt): pyarrow — запис, duckdb — запити.
+"""
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg
+import structlog
+
+from ..shared.segment import compile_segment_duckdb, parse_segment
+from ..shared.settings import settings
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - опційна залежність
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - опційна залежність
+    pa = pq = None
+
+log = structlog.get_logger()
+
+FETCH_SIZE = 50_000
+
+# архівовані дні, де агрегати бачать інші кількості подій, ніж у Parquet (пізні події)
+DRIFTED_SQL = """
+SELECT c.day, c.rows, c.purged
+FROM cold_days c
+LEFT JOIN (SELECT day, SUM(events) AS events FROM daily_event_counts GROUP BY day) r ON r.day = c.day
+WHERE c.day < %(before)s AND c.rows <> COALESCE(r.events, 0)
+ORDER BY c.day;
+"""
+
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS cold_days (
+        day         DATE PRIMARY KEY,
+        rows        BIGINT NOT NULL,
+        path        TEXT NOT NULL,
+        purged      BOOLEAN NOT NULL DEFAULT false,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+]
+
+
+class ColdStorageError(RuntimeError):
+    """Холодний шар налаштовано, але ним не скористатись (немає залежностей, файлу тощо)."""
+
+
+def enabled() -> bool:
+    return bool(settings.cold_storage_dir)
+
+
+def _root() -> Path:
+    if not enabled():
+        raise ColdStorageError("COLD_STORAGE_DIR is not set")
+    return Path(settings.cold_storage_dir)
+
+
+def _schema() -> "pa.Schema":
+    return pa.schema([
+        ("event_id", pa.string()),
+        ("occurred_at", pa.timestamp("us", tz="UTC")),
+        ("user_id", pa.string()),
+        ("event_type", pa.string()),
+        ("properties", pa.string()),  # JSON-текст
+    ])
+
+
+def _day_bounds(day: date) -> Dict[str, datetime]:
+    lo = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return {"lo": lo, "hi": lo + timedelta(days=1)}
+
+
+# ---------- архівація ----------
+
+async def archive_day(conn: psycopg.AsyncConnection, day: date, merge: bool = False) -> int:
+    """
+    Пише день у Parquet (через тимчасовий файл) і реєструє в cold_days. Повертає кількість рядків.
+    merge=True — день уже видалено з events: наявний файл + пізні рядки з Postgres.
+    """
+    if pq is None:
+        raise ColdStorageError("pyarrow is not installed (pip install -r requirements-cold.txt)")
+    rel = Path("events") / f"day={day.isoformat()}" / "events.parquet"
+    path = _root() / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+
+    schema = _schema()
+    archived = pq.read_table(path, schema=schema) if merge else None
+    rows = archived.num_rows if archived is not None else 0
+    # REPEATABLE READ: файл і лічильник бачать один і той самий знімок
+    async with conn.transaction():
+        await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        async with conn.cursor(name="cold_archive") as cur:
+            await cur.execute(
+                """
+                SELECT event_id::text AS event_id, occurred_at, user_id, event_type, properties::text AS properties
+                FROM events
+                WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s
+                ORDER BY occurred_at;
+                """,
+                _day_bounds(day),
+            )
+            with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+                if archived is not None:
+                    writer.write_table(archived)
+                while batch := await cur.fetchmany(FETCH_SIZE):
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    rows += len(batch)
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT COUNT(*) AS n FROM events WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s;",
+                _day_bounds(day),
+            )
+            expected = (await cur.fetchone())["n"] + (archived.num_rows if archived is not None else 0)
+    if rows != expected or pq.ParquetFile(tmp).metadata.num_rows != rows:
+        tmp.unlink(missing_ok=True)
+        raise ColdStorageError(f"{day}: wrote {rows} rows, expected {expected}")
+    os.replace(tmp, path)
+
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            INSERT INTO cold_days (day, rows, path) VALUES (%(day)s, %(rows)s, %(path)s)
+            ON CONFLICT (day) DO UPDATE SET rows = EXCLUDED.rows, path = EXCLUDED.path, archived_at = now();
+            """,
+            {"day": day, "rows": rows, "path": rel.as_posix()},
+        )
+    log.info("cold_day_archived", day=str(day), rows=rows)
+    return rows
+
+
+async def purge_day(conn: psycopg.AsyncConnection, day: date, expected: Optional[int] = None) -> int:
+    """
+    Видаляє рядки дня з events, якщо Parquet на місці й кількість рядків збігається.
+    expected — скільки рядків дня має лишатись в events (за замовчуванням — усі архівовані).
+    """
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT rows, path FROM cold_days WHERE day = %(day)s;", {"day": day})
+        entry = await cur.fetchone()
+    if entry is None:
+        raise ColdStorageError(f"{day} is not archived")
+    path = _root() / entry["path"]
+    if pq is not None and (not path.exists() or pq.ParquetFile(path).metadata.num_rows != entry["rows"]):
+        raise ColdStorageError(f"{day}: {path} is missing or incomplete, refusing to purge")
+
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute(
+            "DELETE FROM events WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s;", _day_bounds(day)
+        )
+        deleted = cur.rowcount
+        expected = entry["rows"] if expected is None else expected
+        if deleted != expected:
+            # після архівації в день дописали події — відкат, день треба переархівувати
+            raise ColdStorageError(f"{day}: {deleted} rows in events, {expected} expected; re-archive first")
+        await cur.execute("UPDATE cold_days SET purged = true WHERE day = %(day)s;", {"day": day})
+    log.info("cold_day_purged", day=str(day), rows=deleted)
+    return deleted
+
+
+async def archive_before(
+    conn: psycopg.AsyncConnection, before: date, purge: bool = False
+) -> List[Tuple[date, int, bool]]:
+    """
+    Архівує всі ще не архівовані дні < before (список днів — з daily_dau, без скану events)
+    і переархівовує дні з пізніми подіями (розбіжність з daily_event_counts);
+    з purge=True видаляє з Postgres усі архівовані, ще не видалені дні < before.
+    Пізні рядки вже видалених днів дописуються до Parquet і видаляються завжди.
+    Повертає (day, rows, purged) для кожного обробленого дня.
+    """
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT r.day FROM daily_dau r
+            WHERE r.day < %(before)s AND NOT EXISTS (SELECT 1 FROM cold_days c WHERE c.day = r.day)
+            ORDER BY r.day;
+            """,
+            {"before": before},
+        )
+        pending = [r["day"] for r in await cur.fetchall()]
+
+        await cur.execute(DRIFTED_SQL, {"before": before})
+        drifted = await cur.fetchall()
+
+    done: Dict[date, Tuple[int, bool]] = {}
+    for day in pending:
+        done[day] = (await archive_day(conn, day), False)
+    for d in drifted:
+        if not d["purged"]:
+            done[d["day"]] = (await archive_day(conn, d["day"]), False)
+            continue
+        # день уже видалено: дописуємо пізні рядки до файлу й прибираємо їх з events
+        total = await archive_day(conn, d["day"], merge=True)
+        if total != d["rows"]:
+            await purge_day(conn, d["day"], expected=total - d["rows"])
+            done[d["day"]] = (total, True)
+        log.info("cold_day_rearchived", day=str(d["day"]), rows=total, was=d["rows"])
+
+    if purge:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT day FROM cold_days WHERE day < %(before)s AND NOT purged ORDER BY day;", {"before": before}
+            )
+            for r in await cur.fetchall():
+                done[r["day"]] = (await purge_day(conn, r["day"]), True)
+    return [(d, n, p) for d, (n, p) in sorted(done.items())]
+
+
+# ---------- запити ----------
+
+async def days_between(conn: psycopg.AsyncConnection, from_: date, to_: date) -> Dict[date, str]:
+    """
+    Архівовані дні діапазону -> шлях до Parquet (порожньо, якщо шар вимкнено).
+    Не видалений день з пізніми подіями (Parquet відстав від агрегатів) лишається за Postgres.
+    """
+    if not enabled():
+        return {}
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT c.day, c.path FROM cold_days c
+            WHERE c.day BETWEEN %(from)s AND %(to)s
+              AND (c.purged OR c.rows = (SELECT COALESCE(SUM(r.events), 0) FROM daily_event_counts r WHERE r.day = c.day))
+            ORDER BY c.day;
+            """,
+            {"from": from_, "to": to_},
+        )
+        return {r["day"]: r["path"] for r in await cur.fetchall()}
+
+
+def _source(files: Dict[date, str]) -> str:
+    root = _root()
+    paths = ", ".join("'" + str(root / p).replace("'", "''") + "'" for p in files.values())
+    return f"read_parquet([{paths}], hive_partitioning = true, hive_types = {{'day': DATE}})"
+
+
+def _query(sql: str, params: Dict[str, Any]) -> List[Tuple[Any, ...]]:
+    con = duckdb.connect()
+    try:
+        return con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+
+async def _run(files: Dict[date, str], select: str, segment: Optional[str]) -> List[Tuple[Any, ...]]:
+    if duckdb is None:
+        raise ColdStorageError("duckdb is not installed (pip install -r requirements-cold.txt)")
+    seg_sql, params = compile_segment_duckdb(parse_segment(segment))
+    sql = select.format(source=_source(files), seg_sql=f"WHERE {seg_sql}" if seg_sql else "")
+    # DuckDB синхронний і сам паралелить скан — у потоці, щоб не блокувати event loop
+    return await asyncio.to_thread(_query, sql, params)
+
+
+async def dau(files: Dict[date, str], segment: Optional[str]) -> Dict[date, int]:
+    rows = await _run(files, "SELECT day, COUNT(DISTINCT user_id) FROM {source} {seg_sql} GROUP BY day", segment)
+    return {d: n for d, n in rows}
+
+
+async def event_counts(files: Dict[date, str], segment: Optional[str]) -> Dict[str, int]:
+    rows = await _run(files, "SELECT event_type, COUNT(*) FROM {source} {seg_sql} GROUP BY event_type", segment)
+    return {t: n for t, n in rows}
@@ -1,36 +1,291 @@
 import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
 import structlog
 
+from ..shared.cache import read_from_primary
 from ..shared.settings import settings
+from . import cold, partitions, promoted, rollups
 
 log = structlog.get_logger()
 
 _conn: psycopg.AsyncConnection | None = None
+_pool: AsyncConnectionPool | None = None
+_read_pool: AsyncConnectionPool | None = None
+_read_down_until = 0.0  # monotonic: до цього моменту читання йдуть на primary
+_read_in_use = 0  # з'єднання read-пулу, видані цим процесом
 
 
-async def get_conn() -> psycopg.AsyncConnection:
-    """Return a singleton async connection with retry on startup."""
-    global _conn
-    if _conn and not _conn.closed:
-        return _conn
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["pool"],  # "primary", "read"
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+class _PoolCollector:
+    """db_pool_connections{pool, state} — знімок статистики пулів у момент scrape."""
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "db_pool_connections", "Pooled connections by state", labels=["pool", "state"]
+        )
+        for name, pool in (("primary", _pool), ("read", _read_pool)):
+            if pool is None or pool.closed:
+                continue
+            stats = pool.get_stats()
+            family.add_metric([name, "in_use"], stats["pool_size"] - stats["pool_available"])
+            family.add_metric([name, "idle"], stats["pool_available"])
+            family.add_metric([name, "waiting"], stats.get("requests_waiting", 0))
+            family.add_metric([name, "max"], stats["pool_max"])
+        yield family
+
+
+REGISTRY.register(_PoolCollector())
+
 
-    dsn_kwargs = dict(
+def _conninfo(dsn: str = "") -> str:
+    """Primary (DATABASE_WRITE_URL або POSTGRES_*) чи заданий DSN — завжди з TimeZone=UTC."""
+    # дні в агрегатах і фільтрах (occurred_at::date) завжди рахуються в UTC
+    dsn = dsn or settings.db_write_dsn
+    if dsn:
+        return make_conninfo(dsn, options="-c TimeZone=UTC")
+    return make_conninfo(
         host=settings.db_host,
         port=settings.db_port,
         user=settings.db_user,
         password=settings.db_password,
         dbname=settings.db_name,
+        options="-c TimeZone=UTC",
     )
 
+
+async def connect() -> psycopg.AsyncConnection:
+    """Open a new dedicated connection (not pooled, no retry); caller closes it."""
+    return await psycopg.AsyncConnection.connect(_conninfo(), autocommit=True, row_factory=dict_row)
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """
+    Return the process-wide pool, opening it on first use.
+
+    Connections are health-checked on checkout and recycled after
+    ``db_pool_max_idle`` seconds of inactivity.
+    """
+    global _pool
+    if _pool is not None and not _pool.closed:
+        return _pool
+
+    _pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=settings.db_pool_min,
+        max_size=settings.db_pool_max,
+        kwargs={"autocommit": True, "row_factory": dict_row},
+        check=AsyncConnectionPool.check_connection,
+        timeout=settings.db_pool_timeout,
+        max_idle=settings.db_pool_max_idle,
+        name="events",
+        open=False,
+    )
+    log.info("db_pool_opening", min=settings.db_pool_min, max=settings.db_pool_max)
+    await _pool.open(wait=True, timeout=30.0)
+    log.info("db_pool_opened")
+    return _pool
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Acquire a pooled connection for the duration of the block.
+
+    Waits at most ``db_pool_timeout`` seconds; raises ``psycopg_pool.PoolTimeout``
+    when the pool is exhausted for longer than that.
+    """
+    pool = await get_pool()
+    started = time.perf_counter()
+    conn = await pool.getconn(timeout=settings.db_pool_timeout)
+    POOL_WAIT.labels("primary").observe(time.perf_counter() - started)
+    try:
+        async with conn:  # як pool.connection(): commit/rollback на виході
+            yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+# ---------- read side (DATABASE_READ_URL) ----------
+
+READ_FALLBACK = Counter(
+    "db_read_fallback_total",
+    "Read queries sent to the primary instead of the read DSN",
+    ["reason"],  # "unavailable", "stale", "invalidated"
+)
+
+# Лаг репліки в секундах; 0 — primary або репліка, що програла все отримане
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END::float8 AS lag;
+"""
+
+
+async def get_read_pool() -> AsyncConnectionPool | None:
+    """
+    Pool for DATABASE_READ_URL, or None when reads share the primary.
+
+    Opened without waiting: an unreachable replica surfaces as a checkout
+    timeout (``db_read_timeout``), not as a startup failure.
+    """
+    global _read_pool
+    if not settings.db_read_dsn:
+        return None
+    if _read_pool is not None and not _read_pool.closed:
+        return _read_pool
+    _read_pool = AsyncConnectionPool(
+        _conninfo(settings.db_read_dsn),
+        min_size=settings.db_pool_min,
+        max_size=settings.db_read_pool_max,
+        kwargs={"autocommit": True, "row_factory": dict_row},
+        check=AsyncConnectionPool.check_connection,
+        timeout=settings.db_read_timeout,
+        max_idle=settings.db_pool_max_idle,
+        name="events-read",
+        open=False,
+    )
+    await _read_pool.open(wait=False)
+    log.info("db_read_pool_opened", max=settings.db_read_pool_max)
+    return _read_pool
+
+
+async def _replica_lag(conn: psycopg.AsyncConnection) -> float:
+    async with conn.cursor() as cur:
+        await cur.execute(REPLICA_LAG_SQL)
+        return (await cur.fetchone())["lag"]
+
+
+@asynccontextmanager
+async def read_connection(max_staleness: float | None = None) -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Connection for read-only queries: the read DSN if configured and healthy, else the primary.
+
+    A replica that cannot be reached (or a connection error inside the block) sends
+    reads to the primary for ``db_read_failover`` seconds. A reachable but saturated
+    read pool is not an outage: the checkout waits up to ``db_pool_timeout`` and then
+    raises ``PoolTimeout`` (503), so dashboard load never spills onto the primary.
+    With ``max_staleness`` (default
+    ``db_read_max_staleness``; 0 disables the check) a replica lagging by more than
+    that many seconds is skipped for this query only. A stats recompute right after
+    the cache dropped its days (``read_from_primary``) also reads the primary.
+    """
+    global _read_down_until
+    max_staleness = settings.db_read_max_staleness if max_staleness is None else max_staleness
+    if settings.db_read_dsn and read_from_primary.get():
+        READ_FALLBACK.labels("invalidated").inc()
+        async with connection() as conn:
+            yield conn
+        return
+    pool = await get_read_pool() if time.monotonic() >= _read_down_until else None
+    if pool is None:
+        if settings.db_read_dsn:
+            READ_FALLBACK.labels("unavailable").inc()
+        async with connection() as conn:
+            yield conn
+        return
+
+    conn = None
+    try:
+        conn = await _read_getconn(pool)
+        if max_staleness > 0 and (lag := await _replica_lag(conn)) > max_staleness:
+            READ_FALLBACK.labels("stale").inc()
+            log.info("db_read_replica_stale", lag=round(lag, 3), max_staleness=max_staleness)
+            await _read_putconn(pool, conn)
+            conn = None
+    except PoolTimeout:
+        # насичений read-пул (PoolTimeout — теж OperationalError, але репліка жива)
+        raise
+    except (psycopg.OperationalError, _ReplicaUnreachable) as e:
+        _read_down_until = time.monotonic() + settings.db_read_failover
+        READ_FALLBACK.labels("unavailable").inc()
+        log.warning("db_read_unavailable", error=str(e), retry_in=settings.db_read_failover)
+        if conn is not None:
+            await _read_putconn(pool, conn)
+        conn = None
+
+    if conn is None:
+        async with connection() as primary:
+            yield primary
+        return
+
+    try:
+        yield conn
+    except psycopg.OperationalError:
+        # лише обрив з'єднання, а не statement_timeout чи скасування запиту;
+        # запит уже почався на репліці — повторити його тут не можна, але наступні підуть на primary
+        if conn.broken:
+            _read_down_until = time.monotonic() + settings.db_read_failover
+            log.warning("db_read_failed_midquery", retry_in=settings.db_read_failover)
+        raise
+    finally:
+        await _read_putconn(pool, conn)
+
+
+class _ReplicaUnreachable(Exception):
+    """Read-пул не видав жодного з'єднання: репліка лежить або недосяжна."""
+
+
+async def _read_getconn(pool: AsyncConnectionPool) -> psycopg.AsyncConnection:
+    global _read_in_use
+    started = time.perf_counter()
+    try:
+        conn = await pool.getconn(timeout=settings.db_read_timeout)
+    except PoolTimeout as e:
+        if not _read_in_use:
+            # жодне з'єднання не видане — пул не може підключитись
+            raise _ReplicaUnreachable(str(e)) from e
+        # репліка жива, але всі з'єднання зайняті: чекаємо далі, потім PoolTimeout -> 503
+        log.info("db_read_pool_saturated", in_use=_read_in_use)
+        conn = await pool.getconn(timeout=max(settings.db_pool_timeout - settings.db_read_timeout, 0.0))
+    POOL_WAIT.labels("read").observe(time.perf_counter() - started)
+    _read_in_use += 1
+    return conn
+
+
+async def _read_putconn(pool: AsyncConnectionPool, conn: psycopg.AsyncConnection) -> None:
+    global _read_in_use
+    _read_in_use -= 1
+    await pool.putconn(conn)
+
+
+async def get_conn() -> psycopg.AsyncConnection:
+    """
+    Return a singleton async connection with retry on startup.
+
+    Used by the CLI and tests; request handlers go through ``connection()``.
+    """
+    global _conn
+    if _conn and not _conn.closed:
+        return _conn
+
+    conninfo = _conninfo()
+    dsn_kwargs = {k: v for k, v in conninfo_to_dict(conninfo).items() if k in ("host", "port", "dbname", "user")}
+
     # retry connect ~30s total
     attempts, delay = 30, 1.0
     for i in range(1, attempts + 1):
         try:
             log.info("db_connecting", attempt=i, **dsn_kwargs)
             _conn = await psycopg.AsyncConnection.connect(
-                **dsn_kwargs,
+                conninfo,
                 autocommit=True,
                 row_factory=dict_row,
             )
@@ -49,24 +304,17 @@ async def ensure_migrations() -> None:
     """
     Create tables & indexes idempotently (safe to call on every startup).
     """
-    conn = await get_conn()
-
+    interval = settings.events_partition_interval
     stmts = [
-        # --- Base events table ---
-        """
-        CREATE TABLE IF NOT EXISTS events (
-            event_id    UUID PRIMARY KEY,
-            occurred_at TIMESTAMPTZ NOT NULL,
-            user_id     TEXT NOT NULL,
-            event_type  TEXT NOT NULL,
-            properties  JSONB NOT NULL DEFAULT '{}'::jsonb
-        );
-        """,
+        # --- Base events table (optionally RANGE-partitioned by occurred_at) ---
+        partitions.events_ddl(interval),
         # --- Indexes ---
-        "CREATE INDEX IF NOT EXISTS idx_events_occurred_at     ON events (occurred_at);",
-        "CREATE INDEX IF NOT EXISTS idx_events_type_time       ON events (event_type, occurred_at);",
-        "CREATE INDEX IF NOT EXISTS idx_events_user_time       ON events (user_id, occurred_at);",
-        "CREATE INDEX IF NOT EXISTS idx_events_props_gin       ON events USING GIN (properties jsonb_path_ops);",
+        *partitions.EVENTS_INDEXES,
+
+        # --- Catch-all partition: вставка ніколи не падає через відсутню партицію ---
+        *(["CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;"] if interval != "none" else []),
+        # --- Global event_id uniqueness for the partitioned table ---
+        partitions.EVENT_IDS_DDL,
 
         # --- Batch idempotency registry (for CSV import) ---
         """
@@ -76,9 +324,36 @@ async def ensure_migrations() -> None:
             inserted_at     TIMESTAMPTZ NOT NULL DEFAULT now()
         );
         """,
+        # --- Per-file import progress (resumable CSV import) ---
+        """
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            file_sha256    TEXT PRIMARY KEY,
+            path           TEXT NOT NULL,
+            rows_committed BIGINT NOT NULL DEFAULT 0,
+            byte_offset    BIGINT NOT NULL DEFAULT 0,
+            completed      BOOLEAN NOT NULL DEFAULT false,
+            updated_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+
+        # --- Daily rollups for /stats ---
+        *rollups.MIGRATIONS,
+        # --- Registry of promoted property columns ---
+        *promoted.MIGRATIONS,
+        # --- Days archived to the Parquet cold tier ---
+        *cold.MIGRATIONS,
+        # --- Shared rate limit buckets (RATE_LIMIT_BACKEND=postgres) ---
+        """
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+            key        TEXT PRIMARY KEY,
+            tokens     DOUBLE PRECISION NOT NULL,
+            allowed    BOOLEAN NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL
+        );
+        """,
     ]
 
-    async with conn.cursor() as cur:
+    async with connection() as conn, conn.cursor() as cur:
         for sql in stmts:
             try:
                 await cur.execute(sql)
@@ -90,10 +365,49 @@ async def ensure_migrations() -> None:
                 )
         log.info("migrations_applied")
 
+        try:
+            await promoted.ensure_promoted(conn)
+        except Exception as e:
+            log.warning("promoted_properties_failed", error=str(e))
+
+        if await partitions.is_partitioned(conn):
+            await partitions.ensure_event_id_registry(conn)
+
+        if interval != "none":
+            if await partitions.is_partitioned(conn):
+                await partitions.ensure_upcoming_partitions(conn)
+            else:
+                log.warning(
+                    "events_not_partitioned",
+                    hint="run `python -m app.cli partition_events` to migrate the existing table",
+                )
+
 
 async def shutdown() -> None:
-    """Close the global connection if open."""
-    global _conn
+    """
+    Drain the pool and close the global connection if open.
+
+    Checked-out connections get up to ``db_pool_drain_timeout`` seconds to be
+    returned before the pool is closed.
+    """
+    global _conn, _pool, _read_pool, _read_down_until, _read_in_use
+    if _read_pool is not None and not _read_pool.closed:
+        await _read_pool.close(timeout=settings.db_pool_drain_timeout)
+        _read_pool = None
+        _read_down_until = 0.0
+        _read_in_use = 0
+    if _pool is not None and not _pool.closed:
+        deadline = time.monotonic() + settings.db_pool_drain_timeout
+        while time.monotonic() < deadline:
+            stats = _pool.get_stats()
+            if stats.get("pool_size", 0) <= stats.get("pool_available", 0):
+                break
+            await asyncio.sleep(0.05)
+        else:
+            log.warning("db_pool_drain_timeout", **_pool.get_stats())
+        await _pool.close(timeout=settings.db_pool_drain_timeout)
+        _pool = None
+        log.info("db_pool_closed")
     if _conn and not _conn.closed:
         await _conn.close()
         _conn = None
\ No newline at end of file
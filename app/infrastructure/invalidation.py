@@ -0,0 +1,65 @@
+import asyncio
+import json
+from datetime import date
+from typing import Iterable, Optional
+
+import psycopg
+import structlog
+
+from ..shared.cache import stats_cache
+from .db import connect
+
+log = structlog.get_logger()
+
+CHANNEL = "stats_invalidate"
+_MAX_PAYLOAD = 7900  # ліміт NOTIFY — 8000 байт
+
+
+async def publish_invalidation(cur: psycopg.AsyncCursor, days: Optional[Iterable[date]]) -> None:
+    """
+    Повідомити всі процеси API, що дані за `days` змінились (None — усі дні).
+
+    Всередині транзакції NOTIFY доставляється лише після коміту. Локальний кеш
+    (цей процес) чиститься одразу.
+    """
+    day_list = None if days is None else sorted(set(days))
+    payload = "*" if day_list is None else json.dumps([d.isoformat() for d in day_list])
+    if len(payload) > _MAX_PAYLOAD:
+        payload = "*"
+    await cur.execute("SELECT pg_notify(%(ch)s, %(p)s);", {"ch": CHANNEL, "p": payload})
+    stats_cache.invalidate_days(day_list)
+
+
+def _apply(payload: str) -> None:
+    if payload == "*":
+        stats_cache.invalidate_days(None)
+        return
+    try:
+        days = [date.fromisoformat(d) for d in json.loads(payload)]
+    except (ValueError, TypeError):
+        log.warning("stats_invalidate_bad_payload", payload=payload[:200])
+        stats_cache.invalidate_days(None)
+        return
+    stats_cache.invalidate_days(days)
+
+
+async def listen_invalidations() -> None:
+    """LISTEN на окремому з'єднанні; після обриву — перепідключення і повне скидання кешу."""
+    delay = 1.0
+    while True:
+        try:
+            conn = await connect()
+            async with conn:
+                await conn.execute(f"LISTEN {CHANNEL};")
+                # поки не слухали, могли пропустити повідомлення
+                stats_cache.invalidate_days(None)
+                log.info("stats_invalidation_listening")
+                delay = 1.0
+                async for n in conn.notifies():
+                    _apply(n.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("stats_invalidation_listener_failed", error=str(e))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
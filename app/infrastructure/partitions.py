@@ -0,0 +1,336 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+
+import psycopg
+import structlog
+
+from ..shared.settings import settings
+
+log = structlog.get_logger()
+
+EVENTS_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_events_occurred_at     ON events (occurred_at);",
+    "CREATE INDEX IF NOT EXISTS idx_events_type_time       ON events (event_type, occurred_at);",
+    "CREATE INDEX IF NOT EXISTS idx_events_user_time       ON events (user_id, occurred_at);",
+    "CREATE INDEX IF NOT EXISTS idx_events_props_gin       ON events USING GIN (properties jsonb_path_ops);",
+]
+
+# PK партиціонованої таблиці — (event_id, occurred_at), тож глобальну унікальність event_id
+# тримає реєстр: BEFORE INSERT тригер пропускає рядок, чий event_id уже є (навіть з іншим
+# occurred_at) — так само, як ON CONFLICT DO NOTHING, тож SQL інгесту в API і CLI не змінюється.
+# Як і унікальний індекс, реєстр містить лише id рядків, що є в events: DELETE (purge) звільняє
+# їх statement-тригером, detach_partitions — явно перед DETACH.
+EVENT_IDS_DDL = """
+CREATE TABLE IF NOT EXISTS event_ids (
+    event_id UUID PRIMARY KEY
+);
+"""
+
+_DEDUPE_FUNCTION = """
+CREATE OR REPLACE FUNCTION events_dedupe_event_id() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO event_ids (event_id) VALUES (NEW.event_id) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END
+$$;
+"""
+
+_DEDUPE_TRIGGER = """
+CREATE TRIGGER events_dedupe_event_id
+BEFORE INSERT ON events
+FOR EACH ROW EXECUTE FUNCTION events_dedupe_event_id();
+"""
+
+# statement-рівень не клонується на партиції: перенесення рядків з events_default
+# у нову партицію (_create_partition) id не звільняє
+_FORGET_FUNCTION = """
+CREATE OR REPLACE FUNCTION events_forget_event_ids() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM event_ids e USING gone g WHERE e.event_id = g.event_id;
+    RETURN NULL;
+END
+$$;
+"""
+
+_FORGET_TRIGGER = """
+CREATE TRIGGER events_forget_event_ids
+AFTER DELETE ON events
+REFERENCING OLD TABLE AS gone
+FOR EACH STATEMENT EXECUTE FUNCTION events_forget_event_ids();
+"""
+
+# нижні межі партицій, які вже точно існують (щоб не ходити в каталог на кожен батч)
+_known: Set[date] = set()
+
+
+def events_ddl(interval: str) -> str:
+    """DDL базової таблиці events: звичайна heap-таблиця або RANGE-партиціонована по occurred_at."""
+    if interval == "none":
+        return """
+        CREATE TABLE IF NOT EXISTS events (
+            event_id    UUID PRIMARY KEY,
+            occurred_at TIMESTAMPTZ NOT NULL,
+            user_id     TEXT NOT NULL,
+            event_type  TEXT NOT NULL,
+            properties  JSONB NOT NULL DEFAULT '{}'::jsonb
+        );
+        """
+    # ключ партиціювання має входити в PK; унікальність самого event_id — див. EVENT_IDS_DDL
+    return """
+    CREATE TABLE IF NOT EXISTS events (
+        event_id    UUID NOT NULL,
+        occurred_at TIMESTAMPTZ NOT NULL,
+        user_id     TEXT NOT NULL,
+        event_type  TEXT NOT NULL,
+        properties  JSONB NOT NULL DEFAULT '{}'::jsonb,
+        PRIMARY KEY (event_id, occurred_at)
+    ) PARTITION BY RANGE (occurred_at);
+    """
+
+
+def _plus_days(day: date, n: int) -> date:
+    # верхня межа останньої можливої партиції — date.max, а не OverflowError
+    return day + timedelta(days=n) if date.max - day >= timedelta(days=n) else date.max
+
+
+def partition_bounds(day: date, interval: str) -> Tuple[date, date]:
+    """[lo, hi) партиції, в яку потрапляє day (hi обрізається до date.max)."""
+    if interval == "day":
+        return day, _plus_days(day, 1)
+    if interval == "week":
+        lo = day - timedelta(days=day.weekday())
+        return lo, _plus_days(lo, 7)
+    if interval == "month":
+        lo = day.replace(day=1)
+        if lo.year == date.max.year and lo.month == 12:
+            return lo, date.max
+        hi = date(lo.year + lo.month // 12, lo.month % 12 + 1, 1)
+        return lo, hi
+    raise ValueError(f"unknown partition interval: {interval}")
+
+
+def partition_name(lo: date) -> str:
+    return f"events_p{lo:%Y%m%d}"
+
+
+def partitions_between(from_: date, to_: date, interval: str) -> List[Tuple[date, date]]:
+    """Усі партиції, що покривають дні [from_, to_]."""
+    out: List[Tuple[date, date]] = []
+    lo, hi = partition_bounds(from_, interval)
+    while lo <= to_:
+        out.append((lo, hi))
+        if hi == date.max:
+            break
+        lo, hi = partition_bounds(hi, interval)
+    return out
+
+
+def in_partition_window(day: date, today: Optional[date] = None) -> bool:
+    """
+    Чи заводити для дня власну партицію. Дні поза вікном
+    [сьогодні - EVENTS_PARTITION_PAST_DAYS, сьогодні + EVENTS_PARTITION_FUTURE_DAYS]
+    (0001-01-01, 9999-12-31 тощо) лягають у events_default.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    return (today - day).days <= settings.events_partition_past_days and (
+        (day - today).days <= settings.events_partition_future_days
+    )
+
+
+async def is_partitioned(conn: psycopg.AsyncConnection) -> bool:
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('events');")
+        row = await cur.fetchone()
+    return bool(row) and row["relkind"] == "p"
+
+
+async def ensure_event_id_registry(conn: psycopg.AsyncConnection) -> None:
+    """
+    Тригер унікальності event_id на партиціонованій events (ідемпотентно, на старті).
+    Перший запуск заповнює event_ids з наявних рядків — у тій самій транзакції, що й
+    CREATE TRIGGER, тож паралельний інгест чекає й нічого не проскакує.
+    """
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT tgname FROM pg_trigger
+            WHERE tgrelid = 'events'::regclass AND tgparentid = 0
+              AND tgname IN ('events_dedupe_event_id', 'events_forget_event_ids');
+            """
+        )
+        present = {r["tgname"] for r in await cur.fetchall()}
+        if "events_forget_event_ids" not in present:
+            await cur.execute(_FORGET_FUNCTION)
+            await cur.execute(_FORGET_TRIGGER)
+        if "events_dedupe_event_id" in present:
+            return
+        await cur.execute(_DEDUPE_FUNCTION)
+        await cur.execute(_DEDUPE_TRIGGER)
+        await cur.execute("INSERT INTO event_ids (event_id) SELECT event_id FROM events ON CONFLICT DO NOTHING;")
+        log.info("event_id_registry_created", ids=max(cur.rowcount, 0))
+
+
+async def _create_partition(conn: psycopg.AsyncConnection, lo: date, hi: date) -> None:
+    name = partition_name(lo)
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute("SELECT to_regclass(%(n)s) IS NOT NULL AS present;", {"n": name})
+        if (await cur.fetchone())["present"]:
+            return
+        await cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM events_default WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s) AS stray;",
+            {"lo": lo, "hi": hi},
+        )
+        if not (await cur.fetchone())["stray"]:
+            await cur.execute(
+                f"CREATE TABLE {name} PARTITION OF events FOR VALUES FROM ('{lo}') TO ('{hi}');"
+            )
+        else:
+            # рядки цього діапазону вже лежать у default — переносимо їх і лише потім приєднуємо
+            await cur.execute(f"CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+            await cur.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM events_default
+                    WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved;
+                """,
+                {"lo": lo, "hi": hi},
+            )
+            await cur.execute(f"ALTER TABLE events ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}');")
+    log.info("partition_created", name=name, lo=str(lo), hi=str(hi))
+
+
+async def ensure_partitions(conn: psycopg.AsyncConnection, from_: date, to_: date) -> None:
+    """Idempotently create partitions covering [from_, to_]; no-op for an unpartitioned table."""
+    interval = settings.events_partition_interval
+    if interval == "none" or not await is_partitioned(conn):
+        return
+    for lo, hi in partitions_between(from_, to_, interval):
+        if lo in _known:
+            continue
+        try:
+            await _create_partition(conn, lo, hi)
+        except psycopg.errors.DuplicateTable:
+            pass  # паралельний воркер встиг першим
+        _known.add(lo)
+
+
+async def ensure_partitions_for(conn: psycopg.AsyncConnection, timestamps: Iterable[datetime]) -> None:
+    """Create partitions for every day touched by an ingest batch (cached, cheap when they exist)."""
+    interval = settings.events_partition_interval
+    if interval == "none":
+        return
+    # дні рахуються в UTC, як і в сесії Postgres
+    today = datetime.now(timezone.utc).date()
+    days = {ts.astimezone(timezone.utc).date() for ts in timestamps}
+    lows = {partition_bounds(d, interval)[0] for d in days if in_partition_window(d, today)}
+    # лише відсутні партиції, а не весь діапазон між найранішою й найпізнішою подією батчу
+    for lo in sorted(lows - _known):
+        await ensure_partitions(conn, lo, lo)
+
+
+async def ensure_upcoming_partitions(conn: psycopg.AsyncConnection) -> None:
+    """Partitions from the current one to ``events_partitions_ahead`` intervals ahead."""
+    interval = settings.events_partition_interval
+    if interval == "none":
+        return
+    today = datetime.now(timezone.utc).date()
+    lo, hi = partition_bounds(today, interval)
+    last = lo
+    for _ in range(settings.events_partitions_ahead):
+        last, hi = partition_bounds(hi, interval)
+    await ensure_partitions(conn, today, last)
+
+
+async def migrate_to_partitioned(conn: psycopg.AsyncConnection) -> int:
+    """
+    Перебудовує існуючу heap-таблицю events у партиціоновану (одна транзакція).
+    Стара таблиця лишається як events_unpartitioned для ручної перевірки й видалення.
+    Повертає кількість перенесених рядків.
+    """
+    interval = settings.events_partition_interval
+    if interval == "none":
+        raise RuntimeError("EVENTS_PARTITION_INTERVAL is 'none'; nothing to migrate to")
+    if await is_partitioned(conn):
+        return 0
+
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute("LOCK TABLE events IN ACCESS EXCLUSIVE MODE;")
+        await cur.execute("ALTER TABLE events RENAME TO events_unpartitioned;")
+        # індекси мігрують з таблицею — звільняємо імена для нових
+        for idx in ("idx_events_occurred_at", "idx_events_type_time", "idx_events_user_time", "idx_events_props_gin"):
+            await cur.execute(f"ALTER INDEX IF EXISTS {idx} RENAME TO {idx}_unpartitioned;")
+        await cur.execute("ALTER TABLE events_unpartitioned RENAME CONSTRAINT events_pkey TO events_unpartitioned_pkey;")
+        await cur.execute(events_ddl(interval))
+        await cur.execute("CREATE TABLE events_default PARTITION OF events DEFAULT;")
+        # реєстр заповнить сам тригер під час перенесення нижче
+        for sql in (_DEDUPE_FUNCTION, _DEDUPE_TRIGGER, _FORGET_FUNCTION, _FORGET_TRIGGER):
+            await cur.execute(sql)
+        await cur.execute("SELECT MIN(occurred_at)::date AS lo, MAX(occurred_at)::date AS hi FROM events_unpartitioned;")
+        bounds = await cur.fetchone()
+        if bounds["lo"] is not None:
+            for lo, hi in partitions_between(bounds["lo"], bounds["hi"], interval):
+                await cur.execute(
+                    f"CREATE TABLE {partition_name(lo)} PARTITION OF events FOR VALUES FROM ('{lo}') TO ('{hi}');"
+                )
+        await cur.execute(
+            """
+            INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
+            SELECT event_id, occurred_at, user_id, event_type, properties FROM events_unpartitioned;
+            """
+        )
+        moved = max(cur.rowcount, 0)
+        for sql in EVENTS_INDEXES:
+            await cur.execute(sql)
+    _known.clear()
+    log.info("events_partitioned", interval=interval, rows=moved)
+    return moved
+
+
+async def detach_partitions_before(
+    conn: psycopg.AsyncConnection, before: date, drop: bool = False
+) -> List[str]:
+    """
+    Від'єднує партиції, що повністю лежать до `before` (дешево: без переписування даних).
+    З drop=True — ще й видаляє їх.
+    """
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT c.relname AS name,
+                   pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'events'::regclass
+            ORDER BY c.relname;
+            """
+        )
+        parts = await cur.fetchall()
+
+    detached: List[str] = []
+    for p in parts:
+        hi = _upper_bound(p["bound"])
+        if hi is None or hi > before:
+            continue
+        async with conn.transaction(), conn.cursor() as cur:
+            # рядки йдуть з events — їхні id знову вільні (як і з унікальним індексом)
+            await cur.execute(f"DELETE FROM event_ids e USING {p['name']} p WHERE e.event_id = p.event_id;")
+            await cur.execute(f"ALTER TABLE events DETACH PARTITION {p['name']};")
+            if drop:
+                await cur.execute(f"DROP TABLE {p['name']};")
+        _known.clear()
+        detached.append(p["name"])
+        log.info("partition_detached", name=p["name"], dropped=drop)
+    return detached
+
+
+def _upper_bound(bound: str) -> Optional[date]:
+    # "FOR VALUES FROM ('2025-08-01 00:00:00+00') TO ('2025-09-01 00:00:00+00')" або "DEFAULT"
+    if " TO ('" not in bound:
+        return None
+    return date.fromisoformat(bound.split(" TO ('", 1)[1][:10])
@@ -0,0 +1,294 @@
+"""
+"Підняті" (promoted) ключі properties: типізовані колонки events.prop_<key>
+з btree (prop_<key>, occurred_at), щоб гарячі сегменти не розбирали JSONB на кожному рядку.
+
+Вимкнено за замовчуванням (PROMOTED_PROPERTIES порожній). Колонки заповнює BEFORE INSERT
+тригер (тож SQL інгесту в API і CLI не залежить від конфігу); старт лише додає нові колонки
+й перевизначає тригер, коли його визначення змінилось. Старі рядки й індекси
+(CREATE INDEX CONCURRENTLY) — команда `python -m app.cli promote_properties`; сегменти
+маршрутизуються в колонку лише після неї (promoted_properties.ready).
+
+ready скидається, щойно тригер перестає заповнювати колонку (ключ прибрали з конфігу)
+або заповнює її інакше, ніж раніше: рядки за цей час у колонці NULL, тож до повторного
+бекфілу сегменти йдуть через JSONB.
+"""
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import psycopg
+import structlog
+
+from ..shared import segment
+from ..shared.settings import settings
+
+log = structlog.get_logger()
+
+TYPES = ("text", "numeric", "boolean")
+
+# у колонку потрапляє лише значення відповідного JSON-типу — як і в @> (рядок "5" не число 5)
+_JSON_TYPES = {"text": "string", "numeric": "number", "boolean": "boolean"}
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_]{1,40}$")
+
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS promoted_properties (
+        key        TEXT PRIMARY KEY,
+        type       TEXT NOT NULL,
+        ready      BOOLEAN NOT NULL DEFAULT false,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+]
+
+
+def parse_spec(spec: str) -> Dict[str, str]:
+    """"country:text,price:numeric" -> {"country": "text", "price": "numeric"}."""
+    out: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, type_ = item.partition(":")
+        key, type_ = key.strip(), (type_.strip() or "text").lower()
+        if not _KEY_RE.match(key):
+            raise ValueError(f"invalid promoted property key: {key!r}")
+        if type_ not in TYPES:
+            raise ValueError(f"promoted property {key!r}: type must be one of {', '.join(TYPES)}")
+        out[key] = type_
+    return out
+
+
+def column_name(key: str) -> str:
+    return f'"prop_{key}"'
+
+
+def value_expr(key: str, type_: str, src: str = "properties") -> str:
+    """Значення колонки з JSONB; значення іншого JSON-типу -> NULL (інгест ніколи не падає на касті)."""
+    cast = "" if type_ == "text" else f"::{type_}"
+    return f"(CASE WHEN jsonb_typeof({src} -> '{key}') = '{_JSON_TYPES[type_]}' THEN ({src} ->> '{key}'){cast} END)"
+
+
+def index_name(key: str) -> str:
+    return f"idx_events_prop_{key}_time"
+
+
+def _assignment(key: str, type_: str) -> str:
+    return f"\n    NEW.{column_name(key)} := {value_expr(key, type_, 'NEW.properties')};"
+
+
+def _function_body(maintained: Dict[str, str]) -> str:
+    assigns = "".join(_assignment(k, t) for k, t in maintained.items())
+    return f"\nBEGIN{assigns}\n    RETURN NEW;\nEND\n"
+
+
+def configured() -> Dict[str, str]:
+    try:
+        return parse_spec(settings.promoted_properties)
+    except ValueError as e:
+        log.warning("promoted_properties_invalid", error=str(e))
+        return {}
+
+
+async def _column_types(cur: psycopg.AsyncCursor) -> Dict[str, str]:
+    await cur.execute(
+        """
+        SELECT attname AS name, format_type(atttypid, atttypmod) AS type
+        FROM pg_attribute
+        WHERE attrelid = 'events'::regclass AND attnum > 0 AND NOT attisdropped
+          AND left(attname, 5) = 'prop_';
+        """
+    )
+    return {r["name"][len("prop_"):]: r["type"] for r in await cur.fetchall()}
+
+
+async def ensure_promoted(conn: psycopg.AsyncConnection) -> None:
+    """
+    Колонки й тригер для ключів з PROMOTED_PROPERTIES (ідемпотентно, викликається на старті).
+
+    Без змін у конфігу нічого не блокує: тригер чіпаємо лише тоді, коли його немає
+    або тіло функції відрізняється. Нова колонка — ready=false, доки
+    `promote_properties` не заповнить її й не збудує індекс; так само колонка,
+    яку тригер досі не заповнював (чи заповнював іншим виразом).
+    """
+    wanted = configured()
+    async with conn.transaction(), conn.cursor() as cur:
+        existing = await _column_types(cur)
+        await cur.execute(
+            """
+            SELECT (SELECT prosrc FROM pg_proc WHERE oid = to_regproc('events_promoted_properties')) AS body,
+                   EXISTS (SELECT 1 FROM pg_trigger
+                           WHERE tgrelid = 'events'::regclass AND tgname = 'events_promoted_properties'
+                             AND tgparentid = 0) AS has_trigger;
+            """
+        )
+        state = await cur.fetchone()
+        # тіло функції, яке досі реально виконувалось на INSERT
+        current_body = state["body"] if state["has_trigger"] else None
+
+        maintained: Dict[str, str] = {}
+        for key, type_ in wanted.items():
+            if key in existing and existing[key] != type_:
+                log.warning("promoted_property_type_mismatch", key=key, column=existing[key], configured=type_)
+                continue
+            if key not in existing:
+                # без DEFAULT — лише зміна каталогу, таблиця не переписується
+                await cur.execute(f"ALTER TABLE events ADD COLUMN {column_name(key)} {type_};")
+                log.info("promoted_property_added", key=key, type=type_)
+            kept = key in existing and current_body is not None and _assignment(key, type_) in current_body
+            await cur.execute(
+                """
+                INSERT INTO promoted_properties (key, type) VALUES (%(k)s, %(t)s)
+                ON CONFLICT (key) DO UPDATE SET type = EXCLUDED.type, ready = false, updated_at = now()
+                WHERE NOT %(kept)s OR promoted_properties.type <> EXCLUDED.type;
+                """,
+                {"k": key, "t": type_, "kept": kept},
+            )
+            maintained[key] = type_
+
+        # тригер більше не заповнює ці колонки — нові рядки матимуть NULL
+        await cur.execute(
+            """
+            UPDATE promoted_properties SET ready = false, updated_at = now()
+            WHERE ready AND NOT (key = ANY(%(keys)s))
+            RETURNING key;
+            """,
+            {"keys": list(maintained)},
+        )
+        for r in await cur.fetchall():
+            log.info("promoted_property_unmaintained", key=r["key"])
+
+        if not maintained:
+            if state["has_trigger"]:
+                await cur.execute("DROP TRIGGER events_promoted_properties ON events;")
+                log.info("promoted_properties_trigger_dropped")
+        else:
+            body = _function_body(maintained)
+            if state["body"] != body:
+                # заміна функції не блокує events — нове тіло підхоплять наступні INSERT
+                await cur.execute(
+                    f"CREATE OR REPLACE FUNCTION events_promoted_properties() RETURNS trigger "
+                    f"LANGUAGE plpgsql AS $${body}$$;"
+                )
+                log.info("promoted_properties_trigger_updated", keys=list(maintained))
+            if not state["has_trigger"]:
+                await cur.execute(
+                    """
+                    CREATE TRIGGER events_promoted_properties
+                    BEFORE INSERT ON events
+                    FOR EACH ROW EXECUTE FUNCTION events_promoted_properties();
+                    """
+                )
+    await load_promoted(conn)
+
+
+async def ensure_indexes(conn: psycopg.AsyncConnection, keys: List[str]) -> None:
+    """
+    btree (prop_<key>, occurred_at) без блокування інгесту: CREATE INDEX CONCURRENTLY
+    (потрібне autocommit-з'єднання). На партиціонованій таблиці — невалідний індекс
+    ON ONLY events + CONCURRENTLY на кожній партиції + ATTACH; нові партиції отримують
+    індекс автоматично.
+    """
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = 'events'::regclass;")
+        partitioned = (await cur.fetchone())["partitioned"]
+        for key in keys:
+            name, cols = index_name(key), f"({column_name(key)}, occurred_at)"
+            if not partitioned:
+                await _drop_if_invalid(cur, name)
+                await cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON events {cols};')
+                continue
+            await cur.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON ONLY events {cols};')
+            # партиції, де ще немає індексу, приєднаного до батьківського
+            await cur.execute(
+                """
+                SELECT c.relname AS part FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'events'::regclass
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_inherits ii JOIN pg_index x ON x.indexrelid = ii.inhrelid
+                      WHERE ii.inhparent = to_regclass(%(idx)s) AND x.indrelid = c.oid
+                  )
+                ORDER BY c.relname;
+                """,
+                {"idx": f'"{name}"'},
+            )
+            for r in await cur.fetchall():
+                part_idx = f"{r['part']}_prop_{key}_idx"[:63]
+                await _drop_if_invalid(cur, part_idx)
+                await cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{part_idx}" ON {r["part"]} {cols};')
+                await cur.execute(f'ALTER INDEX "{name}" ATTACH PARTITION "{part_idx}";')
+            log.info("promoted_property_indexed", key=key)
+
+
+async def _drop_if_invalid(cur: psycopg.AsyncCursor, name: str) -> None:
+    # залишок перерваного CONCURRENTLY: IF NOT EXISTS його б пропустив
+    await cur.execute(
+        "SELECT NOT indisvalid AS invalid FROM pg_index WHERE indexrelid = to_regclass(%(n)s);", {"n": f'"{name}"'}
+    )
+    row = await cur.fetchone()
+    if row and row["invalid"]:
+        await cur.execute(f'DROP INDEX CONCURRENTLY "{name}";')
+
+
+async def load_promoted(conn: psycopg.AsyncConnection) -> Dict[str, str]:
+    """Готові (забекфілені) колонки, що є в конфігу, -> маршрутизація сегментів."""
+    wanted = configured()
+    async with conn.cursor() as cur:
+        existing = await _column_types(cur)
+        await cur.execute("SELECT key, type FROM promoted_properties WHERE ready;")
+        ready = {r["key"]: r["type"] for r in await cur.fetchall()}
+    active = {
+        k: t for k, t in wanted.items()
+        if ready.get(k) == t and existing.get(k) == t
+    }
+    segment.set_promoted_columns(active)
+    return active
+
+
+async def backfill(
+    conn: psycopg.AsyncConnection,
+    keys: Optional[List[str]] = None,
+    days_per_batch: int = 7,
+) -> Dict[str, int]:
+    """
+    Заповнює колонки для вже наявних рядків батчами по days_per_batch днів
+    (окрема транзакція на батч — без довгих блокувань), будує індекс і позначає ready.
+    """
+    wanted = configured()
+    keys = keys or list(wanted)
+    unknown = [k for k in keys if k not in wanted]
+    if unknown:
+        raise ValueError(f"not in PROMOTED_PROPERTIES: {', '.join(unknown)}")
+
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT MIN(occurred_at)::date AS lo, MAX(occurred_at)::date AS hi FROM events;")
+        bounds = await cur.fetchone()
+
+    updated: Dict[str, int] = {}
+    for key in keys:
+        col, expr = column_name(key), value_expr(key, wanted[key])
+        updated[key] = 0
+        day = bounds["lo"]
+        while day is not None and day <= bounds["hi"]:
+            end: date = day + timedelta(days=days_per_batch)
+            async with conn.transaction(), conn.cursor() as cur:
+                await cur.execute(
+                    f"""
+                    UPDATE events SET {col} = {expr}
+                    WHERE occurred_at >= %(lo)s AND occurred_at < %(hi)s
+                      AND {col} IS DISTINCT FROM {expr};
+                    """,
+                    {"lo": day, "hi": end},
+                )
+                updated[key] += max(cur.rowcount, 0)
+            day = end
+        await ensure_indexes(conn, [key])
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE promoted_properties SET ready = true, updated_at = now() WHERE key = %(k)s;",
+                {"k": key},
+            )
+        log.info("promoted_property_backfilled", key=key, rows=updated[key])
+    await load_promoted(conn)
+    return updated
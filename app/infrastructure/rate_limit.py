@@ -0,0 +1,79 @@
+"""
+Спільні між процесами бакети rate limit-у (RATE_LIMIT_BACKEND=postgres).
+
+Один атомарний UPSERT на запит: поповнення, перевірка й списання виконуються
+під рядковим локом, тож кілька воркерів uvicorn бачать той самий баланс.
+Таблиця UNLOGGED — втрата бакетів після краху Postgres означає лише "всі повні".
+"""
+import time
+
+import structlog
+
+from .db import connection
+
+log = structlog.get_logger()
+
+# tokens, поповнені на момент now (не вище capacity)
+_AVAILABLE = (
+    "LEAST(%(cap)s, b.tokens + EXTRACT(EPOCH FROM (clock_timestamp() - b.updated_at)) * %(rate)s)"
+)
+
+TAKE_SQL = f"""
+INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+VALUES (%(key)s, %(cap)s - %(cost)s, true, clock_timestamp())
+ON CONFLICT (key) DO UPDATE SET
+    tokens = CASE WHEN {_AVAILABLE} >= %(cost)s THEN {_AVAILABLE} - %(cost)s ELSE {_AVAILABLE} END,
+    allowed = {_AVAILABLE} >= %(cost)s,
+    updated_at = clock_timestamp()
+RETURNING tokens, allowed;
+"""
+
+DEBIT_SQL = f"""
+UPDATE rate_limit_buckets AS b
+SET tokens = {_AVAILABLE} - %(cost)s, updated_at = clock_timestamp()
+WHERE key = %(key)s;
+"""
+
+# бакет, що встиг наповнитись, нічим не відрізняється від відсутнього
+SWEEP_SQL = f"DELETE FROM rate_limit_buckets AS b WHERE {_AVAILABLE} >= %(cap)s;"
+
+
+class PostgresBucketStore:
+    def __init__(self, capacity: int, refill_rate: float, sweep_interval: float = 60.0) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _params(self, key: str, cost: float) -> dict:
+        return {"key": key, "cost": float(cost), "cap": float(self.capacity), "rate": self.refill_rate}
+
+    async def take(self, key: str, cost: float) -> float:
+        try:
+            async with connection() as conn, conn.cursor() as cur:
+                await cur.execute(TAKE_SQL, self._params(key, cost))
+                row = await cur.fetchone()
+                await self._maybe_sweep(cur)
+        except Exception as e:
+            # rate limit — захист, а не точка відмови: без БД пропускаємо
+            log.warning("rate_limit_store_failed", error=str(e))
+            return 0.0
+        if row["allowed"]:
+            return 0.0
+        return (cost - row["tokens"]) / self.refill_rate
+
+    async def debit(self, key: str, cost: float) -> None:
+        try:
+            async with connection() as conn, conn.cursor() as cur:
+                await cur.execute(DEBIT_SQL, self._params(key, cost))
+        except Exception as e:
+            log.warning("rate_limit_store_failed", error=str(e))
+
+    async def _maybe_sweep(self, cur) -> None:
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        await cur.execute(SWEEP_SQL, {"cap": float(self.capacity), "rate": self.refill_rate})
+        if cur.rowcount:
+            log.info("rate_limit_buckets_swept", rows=cur.rowcount)
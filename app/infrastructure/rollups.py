@@ -0,0 +1,259 @@
+from datetime import date, timedelta
+from typing import List, Optional
+
+import psycopg
+import structlog
+
+from ..shared import hll
+
+log = structlog.get_logger()
+
+ROLLUP_TABLES = ("daily_user_activity", "daily_dau", "daily_event_counts", "daily_user_hll")
+
+# Таблиці агрегатів. Дні рахуються як occurred_at::date у сесійній TimeZone (UTC, див. db.py).
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_user_activity (
+        day     DATE NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (day, user_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_dau (
+        day DATE PRIMARY KEY,
+        dau BIGINT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_event_counts (
+        day        DATE NOT NULL,
+        event_type TEXT NOT NULL,
+        events     BIGINT NOT NULL,
+        PRIMARY KEY (day, event_type)
+    );
+    """,
+    # HyperLogLog-регістри по днях (розріджено): rank = позиція першої 1 у решті хешу
+    f"""
+    CREATE OR REPLACE FUNCTION hll_reg(h BIGINT) RETURNS SMALLINT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT (h & {hll.HLL_M - 1})::smallint $$;
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION hll_rank(h BIGINT) RETURNS SMALLINT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+        SELECT (CASE WHEN w = 0 THEN {64 - hll.HLL_P + 1}
+                     ELSE position('1' IN w::bit(64)::text) - {hll.HLL_P} END)::smallint
+        FROM (SELECT (h >> {hll.HLL_P}) & {(1 << (64 - hll.HLL_P)) - 1}::bigint AS w) s
+    $$;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_user_hll (
+        day  DATE NOT NULL,
+        reg  SMALLINT NOT NULL,
+        rank SMALLINT NOT NULL,
+        PRIMARY KEY (day, reg)
+    );
+    """,
+    # перша подія кожного юзера за всю історію — основа когорт для retention
+    """
+    CREATE TABLE IF NOT EXISTS user_first_seen (
+        user_id    TEXT PRIMARY KEY,
+        first_seen TIMESTAMPTZ NOT NULL,
+        first_day  DATE GENERATED ALWAYS AS ((first_seen AT TIME ZONE 'UTC')::date) STORED
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_user_first_seen_day ON user_first_seen (first_day);",
+]
+
+# дні, чиї сирі події вже лише в холодному шарі (cold.py)
+PURGED_DAYS = "SELECT day FROM cold_days WHERE purged"
+
+# CTE-ланцюжок поверх `ins` (рядки, реально вставлені в events).
+# ORDER BY у кожному upsert — однаковий порядок блокувань для паралельних батчів.
+_ROLLUP_CTES = """
+ev AS (
+    SELECT occurred_at::date AS day, user_id, event_type FROM ins
+),
+counts AS (
+    INSERT INTO daily_event_counts AS c (day, event_type, events)
+    SELECT day, event_type, COUNT(*) FROM ev
+    GROUP BY day, event_type
+    ORDER BY day, event_type
+    ON CONFLICT (day, event_type) DO UPDATE SET events = c.events + EXCLUDED.events
+),
+new_users AS (
+    INSERT INTO daily_user_activity (day, user_id)
+    SELECT DISTINCT day, user_id FROM ev
+    ORDER BY day, user_id
+    ON CONFLICT DO NOTHING
+    RETURNING day, user_id
+),
+dau AS (
+    INSERT INTO daily_dau AS d (day, dau)
+    SELECT day, COUNT(*) FROM new_users
+    GROUP BY day
+    ORDER BY day
+    ON CONFLICT (day) DO UPDATE SET dau = d.dau + EXCLUDED.dau
+),
+sketch AS (
+    INSERT INTO daily_user_hll AS h (day, reg, rank)
+    SELECT day, hll_reg(hv), MAX(hll_rank(hv))
+    FROM (SELECT day, hashtextextended(user_id, 0) AS hv FROM new_users) s
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (day, reg) DO UPDATE SET rank = EXCLUDED.rank WHERE EXCLUDED.rank > h.rank
+),
+first_seen AS (
+    -- first_seen лише зменшується: пізні (backfill) події зсувають юзера в ранішу когорту
+    INSERT INTO user_first_seen AS f (user_id, first_seen)
+    SELECT user_id, MIN(occurred_at) FROM ins
+    GROUP BY user_id
+    ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET first_seen = EXCLUDED.first_seen
+    WHERE EXCLUDED.first_seen < f.first_seen
+)
+"""
+
+
+def with_rollups(insert_sql: str) -> str:
+    """
+    Wrap an ``INSERT INTO events ... RETURNING occurred_at, user_id, event_type``
+    so the daily rollups are updated in the same statement.
+
+    The resulting statement returns one ``(day, inserted)`` row per day that
+    received new events.
+    """
+    return f"""
+    WITH ins AS (
+        {insert_sql.strip().rstrip(";")}
+    ),
+    {_ROLLUP_CTES.strip()}
+    SELECT day, COUNT(*) AS inserted FROM ev GROUP BY day ORDER BY day;
+    """
+
+
+async def rebuild_rollups(
+    conn: psycopg.AsyncConnection,
+    from_: Optional[date] = None,
+    to_: Optional[date] = None,
+) -> None:
+    """
+    Recompute rollups from raw events for [from_, to_] (whole history if omitted).
+
+    Runs in one transaction; the EXCLUSIVE lock makes concurrent ingest wait
+    instead of double-counting rows that the rebuild already picked up.
+    Days purged to the cold tier keep their rollups: there is nothing left to recount.
+    """
+    params = {"from": from_, "to": to_}
+    day_filter = f"""
+        (%(from)s::date IS NULL OR day >= %(from)s::date)
+        AND (%(to)s::date IS NULL OR day <= %(to)s::date)
+        AND day NOT IN ({PURGED_DAYS})
+    """
+    events_filter = """
+        (%(from)s::date IS NULL OR occurred_at >= %(from)s::date)
+        AND (%(to)s::date IS NULL OR occurred_at < %(to)s::date + INTERVAL '1 day')
+    """
+
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute(f"LOCK TABLE {', '.join(ROLLUP_TABLES)}, user_first_seen IN EXCLUSIVE MODE;")
+        for table in ROLLUP_TABLES:
+            await cur.execute(f"DELETE FROM {table} WHERE {day_filter};", params)
+
+        await cur.execute(
+            f"""
+            INSERT INTO daily_user_activity (day, user_id)
+            SELECT DISTINCT occurred_at::date, user_id FROM events
+            WHERE {events_filter};
+            """,
+            params,
+        )
+        await cur.execute(
+            f"""
+            INSERT INTO daily_dau (day, dau)
+            SELECT day, COUNT(*) FROM daily_user_activity
+            WHERE {day_filter}
+            GROUP BY day;
+            """,
+            params,
+        )
+        await cur.execute(
+            f"""
+            INSERT INTO daily_event_counts (day, event_type, events)
+            SELECT occurred_at::date, event_type, COUNT(*) FROM events
+            WHERE {events_filter}
+            GROUP BY 1, 2;
+            """,
+            params,
+        )
+        await cur.execute(
+            f"""
+            INSERT INTO daily_user_hll (day, reg, rank)
+            SELECT day, hll_reg(hv), MAX(hll_rank(hv))
+            FROM (
+                SELECT day, hashtextextended(user_id, 0) AS hv FROM daily_user_activity
+                WHERE {day_filter}
+            ) s
+            GROUP BY 1, 2;
+            """,
+            params,
+        )
+        await _rebuild_first_seen(cur, params, events_filter)
+    log.info("rollups_rebuilt", from_=str(from_) if from_ else None, to=str(to_) if to_ else None)
+
+
+async def _rebuild_first_seen(cur: psycopg.AsyncCursor, params: dict, events_filter: str) -> None:
+    """
+    first_seen — ознака всієї історії юзера, а не дня, тож перераховуємо її
+    для всіх юзерів, яких зачіпає діапазон: активних у ньому або з first_day у ньому.
+    """
+    await cur.execute(
+        f"""
+        WITH affected AS (
+            SELECT user_id FROM events WHERE {events_filter}
+            UNION
+            SELECT user_id FROM user_first_seen
+            WHERE (%(from)s::date IS NULL OR first_day >= %(from)s::date)
+              AND (%(to)s::date IS NULL OR first_day <= %(to)s::date)
+        )
+        INSERT INTO user_first_seen AS f (user_id, first_seen)
+        SELECT e.user_id, MIN(e.occurred_at)
+        FROM events e JOIN affected a ON a.user_id = e.user_id
+        GROUP BY e.user_id
+        ON CONFLICT (user_id) DO UPDATE SET first_seen = EXCLUDED.first_seen
+        -- перша подія в уже видаленому (холодному) дні з events не відновлюється
+        WHERE EXCLUDED.first_seen < f.first_seen OR f.first_day NOT IN ({PURGED_DAYS});
+        """,
+        params,
+    )
+    # юзери, від яких в events нічого не лишилось
+    await cur.execute(
+        f"""
+        DELETE FROM user_first_seen f
+        WHERE (%(from)s::date IS NULL OR f.first_day >= %(from)s::date)
+          AND (%(to)s::date IS NULL OR f.first_day <= %(to)s::date)
+          AND f.first_day NOT IN ({PURGED_DAYS})
+          AND NOT EXISTS (SELECT 1 FROM events e WHERE e.user_id = f.user_id);
+        """,
+        params,
+    )
+
+
+async def load_daily_sketches(conn: psycopg.AsyncConnection, from_: date, to_: date) -> List[bytes]:
+    """Щільні HLL-скетчі для кожного дня [from_, to_] (порожні дні — нульовий скетч)."""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT day, array_agg(reg) AS regs, array_agg(rank) AS ranks
+            FROM daily_user_hll
+            WHERE day BETWEEN %(from)s AND %(to)s
+            GROUP BY day;
+            """,
+            {"from": from_, "to": to_},
+        )
+        by_day = {r["day"]: hll.from_sparse(r["regs"], r["ranks"]) for r in await cur.fetchall()}
+
+    n_days = (to_ - from_).days + 1
+    return [by_day.get(from_ + timedelta(days=i), hll.empty()) for i in range(n_days)]
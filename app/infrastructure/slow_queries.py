@@ -0,0 +1,116 @@
+"""
+Журнал повільних запитів /stats/* (SLOW_QUERY_MS; 0 — вимкнено).
+
+Запит, довший за поріг, потрапляє в обмежене кільце в пам'яті процесу (останні
+SLOW_QUERY_RING_SIZE) і в лог structlog — з request_id від RequestIDMiddleware.
+Частина з них (SLOW_QUERY_EXPLAIN_SAMPLE, за замовчуванням 0) ще раз виконується у фоні під
+EXPLAIN (ANALYZE, BUFFERS) з тими самими параметрами; план дописується в запис.
+Одночасно — не більше одного EXPLAIN, щоб не добивати й так повільну БД.
+
+Кільце — на процес: з кількома воркерами /debug/slow-queries (лише з DEBUG_ENDPOINTS=1)
+показує лише свій.
+"""
+import asyncio
+import hashlib
+import random
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import structlog
+from prometheus_client import Counter
+
+from ..shared.settings import settings
+from .db import read_connection
+
+log = structlog.get_logger()
+
+SLOW_QUERIES = Counter("stats_slow_queries_total", "Stats queries slower than SLOW_QUERY_MS", ["endpoint"])
+
+
+@dataclass
+class SlowQuery:
+    endpoint: str
+    fingerprint: str
+    sql: str
+    params: Dict[str, Any]
+    duration_ms: float
+    request_id: Optional[str]
+    at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    plan: Optional[str] = None  # EXPLAIN (ANALYZE, BUFFERS), якщо запит потрапив у вибірку
+
+
+def fingerprint(sql: str) -> str:
+    """Хеш нормалізованого тексту: параметри в SQL — плейсхолдери, тож форма запиту = форма сегмента."""
+    normalized = re.sub(r"\s+", " ", re.sub(r"--[^\n]*", "", sql)).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    def __init__(self, size: int) -> None:
+        self._ring: Deque[SlowQuery] = deque(maxlen=size)
+        self._explaining: Set["asyncio.Task[None]"] = set()
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def entries(self) -> List[SlowQuery]:
+        """Найновіші — першими."""
+        return list(reversed(self._ring))
+
+    def clear(self) -> None:
+        self._ring.clear()
+
+    def observe(self, endpoint: str, sql: str, params: Dict[str, Any], seconds: float) -> Optional[SlowQuery]:
+        """Записує запит, якщо він довший за поріг; повертає запис (або None)."""
+        duration_ms = seconds * 1000
+        if settings.slow_query_ms <= 0 or duration_ms < settings.slow_query_ms:
+            return None
+        entry = SlowQuery(
+            endpoint=endpoint,
+            fingerprint=fingerprint(sql),
+            sql=sql,
+            params=dict(params),
+            duration_ms=round(duration_ms, 1),
+            request_id=structlog.contextvars.get_contextvars().get("request_id"),
+        )
+        self._ring.append(entry)
+        SLOW_QUERIES.labels(endpoint).inc()
+        # request_id у лог додає merge_contextvars
+        log.warning(
+            "stats_slow_query",
+            endpoint=endpoint,
+            fingerprint=entry.fingerprint,
+            duration_ms=entry.duration_ms,
+            params={k: str(v) for k, v in params.items()},
+        )
+        if not self._explaining and random.random() < settings.slow_query_explain_sample:
+            task = asyncio.create_task(self._explain(entry))
+            self._explaining.add(task)
+            task.add_done_callback(self._explaining.discard)
+        return entry
+
+    async def _explain(self, entry: SlowQuery) -> None:
+        try:
+            async with read_connection() as conn, conn.transaction(), conn.cursor() as cur:
+                # ANALYZE виконує запит повністю — обмежуємо, щоб не тримати з'єднання вічно
+                await cur.execute(f"SET LOCAL statement_timeout = {int(settings.slow_query_explain_timeout * 1000)};")
+                await cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) " + entry.sql.strip().rstrip(";"), entry.params)
+                entry.plan = "\n".join(r["QUERY PLAN"] for r in await cur.fetchall())
+        except Exception as e:
+            log.warning("stats_slow_query_explain_failed", fingerprint=entry.fingerprint, error=str(e))
+            return
+        log.info("stats_slow_query_plan", fingerprint=entry.fingerprint, plan=entry.plan)
+
+    async def drain(self, cancel: bool = False) -> None:
+        """Дочікується фонових EXPLAIN; cancel=True — спершу скасовує їх (зупинка процесу)."""
+        if cancel:
+            for task in self._explaining:
+                task.cancel()
+        if self._explaining:
+            await asyncio.gather(*self._explaining, return_exceptions=True)
+
+
+slow_queries = SlowQueryLog(settings.slow_query_ring_size)
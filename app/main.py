@@ -1,4 +1,8 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from psycopg_pool import PoolTimeout
 from prometheus_fastapi_instrumentator import Instrumentator
 import structlog
 
@@ -6,9 +10,14 @@ from .shared.logging import setup_logging
 from .shared.settings import settings
 from .shared.middleware import RequestIDMiddleware, RateLimitMiddleware  # +++
 from .api.routes_health import router as health_router
-from .api.routes_events import router as events_router
+from .api.routes_events import router as events_router, make_ingest_buffer
 from .api.routes_stats import router as stats_router
-from .infrastructure.db import get_conn, ensure_migrations, shutdown
+from .api.routes_debug import router as debug_router
+from .application import ingest_buffer
+from .infrastructure.db import get_pool, ensure_migrations, shutdown
+from .infrastructure.invalidation import listen_invalidations
+from .infrastructure.slow_queries import slow_queries
+from .infrastructure.rate_limit import PostgresBucketStore
 
 setup_logging()
 log = structlog.get_logger()
@@ -17,12 +26,28 @@ app = FastAPI(title=settings.app_name)
 
 # Middlewares
 app.add_middleware(RequestIDMiddleware)   
-app.add_middleware(RateLimitMiddleware)   
+app.add_middleware(
+    RateLimitMiddleware,
+    store=(
+        PostgresBucketStore(settings.rate_limit_events_burst, float(settings.rate_limit_events_per_sec))
+        if settings.rate_limit_backend == "postgres"
+        else None  # in-memory, на процес
+    ),
+)
 
 # Routers
 app.include_router(health_router, tags=["system"])
 app.include_router(events_router, tags=["ingest"])
 app.include_router(stats_router, tags=["stats"])
+if settings.debug_endpoints:
+    # SQL і параметри запитів без автентифікації — лише за явним DEBUG_ENDPOINTS=1
+    app.include_router(debug_router, tags=["system"])
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # пул вичерпано довше за DB_POOL_TIMEOUT — віддаємо 503, клієнт може повторити
+    log.warning("db_pool_timeout", path=request.url.path, error=str(exc))
+    return JSONResponse(status_code=503, content={"detail": "database busy"}, headers={"Retry-After": "1"})
 
 # Metrics
 if settings.enable_metrics:
@@ -30,11 +55,31 @@ if settings.enable_metrics:
 
 @app.on_event("startup")
 async def on_startup():
-    await get_conn()
+    await get_pool()
     await ensure_migrations()
+    if settings.stats_cache_enabled:
+        # інвалідація кешу /stats від CLI та інших воркерів (LISTEN/NOTIFY)
+        app.state.invalidation_listener = asyncio.create_task(listen_invalidations())
+    if settings.ingest_async:
+        buffer = make_ingest_buffer(
+            max_events=settings.ingest_buffer_max_events,
+            flush_events=settings.ingest_flush_events,
+            flush_interval=settings.ingest_flush_interval,
+        )
+        buffer.start()
+        ingest_buffer.set_buffer(buffer)
     log.info("app_started", env=settings.env)
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    listener = getattr(app.state, "invalidation_listener", None)
+    if listener is not None:
+        listener.cancel()
+    buffer = ingest_buffer.get_buffer()
+    if buffer is not None:
+        # дописуємо прийняті (202) події, поки пул ще відкритий
+        await buffer.close(timeout=settings.db_pool_drain_timeout)
+        ingest_buffer.set_buffer(None)
+    await slow_queries.drain(cancel=True)
     await shutdown()
     log.info("app_stopped")
@@ -0,0 +1,197 @@
+import bisect
+import json
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from .settings import settings
+
+# ----- Prometheus metrics -----
+CACHE_REQUESTS = Counter(
+    "stats_cache_requests_total",
+    "Stats result cache lookups",
+    ["endpoint", "result"],  # "hit", "miss"
+)
+CACHE_EVICTIONS = Counter(
+    "stats_cache_evictions_total",
+    "Stats result cache evictions",
+    ["reason"],  # "lru", "memory", "ttl", "invalidated"
+)
+CACHE_ENTRIES = Gauge("stats_cache_entries", "Entries in the stats result cache")
+CACHE_BYTES = Gauge("stats_cache_bytes", "Approximate size of cached stats results (JSON bytes)")
+
+# перерахунок нещодавно інвалідованого діапазону: репліка може ще не бачити інгест,
+# що скинув кеш, тож read_connection (infrastructure/db.py) іде на primary
+read_from_primary: ContextVar[bool] = ContextVar("stats_read_from_primary", default=False)
+
+
+class _Entry:
+    __slots__ = ("value", "lo", "hi", "size", "expires")
+
+    def __init__(self, value: Any, lo: date, hi: date, size: int, expires: float) -> None:
+        self.value = value
+        self.lo = lo
+        self.hi = hi
+        self.size = size
+        self.expires = expires
+
+
+class StatsCache:
+    """
+    In-process LRU for /stats results with TTL and a memory cap.
+
+    Each entry remembers the day range [lo, hi] its result depends on, so an
+    ingest that touched some days drops only the entries overlapping them.
+    An invalidation that lands while a result is being computed marks that
+    computation stale, and its (possibly pre-ingest) result is not stored.
+    For ``stats_cache_primary_window`` seconds after a day is invalidated,
+    computations covering it read the primary (``read_from_primary``), so a
+    lagging replica cannot put the pre-ingest result back for the whole TTL.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # обчислення в польоті: токен -> [lo, hi, stale]
+        self._pending: Dict[int, List[Any]] = {}
+        self._next_token = 0
+        # день -> monotonic-час останньої інвалідації (None — clear/інвалідація всього)
+        self._invalidated: Dict[Optional[date], float] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, endpoint: str, key: Hashable) -> Optional[Any]:
+        e = self._data.get(key)
+        if e is not None and e.expires <= time.monotonic():
+            self._drop(key, "ttl")
+            e = None
+        if e is None:
+            CACHE_REQUESTS.labels(endpoint, "miss").inc()
+            return None
+        self._data.move_to_end(key)
+        CACHE_REQUESTS.labels(endpoint, "hit").inc()
+        return e.value
+
+    def put(self, key: Hashable, value: Any, lo: date, hi: date) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key, None)
+        self._data[key] = _Entry(value, lo, hi, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        while len(self._data) > self.max_entries:
+            self._drop(next(iter(self._data)), "lru")
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._data)), "memory")
+        self._report()
+
+    def invalidate_days(self, days: Optional[Iterable[date]]) -> int:
+        """Drop entries whose range overlaps any of `days`; None drops everything."""
+        if days is None:
+            keys = list(self._data)
+        else:
+            sorted_days = sorted(set(days))
+            if not sorted_days:
+                return 0
+            keys = []
+            for k, e in self._data.items():
+                i = bisect.bisect_left(sorted_days, e.lo)
+                if i < len(sorted_days) and sorted_days[i] <= e.hi:
+                    keys.append(k)
+        for k in keys:
+            self._drop(k, "invalidated")
+        self._mark_pending_stale(sorted_days if days is not None else None)
+        self._remember_invalidated(sorted_days if days is not None else [None])
+        self._report()
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+        self._mark_pending_stale(None)
+        self._invalidated.clear()
+        self._report()
+
+    def _remember_invalidated(self, days: List[Optional[date]]) -> None:
+        now = time.monotonic()
+        window = settings.stats_cache_primary_window
+        for d, at in list(self._invalidated.items()):
+            if now - at >= window:
+                del self._invalidated[d]
+        if window > 0:
+            for d in days:
+                self._invalidated[d] = now
+
+    def recently_invalidated(self, lo: date, hi: date) -> bool:
+        """Чи інвалідовано якийсь день з [lo, hi] за останні stats_cache_primary_window сек."""
+        since = time.monotonic() - settings.stats_cache_primary_window
+        return any(at > since and (d is None or lo <= d <= hi) for d, at in self._invalidated.items())
+
+    def _mark_pending_stale(self, sorted_days: Optional[List[date]]) -> None:
+        for p in self._pending.values():
+            if sorted_days is None:
+                p[2] = True
+                continue
+            i = bisect.bisect_left(sorted_days, p[0])
+            if i < len(sorted_days) and sorted_days[i] <= p[1]:
+                p[2] = True
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        params: Tuple[Any, ...],
+        lo: date,
+        hi: date,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        if not settings.stats_cache_enabled:
+            return await compute()
+        key = (endpoint, *params)
+        cached = self.get(endpoint, key)
+        if cached is not None:
+            return cached
+        token = self._next_token
+        self._next_token += 1
+        self._pending[token] = [lo, hi, False]
+        primary = read_from_primary.set(self.recently_invalidated(lo, hi))
+        try:
+            value = await compute()
+        finally:
+            read_from_primary.reset(primary)
+            stale = self._pending.pop(token)[2]
+        if not stale:
+            self.put(key, value, lo, hi)
+        return value
+
+    def _drop(self, key: Hashable, reason: Optional[str]) -> None:
+        e = self._data.pop(key, None)
+        if e is None:
+            return
+        self._bytes -= e.size
+        if reason:
+            CACHE_EVICTIONS.labels(reason).inc()
+
+    def _report(self) -> None:
+        CACHE_ENTRIES.set(len(self._data))
+        CACHE_BYTES.set(self._bytes)
+
+
+def normalize_segment(segment: Optional[str]) -> Optional[str]:
+    s = (segment or "").strip()
+    return s or None
+
+
+stats_cache = StatsCache(
+    max_entries=settings.stats_cache_max_entries,
+    max_bytes=settings.stats_cache_max_bytes,
+    ttl=settings.stats_cache_ttl,
+)
@@ -0,0 +1,82 @@
+"""
+HyperLogLog-оцінка кількості унікальних user_id.
+
+Регістри рахує Postgres під час інгесту (hashtextextended(user_id, 0), див.
+infrastructure/rollups.py) і зберігає розріджено: (day, reg, rank). Тут — лише
+збирання щільних скетчів, їх об'єднання (max по регістрах) та оцінка.
+Скетч — 16 KiB bytes; операції над регістрами — у numpy, щоб об'єднання сотень
+днів у /stats/active-users не блокували event loop.
+
+Точність: p=14 -> m=16384 регістри, стандартна відносна похибка
+1.04 / sqrt(m) ≈ 0.81%; ~99.7% оцінок у межах ±3σ ≈ ±2.4%. На малих
+кардинальностях (n < 2.5·m) працює linear counting і оцінка майже точна.
+"""
+import math
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+HLL_P = 14
+HLL_M = 1 << HLL_P
+HLL_REL_ERROR = 1.04 / math.sqrt(HLL_M)
+
+_ALPHA = 0.7213 / (1 + 1.079 / HLL_M)
+_MAX_RANK = 64 - HLL_P + 1
+_EMPTY = bytes(HLL_M)
+_POWERS = 2.0 ** -np.arange(_MAX_RANK + 1, dtype=np.float64)
+
+
+def empty() -> bytes:
+    return _EMPTY
+
+
+def from_sparse(regs: Iterable[int], ranks: Iterable[int]) -> bytes:
+    """Щільний скетч із розріджених пар (регістр, ранг)."""
+    sketch = np.zeros(HLL_M, dtype=np.uint8)
+    np.maximum.at(sketch, np.asarray(regs, dtype=np.intp), np.asarray(ranks, dtype=np.uint8))
+    return sketch.tobytes()
+
+
+def union(a: bytes, b: bytes) -> bytes:
+    if a is _EMPTY:
+        return b
+    if b is _EMPTY:
+        return a
+    return np.maximum(np.frombuffer(a, dtype=np.uint8), np.frombuffer(b, dtype=np.uint8)).tobytes()
+
+
+def estimate(sketch: bytes) -> float:
+    counts = np.bincount(np.frombuffer(sketch, dtype=np.uint8), minlength=_MAX_RANK + 1)
+    zeros = int(counts[0])
+    if zeros == HLL_M:
+        return 0.0
+    harmonic = float(np.dot(counts[: _MAX_RANK + 1], _POWERS))
+    e = _ALPHA * HLL_M * HLL_M / harmonic
+    if e <= 2.5 * HLL_M and zeros:
+        # linear counting для малих кардинальностей
+        return HLL_M * math.log(HLL_M / zeros)
+    return e
+
+
+def rolling_union(sketches: Sequence[bytes], window: int) -> List[bytes]:
+    """
+    Ковзне об'єднання: out[i] = union(sketches[i-window+1 .. i]) для i >= window-1
+    (для перших window-1 позицій — об'єднання того, що є).
+
+    Блоковий prefix/suffix max (van Herk / Gil-Werman): ~3 union на позицію
+    незалежно від розміру вікна.
+    """
+    n = len(sketches)
+    prefix: List[bytes] = [_EMPTY] * n
+    suffix: List[bytes] = [_EMPTY] * n
+    for i in range(n):
+        prefix[i] = sketches[i] if i % window == 0 else union(prefix[i - 1], sketches[i])
+    for i in range(n - 1, -1, -1):
+        last_in_block = i % window == window - 1 or i == n - 1
+        suffix[i] = sketches[i] if last_in_block else union(suffix[i + 1], sketches[i])
+
+    out: List[bytes] = []
+    for i in range(n):
+        j = i - window + 1
+        out.append(prefix[i] if j <= 0 else union(suffix[j], prefix[i]))
+    return out
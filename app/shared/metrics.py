@@ -0,0 +1,17 @@
+"""
+Метрики, спільні для API й CLI.
+
+ingest_stage_seconds{source, stage} розкладає інгест на стадії, щоб сплеск латентності
+можна було віднести до CPU (decode/validate/response) чи до Postgres (db_write):
+    source="api": decode — прийом тіла, validate — JSON + схема, db_write — INSERT батчу,
+                  response — формування відповіді;
+    source="cli": decode — читання CSV, validate — парсинг рядків, db_write — COPY + merge.
+"""
+from prometheus_client import Histogram
+
+INGEST_STAGE = Histogram(
+    "ingest_stage_seconds",
+    "Time spent per ingest stage",
+    ["source", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
@@ -1,8 +1,11 @@
+import math
 import time
-from typing import Callable, Awaitable, Dict, Tuple
+from collections import OrderedDict
+from typing import Optional, Protocol
 from uuid import uuid4
 
-from starlette.types import ASGIApp, Receive, Scope, Send
+from prometheus_client import Counter, Gauge
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.responses import JSONResponse
 import structlog
 
@@ -43,37 +46,130 @@ class RequestIDMiddleware:
 
 
 # -------- Token-bucket Rate Limit --------
+RATE_LIMITED = Counter("rate_limit_rejected_total", "Ingest requests rejected by the rate limiter")
+RATE_LIMIT_BUCKETS = Gauge("rate_limit_buckets", "Token buckets held by the in-memory rate limit store")
+RATE_LIMIT_EVICTIONS = Counter(
+    "rate_limit_evictions_total",
+    "Rate limit buckets evicted from the in-memory store",
+    ["reason"],  # "idle", "capacity"
+)
+
+
+class BucketStore(Protocol):
+    """
+    Сховище token bucket-ів. Токени — події: кожен ключ має `capacity` токенів,
+    що поповнюються зі швидкістю `refill_rate` за секунду.
+    """
+
+    async def take(self, key: str, cost: float) -> float:
+        """Списати cost, якщо вистачає; повертає 0.0 або скільки секунд чекати."""
+        ...
+
+    async def debit(self, key: str, cost: float) -> None:
+        """Безумовно списати cost (баланс може піти в мінус — наступні запити чекатимуть)."""
+        ...
+
+
 class TokenBucket:
     __slots__ = ("capacity", "refill_rate", "tokens", "last")
 
-    def __init__(self, capacity: int, refill_rate: float) -> None:
+    def __init__(self, capacity: int, refill_rate: float, now: Optional[float] = None) -> None:
         self.capacity = capacity
         self.refill_rate = refill_rate  # tokens per second
         self.tokens = float(capacity)
-        self.last = time.perf_counter()
+        self.last = time.monotonic() if now is None else now
 
-    def allow(self, cost: float = 1.0) -> bool:
-        now = time.perf_counter()
-        elapsed = now - self.last
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill_rate)
         self.last = now
-        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+
+    def allow(self, cost: float = 1.0) -> bool:
+        self.refill(time.monotonic())
         if self.tokens >= cost:
             self.tokens -= cost
             return True
         return False
 
+    def full_at(self) -> float:
+        """Момент, коли бакет знову повний (тоді його можна забути без втрати стану)."""
+        return self.last + (self.capacity - self.tokens) / self.refill_rate
+
+
+class MemoryBucketStore:
+    """
+    Бакети в пам'яті процесу: LRU з жорстким лімітом ключів і прибиранням
+    бакетів, що простояли досить довго, аби знову наповнитись (це без втрат:
+    повний бакет = новий бакет).
+    """
+
+    def __init__(self, capacity: int, refill_rate: float, max_keys: int) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _bucket(self, key: str, now: float) -> TokenBucket:
+        self._evict_idle(now)
+        b = self._buckets.get(key)
+        if b is None:
+            b = TokenBucket(self.capacity, self.refill_rate, now)
+            self._buckets[key] = b
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                RATE_LIMIT_EVICTIONS.labels("capacity").inc()
+            RATE_LIMIT_BUCKETS.set(len(self._buckets))
+        else:
+            self._buckets.move_to_end(key)
+        b.refill(now)
+        return b
+
+    def _evict_idle(self, now: float) -> None:
+        # найдавніше використані — спереду; зупиняємось на першому ще не повному
+        evicted = 0
+        while self._buckets:
+            b = next(iter(self._buckets.values()))
+            if b.full_at() > now:
+                break
+            self._buckets.popitem(last=False)
+            evicted += 1
+        if evicted:
+            RATE_LIMIT_EVICTIONS.labels("idle").inc(evicted)
+            RATE_LIMIT_BUCKETS.set(len(self._buckets))
+
+    async def take(self, key: str, cost: float) -> float:
+        b = self._bucket(key, time.monotonic())
+        if b.tokens >= cost:
+            b.tokens -= cost
+            return 0.0
+        return (cost - b.tokens) / self.refill_rate
+
+    async def debit(self, key: str, cost: float) -> None:
+        self._bucket(key, time.monotonic()).tokens -= cost
+
 
 class RateLimitMiddleware:
     """
-    Simple per-key token-bucket. Key: X-API-Key or client IP.
-    Use for write-heavy endpoints first.
+    Per-key token bucket для інгесту. Key: X-API-Key or client IP.
+
+    Ціна запиту — кількість подій, оцінена з Content-Length
+    (RATE_LIMIT_BYTES_PER_EVENT), тож ліміт відповідає реальному навантаженню
+    на БД. Без Content-Length (chunked NDJSON) спершу береться 1, а решта
+    списується після прочитання тіла.
     """
 
-    def __init__(self, app: ASGIApp) -> None:
+    PATHS = ("/events", "/events/stream")
+
+    def __init__(self, app: ASGIApp, store: Optional[BucketStore] = None) -> None:
         self.app = app
-        self.buckets: Dict[str, TokenBucket] = {}
-        self.capacity = settings.rate_limit_burst
-        self.refill = float(settings.rate_limit_rps)  # tokens/second
+        self.capacity = settings.rate_limit_events_burst
+        self.refill = float(settings.rate_limit_events_per_sec)  # tokens/second
+        self.bytes_per_event = max(1, settings.rate_limit_bytes_per_event)
+        if store is None:
+            store = MemoryBucketStore(self.capacity, self.refill, max_keys=settings.rate_limit_max_keys)
+        self.store: BucketStore = store
 
     def _key(self, scope: Scope) -> str:
         headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
@@ -84,12 +180,9 @@ class RateLimitMiddleware:
         ip = (client[0] if client else "unknown")
         return f"ip:{ip}"
 
-    def _bucket(self, key: str) -> TokenBucket:
-        b = self.buckets.get(key)
-        if b is None:
-            b = TokenBucket(self.capacity, self.refill)
-            self.buckets[key] = b
-        return b
+    def _cost(self, n_bytes: int) -> int:
+        # один запит не може коштувати більше за весь бакет, інакше не пройде ніколи
+        return min(self.capacity, max(1, math.ceil(n_bytes / self.bytes_per_event)))
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         if scope["type"] != "http":
@@ -99,17 +192,48 @@ class RateLimitMiddleware:
         path = scope.get("path", "")
         method = scope.get("method", "GET")
 
-        
-        if method == "POST" and path == "/events":
-            key = self._key(scope)
-            bucket = self._bucket(key)
-            if not bucket.allow():
-                # 429 Too Many Requests
-                await JSONResponse(
-                    status_code=429,
-                    content={"detail": "rate limit exceeded"},
-                    headers={"Retry-After": "1"},
-                )(scope, receive, send)
-                return
-
-        await self.app(scope, receive, send)
+        if method != "POST" or path not in self.PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        key = self._key(scope)
+        content_length = None
+        for k, v in scope.get("headers", []):
+            if k == b"content-length":
+                try:
+                    content_length = int(v)
+                except ValueError:
+                    pass
+                break
+
+        cost = self._cost(content_length) if content_length is not None else 1
+        wait = await self.store.take(key, cost)
+        if wait > 0:
+            RATE_LIMITED.inc()
+            # 429 Too Many Requests
+            await JSONResponse(
+                status_code=429,
+                content={"detail": "rate limit exceeded"},
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )(scope, receive, send)
+            return
+
+        if content_length is not None:
+            await self.app(scope, receive, send)
+            return
+
+        # тіло без довжини: рахуємо байти по ходу й дописуємо борг після останнього шматка
+        received = 0
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    extra = math.ceil(received / self.bytes_per_event) - 1
+                    if extra > 0:
+                        await self.store.debit(key, extra)
+            return message
+
+        await self.app(scope, counting_receive, send)
@@ -1,35 +1,430 @@
+"""
+Мова сегментів для /stats.
+
+Граматика (ключові слова без урахування регістру):
+
+    expr      := and_expr ("OR" and_expr)*
+    and_expr  := atom ("AND" atom)*
+    atom      := "(" expr ")" | predicate
+    predicate := "event_type" (":" | "=") value ("," value)*
+               | "event_type" "IN" "(" value ("," value)* ")"
+               | "properties." key ("=" | "<" | "<=" | ">" | ">=") value
+               | "properties." key "IN" "(" value ("," value)* ")"
+    value     := bare | "..." | '...'
+
+Приклади:
+    event_type:purchase
+    event_type IN (login, purchase) AND properties.country IN (UA, PL)
+    (properties.plan=pro OR properties.plan=team) AND properties.price >= 9.99
+
+Рівність компілюється в `properties @> '{"k": v}'` — це єдина форма, яку бере
+GIN-індекс idx_events_props_gin (jsonb_path_ops). Голе значення, схоже на число
+чи true/false, порівнюється і як рядок, і як типізоване JSON-значення (так само,
+як раніше робив `->>`); значення в лапках — лише як рядок.
+
+Для promoted-ключів (PROMOTED_PROPERTIES) предикат іде в колонку prop_<key> з тією
+самою семантикою: колонка містить лише значення свого JSON-типу (text — рядки,
+numeric — числа, boolean — true/false), тож у неї йдуть кандидати цього типу, а решта
+(голе 5 для text-колонки, рядок "5" для numeric) лишається на @>. Порівняння — лише
+numeric-колонка (jsonb_path теж бере тільки числа).
+"""
+import json
+import math
 import re
-from typing import Tuple, Dict, Any, Optional
+from decimal import Decimal
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 _KEY_RE = re.compile(r"^[A-Za-z0-9_]+$")
+_INT_RE = re.compile(r"^-?(0|[1-9][0-9]*)$")
+_NUMBER_RE = re.compile(r"^-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?$")
+
+_TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op><=|>=|=|<|>|:|\(|\)|,)
+      | (?P<word>[^\s()=<>:,"']+)
+    )
+    """,
+    re.VERBOSE,
+)
+
+_CMP_OPS = ("<", "<=", ">", ">=")
+_MAX_PREDICATES = 64
+
+# ключ properties -> тип забекфіленої колонки events.prop_<key> (див. infrastructure/promoted.py)
+_promoted: Dict[str, str] = {}
+
+
+def set_promoted_columns(columns: Dict[str, str]) -> None:
+    _promoted.clear()
+    _promoted.update(columns)
+
+
+class SegmentError(ValueError):
+    """Сегмент не відповідає граматиці (API повертає 400)."""
+
+
+@dataclass(frozen=True)
+class Literal:
+    text: str
+    quoted: bool = False
+
+    def __post_init__(self) -> None:
+        # 1e400 -> inf: у JSON такого числа немає, ::jsonb впав би з 500 замість 400
+        if not self.quoted and _NUMBER_RE.match(self.text) and not math.isfinite(float(self.text)):
+            raise SegmentError(f"number out of range: {self.text!r} (quote it to match a string)")
+
+    def json_values(self) -> List[Any]:
+        """Кандидати JSON-значення для рівності: рядок і, для голих значень, типізоване."""
+        out: List[Any] = [self.text]
+        if not self.quoted:
+            if _INT_RE.match(self.text):
+                out.append(int(self.text))
+            elif _NUMBER_RE.match(self.text):
+                out.append(float(self.text))
+            elif self.text in ("true", "false"):
+                out.append(self.text == "true")
+        return out
+
+    def number(self) -> float:
+        if self.quoted or not _NUMBER_RE.match(self.text):
+            raise SegmentError(f"numeric comparison needs a number, got {self.text!r}")
+        return float(self.text)
+
+
+@dataclass(frozen=True)
+class Predicate:
+    field: str             # "event_type" або "properties"
+    key: Optional[str]     # ключ у properties
+    op: str                # "=", "in", "<", "<=", ">", ">="
+    values: Tuple[Literal, ...]
+
+
+@dataclass(frozen=True)
+class BoolOp:
+    op: str                # "and" / "or"
+    items: Tuple["Node", ...]
+
+
+Node = Union[Predicate, BoolOp]
+
+
+# ----- parsing -----
+
+def _tokenize(s: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    s = s.rstrip()
+    while pos < len(s):
+        m = _TOKEN_RE.match(s, pos)
+        if not m or m.end() == pos:
+            raise SegmentError(f"unexpected character at {pos}: {s[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("str") is not None:
+            raw = m.group("str")
+            tokens.append(("str", re.sub(r"\\(.)", r"\1", raw[1:-1])))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            word = m.group("word")
+            kw = word.upper()
+            tokens.append(("kw", kw) if kw in ("AND", "OR", "IN") else ("word", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]]) -> None:
+        self.tokens = tokens
+        self.i = 0
+        self.predicates = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        tok = self.peek()
+        if tok is None:
+            raise SegmentError("unexpected end of segment")
+        self.i += 1
+        return tok
+
+    def expect(self, kind: str, value: str) -> None:
+        tok = self.take()
+        if tok != (kind, value):
+            raise SegmentError(f"expected {value!r}, got {tok[1]!r}")
+
+    def accept(self, kind: str, value: str) -> bool:
+        if self.peek() == (kind, value):
+            self.i += 1
+            return True
+        return False
+
+    def parse(self) -> Node:
+        node = self.expr()
+        if self.peek() is not None:
+            raise SegmentError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def expr(self) -> Node:
+        items = [self.and_expr()]
+        while self.accept("kw", "OR"):
+            items.append(self.and_expr())
+        return items[0] if len(items) == 1 else BoolOp("or", tuple(items))
+
+    def and_expr(self) -> Node:
+        items = [self.atom()]
+        while self.accept("kw", "AND"):
+            items.append(self.atom())
+        return items[0] if len(items) == 1 else BoolOp("and", tuple(items))
+
+    def atom(self) -> Node:
+        if self.accept("op", "("):
+            node = self.expr()
+            self.expect("op", ")")
+            return node
+        return self.predicate()
+
+    def value(self) -> Literal:
+        kind, text = self.take()
+        if kind == "str":
+            return Literal(text, quoted=True)
+        if kind == "word":
+            return Literal(text)
+        raise SegmentError(f"expected a value, got {text!r}")
+
+    def value_list(self) -> Tuple[Literal, ...]:
+        self.expect("op", "(")
+        values = [self.value()]
+        while self.accept("op", ","):
+            values.append(self.value())
+        self.expect("op", ")")
+        return tuple(values)
+
+    def predicate(self) -> Predicate:
+        self.predicates += 1
+        if self.predicates > _MAX_PREDICATES:
+            raise SegmentError(f"too many predicates (max {_MAX_PREDICATES})")
+        kind, field = self.take()
+        if kind != "word":
+            raise SegmentError(f"expected a field, got {field!r}")
+
+        if field == "event_type":
+            if self.accept("kw", "IN"):
+                return Predicate("event_type", None, "in", self.value_list())
+            kind, op = self.take()
+            if (kind, op) not in (("op", ":"), ("op", "=")):
+                raise SegmentError(f"event_type supports ':', '=' and IN, got {op!r}")
+            values = [self.value()]
+            while self.accept("op", ","):
+                values.append(self.value())
+            return Predicate("event_type", None, "in" if len(values) > 1 else "=", tuple(values))
+
+        if field.startswith("properties."):
+            key = field[len("properties."):]
+            if not _KEY_RE.match(key):
+                raise SegmentError(f"invalid property key {key!r}")
+            if self.accept("kw", "IN"):
+                return Predicate("properties", key, "in", self.value_list())
+            kind, op = self.take()
+            if kind != "op" or op not in ("=", *_CMP_OPS):
+                raise SegmentError(f"unsupported operator {op!r}")
+            value = self.value()
+            if op in _CMP_OPS:
+                value.number()
+            return Predicate("properties", key, op, (value,))
+
+        raise SegmentError(f"unknown field {field!r} (use event_type or properties.<key>)")
+
+
+_LEGACY_EVENT_TYPE = re.compile(r"^event_type:(.*)$", re.S)
+_LEGACY_PROPERTY = re.compile(r"^properties\.([A-Za-z0-9_]+)=(.*)$", re.S)
+_GRAMMAR_HINT = re.compile(r"[()]|\b(AND|OR|IN)\b", re.I)
+
+
+def parse_segment(segment: Optional[str]) -> Optional[Node]:
+    """Розбирає сегмент в AST; None для порожнього. Невалідний — SegmentError."""
+    if not segment or not segment.strip():
+        return None
+    s = segment.strip()
+    try:
+        return _Parser(_tokenize(s)).parse()
+    except SegmentError:
+        # старі однопредикатні сегменти зі значеннями, яких граматика не розбирає
+        # (пробіли, лапки всередині тощо): "properties.city=New York".
+        # Якщо ж схоже на вираз — справжня помилка, а не значення з пробілами.
+        if _GRAMMAR_HINT.search(s):
+            raise
+        m = _LEGACY_EVENT_TYPE.match(s)
+        if m:
+            return Predicate("event_type", None, "=", (Literal(m.group(1).strip()),))
+        m = _LEGACY_PROPERTY.match(s)
+        if m:
+            return Predicate("properties", m.group(1), "=", (Literal(m.group(2).strip()),))
+        raise
+
+
+def event_types_segment(segment: Optional[str]) -> Optional[List[str]]:
+    """
+    Якщо сегмент фільтрує лише по event_type (":", IN, OR між ними) — список типів,
+    інакше None. Такий сегмент можна відповісти з денних агрегатів по event_type.
+    """
+    def collect(node: Node) -> Optional[List[str]]:
+        if isinstance(node, Predicate):
+            if node.field != "event_type":
+                return None
+            return [v.text for v in node.values]
+        if node.op != "or":
+            return None
+        out: List[str] = []
+        for item in node.items:
+            part = collect(item)
+            if part is None:
+                return None
+            out.extend(part)
+        return out
+
+    node = parse_segment(segment)
+    if node is None:
+        return None
+    types = collect(node)
+    return sorted(set(types)) if types is not None else None
+
+
+# ----- SQL -----
+
+class _Compiler:
+    def __init__(self) -> None:
+        self.params: Dict[str, Any] = {}
+
+    def param(self, value: Any) -> str:
+        name = f"seg_p{len(self.params)}"
+        self.params[name] = value
+        return f"%({name})s"
+
+    def node(self, node: Node) -> str:
+        if isinstance(node, BoolOp):
+            joiner = " AND " if node.op == "and" else " OR "
+            return "(" + joiner.join(self.node(i) for i in node.items) + ")"
+        if node.field == "event_type":
+            if len(node.values) == 1:
+                return f"event_type = {self.param(node.values[0].text)}"
+            return f"event_type = ANY({self.param([v.text for v in node.values])})"
+        promoted = self.promoted(node)
+        if promoted is not None:
+            return promoted
+        if node.op in ("=", "in"):
+            # кожен кандидат — окремий @>: планувальник об'єднує їх через BitmapOr по GIN
+            parts = [
+                f"properties @> {self.param(json.dumps({node.key: jv}))}::jsonb"
+                for v in node.values
+                for jv in v.json_values()
+            ]
+            return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+        # порівняння: лише числові значення ключа; рядки/відсутній ключ — не підходять
+        path = f'$."{node.key}" ? (@ {node.op} $v)'
+        return f"jsonb_path_exists(properties, '{path}', {self.param(json.dumps({'v': node.values[0].number()}))}::jsonb)"
+
+
+    def promoted(self, node: Predicate) -> Optional[str]:
+        """Предикат по promoted-колонці (btree (col, occurred_at)) або None, якщо не підходить."""
+        type_ = _promoted.get(node.key)
+        if type_ is None:
+            return None
+        col = f'"prop_{node.key}"'
+        # явний тип параметра — інакше порівняння numeric з float8 обходить індекс
+        if node.op in _CMP_OPS:
+            if type_ != "numeric":
+                return None
+            return f"{col} {node.op} {self.param(Decimal(node.values[0].text))}::numeric"
+        values: List[Any] = []
+        rest: List[Any] = []
+        for v in node.values:
+            for jv in v.json_values():
+                if type_ == "text" and isinstance(jv, str):
+                    values.append(jv)
+                elif type_ == "numeric" and isinstance(jv, (int, float)) and not isinstance(jv, bool):
+                    values.append(Decimal(v.text))
+                elif type_ == "boolean" and isinstance(jv, bool):
+                    values.append(jv)
+                else:
+                    rest.append(jv)
+        if not values:
+            return None
+        if len(values) == 1:
+            parts = [f"{col} = {self.param(values[0])}::{type_}"]
+        else:
+            parts = [f"{col} = ANY({self.param(values)}::{type_}[])"]
+        parts += [f"properties @> {self.param(json.dumps({node.key: jv}))}::jsonb" for jv in rest]
+        return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+def compile_segment(node: Optional[Node]) -> Tuple[str, Dict[str, Any]]:
+    """AST -> (SQL-вираз, params); для None — ("", {})."""
+    if node is None:
+        return "", {}
+    c = _Compiler()
+    return c.node(node), c.params
+
 
 def build_segment_filter(segment: Optional[str]) -> Tuple[str, Dict[str, Any]]:
     """
     Повертає (sql_snippet, params) для WHERE.
     Приклади:
-      - "event_type:purchase" -> "AND event_type = %(seg_event_type)s", {"seg_event_type": "purchase"}
-      - "properties.country=UA" -> "AND properties ->> 'country' = %(seg_prop_val)s", {"seg_prop_val": "UA"}
+      - "event_type:purchase" -> "AND event_type = %(seg_p0)s", {"seg_p0": "purchase"}
+      - "properties.country=UA" -> "AND properties @> %(seg_p0)s::jsonb", {"seg_p0": '{"country": "UA"}'}
     """
-    if not segment:
+    sql, params = compile_segment(parse_segment(segment))
+    if not sql:
         return "", {}
+    return f"AND {sql}", params
 
-    s = segment.strip()
-    # event_type:<value>
-    if s.startswith("event_type:"):
-        val = s.split(":", 1)[1].strip()
-        return "AND event_type = %(seg_event_type)s", {"seg_event_type": val}
-
-    # properties.<key>=<value>
-    if s.startswith("properties."):
-        body = s[len("properties.") :]
-        if "=" not in body:
-            return "", {}
-        key, val = body.split("=", 1)
-        key = key.strip()
-        if not _KEY_RE.match(key):
-            
-            return "", {}
-        return f"AND properties ->> '{key}' = %(seg_prop_val)s", {"seg_prop_val": val.strip()}
-
-    
-    return "", {}
+
+# ----- DuckDB (холодний шар, properties — JSON-текст у Parquet) -----
+
+_JSON_NUMBER_TYPES = "('BIGINT', 'UBIGINT', 'HUGEINT', 'DOUBLE')"
+
+
+class _DuckDBCompiler(_Compiler):
+    """Та сама семантика, що й у Postgres: рівність — з урахуванням JSON-типу, порівняння — лише числа."""
+
+    def param(self, value: Any) -> str:
+        name = f"seg_p{len(self.params)}"
+        self.params[name] = value
+        return f"${name}"
+
+    def node(self, node: Node) -> str:
+        if isinstance(node, BoolOp):
+            joiner = " AND " if node.op == "and" else " OR "
+            return "(" + joiner.join(self.node(i) for i in node.items) + ")"
+        if node.field == "event_type":
+            if len(node.values) == 1:
+                return f"event_type = {self.param(node.values[0].text)}"
+            return f"list_contains({self.param([v.text for v in node.values])}, event_type)"
+        path = f"'$.\"{node.key}\"'"
+        type_ = f"json_type(properties, {path})"
+        if node.op in ("=", "in"):
+            parts = [self.equals(path, type_, jv) for v in node.values for jv in v.json_values()]
+            return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+        return (
+            f"({type_} IN {_JSON_NUMBER_TYPES} AND "
+            f"CAST(json_extract(properties, {path}) AS DOUBLE) {node.op} {self.param(node.values[0].number())})"
+        )
+
+    def equals(self, path: str, type_: str, value: Any) -> str:
+        if isinstance(value, bool):
+            return f"({type_} = 'BOOLEAN' AND json_extract_string(properties, {path}) = '{str(value).lower()}')"
+        if isinstance(value, (int, float)):
+            return (
+                f"({type_} IN {_JSON_NUMBER_TYPES} AND "
+                f"CAST(json_extract(properties, {path}) AS DOUBLE) = {self.param(float(value))})"
+            )
+        return f"({type_} = 'VARCHAR' AND json_extract_string(properties, {path}) = {self.param(value)})"
+
+
+def compile_segment_duckdb(node: Optional[Node]) -> Tuple[str, Dict[str, Any]]:
+    """AST -> (вираз для DuckDB з $-параметрами, params); для None — ("", {})."""
+    if node is None:
+        return "", {}
+    c = _DuckDBCompiler()
+    return c.node(node), c.params
@@ -1,7 +1,20 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 import os
 
+
+def _renamed(new: str, old: str, default: str) -> str:
+    """Значення змінної new; лише старе ім'я — помилка старту, а не мовчки втрачений ліміт."""
+    if old in os.environ and new not in os.environ:
+        raise RuntimeError(
+            f"{old} is no longer read: use {new} (rate limit tokens are now events, not requests)"
+        )
+    return os.getenv(new, default)
+
+
 class Settings(BaseModel):
+    # значення з env приходять як default — без цього pattern/gt не перевірялись би
+    model_config = ConfigDict(validate_default=True)
+
     app_name: str = "events-analytics"
     env: str = Field(default=os.getenv("ENV", "dev"))
     log_level: str = Field(default=os.getenv("LOG_LEVEL", "INFO"))
@@ -13,12 +26,83 @@ class Settings(BaseModel):
     db_name: str = Field(default=os.getenv("POSTGRES_DB", "events"))
     db_pool_min: int = Field(default=int(os.getenv("DB_POOL_MIN", "1")))
     db_pool_max: int = Field(default=int(os.getenv("DB_POOL_MAX", "10")))
+    db_pool_timeout: float = Field(default=float(os.getenv("DB_POOL_TIMEOUT", "5")))  # очікування на вільне з'єднання, сек
+    db_pool_max_idle: float = Field(default=float(os.getenv("DB_POOL_MAX_IDLE", "300")))
+    db_pool_drain_timeout: float = Field(default=float(os.getenv("DB_POOL_DRAIN_TIMEOUT", "10")))
+    # Окремі DSN (libpq URL або key=value); порожній write — з POSTGRES_*, порожній read — читання з primary
+    db_write_dsn: str = Field(default=os.getenv("DATABASE_WRITE_URL", ""))
+    db_read_dsn: str = Field(default=os.getenv("DATABASE_READ_URL", ""))
+    db_read_pool_max: int = Field(default=int(os.getenv("DB_READ_POOL_MAX", "10")))
+    db_read_timeout: float = Field(default=float(os.getenv("DB_READ_TIMEOUT", "1")))  # довше — йдемо на primary
+    db_read_failover: float = Field(default=float(os.getenv("DB_READ_FAILOVER", "30")))  # сек. без спроб репліки після збою
+    db_read_max_staleness: float = Field(default=float(os.getenv("DB_READ_MAX_STALENESS", "0")))  # 0 — не перевіряти
+
+    # Партиціювання events по occurred_at: none | day | week | month
+    events_partition_interval: str = Field(
+        default=os.getenv("EVENTS_PARTITION_INTERVAL", "month"),
+        pattern="^(none|day|week|month)$",
+    )
+    events_partitions_ahead: int = Field(default=int(os.getenv("EVENTS_PARTITIONS_AHEAD", "3")))
+    # Інгест створює партиції лише для днів у цьому вікні від сьогодні; решта — у events_default
+    events_partition_past_days: int = Field(default=int(os.getenv("EVENTS_PARTITION_PAST_DAYS", "3650")))
+    events_partition_future_days: int = Field(default=int(os.getenv("EVENTS_PARTITION_FUTURE_DAYS", "366")))
+
+    # Швидкий шлях декодування POST /events (validate_json у TypedDict замість EventIn)
+    ingest_fast_path: bool = Field(default=os.getenv("INGEST_FAST_PATH", "0") == "1")
+    # Write-behind буфер: POST /events -> 202, фоновий флаш великими батчами
+    ingest_async: bool = Field(default=os.getenv("INGEST_ASYNC", "0") == "1")
+    ingest_buffer_max_events: int = Field(default=int(os.getenv("INGEST_BUFFER_MAX_EVENTS", "100000")))
+    ingest_flush_events: int = Field(default=int(os.getenv("INGEST_FLUSH_EVENTS", "5000")))
+    ingest_flush_interval: float = Field(default=float(os.getenv("INGEST_FLUSH_INTERVAL", "0.2")))  # сек
+    # POST /events/stream: скільки валідних рядків NDJSON пишеться одним батчем
+    ingest_stream_chunk: int = Field(default=int(os.getenv("INGEST_STREAM_CHUNK", "1000")))
+
+    # Ключі properties з окремими типізованими колонками: "country:text,price:numeric"
+    # (типи: text | numeric | boolean); порожньо — вимкнено. Старі рядки й індекси —
+    # `python -m app.cli promote_properties`, до того сегменти йдуть у JSONB.
+    promoted_properties: str = Field(default=os.getenv("PROMOTED_PROPERTIES", ""))
+
+    # GET /events/export: рядків на один fetch серверного курсора
+    export_fetch_size: int = Field(default=int(os.getenv("EXPORT_FETCH_SIZE", "5000")))
+
+    # Холодний шар: закриті дні в Parquet (порожньо — вимкнено; потрібні duckdb і pyarrow)
+    cold_storage_dir: str = Field(default=os.getenv("COLD_STORAGE_DIR", ""))
+
+    # Кеш результатів /stats (in-process LRU + TTL, інвалідація по днях при інгесті)
+    stats_cache_enabled: bool = Field(default=os.getenv("STATS_CACHE_ENABLED", "1") == "1")
+    stats_cache_max_entries: int = Field(default=int(os.getenv("STATS_CACHE_MAX_ENTRIES", "1024")))
+    stats_cache_max_bytes: int = Field(default=int(os.getenv("STATS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+    stats_cache_ttl: float = Field(default=float(os.getenv("STATS_CACHE_TTL", "60")))
+    # стільки секунд після інвалідації дня його перерахунок читає primary, а не репліку (0 — вимкнено)
+    stats_cache_primary_window: float = Field(default=float(os.getenv("STATS_CACHE_PRIMARY_WINDOW", "10")))
+
+    # Повільні запити /stats: поріг, розмір кільця, частка з EXPLAIN ANALYZE (0 — без повторного виконання;
+    # без DATABASE_READ_URL EXPLAIN ANALYZE ще раз виконує повільний запит на primary)
+    slow_query_ms: float = Field(default=float(os.getenv("SLOW_QUERY_MS", "500")))  # 0 — вимкнено
+    slow_query_ring_size: int = Field(default=int(os.getenv("SLOW_QUERY_RING_SIZE", "100")))
+    slow_query_explain_sample: float = Field(default=float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0")))
+    slow_query_explain_timeout: float = Field(default=float(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT", "30")))  # сек
+
+    # /debug/* (slow-queries: SQL і сирі параметри сегментів) — лише якщо явно увімкнено
+    debug_endpoints: bool = Field(default=os.getenv("DEBUG_ENDPOINTS", "0") == "1")
 
     # Metrics
     enable_metrics: bool = Field(default=os.getenv("ENABLE_METRICS", "1") == "1")
 
-    # Rate limit (буде використано на етапі 4)
-    rate_limit_rps: int = Field(default=int(os.getenv("RATE_LIMIT_RPS", "20")))
-    rate_limit_burst: int = Field(default=int(os.getenv("RATE_LIMIT_BURST", "40")))
+    # Rate limit інгесту: токени = події (ціна запиту оцінюється з Content-Length)
+    # (колишні RATE_LIMIT_RPS / RATE_LIMIT_BURST рахували запити — їх не перетлумачуємо)
+    rate_limit_events_per_sec: int = Field(
+        default=int(_renamed("RATE_LIMIT_EVENTS_PER_SEC", "RATE_LIMIT_RPS", "20000")), gt=0,
+    )
+    rate_limit_events_burst: int = Field(
+        default=int(_renamed("RATE_LIMIT_EVENTS_BURST", "RATE_LIMIT_BURST", "50000")), gt=0,
+    )
+    rate_limit_bytes_per_event: int = Field(default=int(os.getenv("RATE_LIMIT_BYTES_PER_EVENT", "200")), gt=0)
+    rate_limit_max_keys: int = Field(default=int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+    # memory (на процес) | postgres (спільні бакети для всіх воркерів)
+    rate_limit_backend: str = Field(
+        default=os.getenv("RATE_LIMIT_BACKEND", "memory"),
+        pattern="^(memory|postgres)$",
+    )
 
 settings = Settings()
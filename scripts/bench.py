@@ -0,0 +1,378 @@
+"""
+Наскрізний бенчмарк сервісу на локальному Postgres з JSON-результатом і порівнянням з baseline.
+
+Навантаження:
+  import — CLI import_events (COPY + merge) для кількох batch size, rows/s;
+  ingest — POST /events через ASGITransport (або --base-url запущеного uvicorn)
+           з конкурентністю 1/8/32: events/s і p50/p95/p99 латентності;
+  stats  — латентність кожного /stats/* (кеш вимкнено) на 100k / 1M / 10M рядків.
+
+Бенч працює в окремій базі <POSTGRES_DB>_bench (створюється за потреби) і чистить її між прогонами.
+
+    python scripts/bench.py run --out bench.json
+    python scripts/bench.py run --workloads stats --stats-sizes 100000 1000000 --baseline bench.json
+    python scripts/bench.py compare bench.json new.json --threshold 0.1
+
+compare (і run --baseline) завершується з кодом 1, якщо якась метрика погіршилась більше ніж на threshold.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg  # noqa: E402
+from httpx import AsyncClient, ASGITransport  # noqa: E402
+
+from app.shared.settings import settings  # noqa: E402
+
+START = date(2025, 8, 1)
+DAYS = 30
+EVENT_TYPES = ["signin", "view", "click", "purchase"]
+COUNTRIES = ["UA", "PL", "DE", "US", "GB"]
+
+Metric = Dict[str, Any]
+
+
+def metric(name: str, value: float, unit: str, better: str) -> Metric:
+    return {"name": name, "value": round(value, 3), "unit": unit, "better": better}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def latency_metrics(prefix: str, samples: List[float]) -> List[Metric]:
+    return [
+        metric(f"{prefix}.p{int(q * 100)}_ms", percentile(samples, q) * 1000, "ms", "lower")
+        for q in (0.5, 0.95, 0.99)
+    ]
+
+
+# ---------- база ----------
+
+async def use_bench_database(name: Optional[str]) -> str:
+    """Перемикає settings на окрему базу (створює її), щоб TRUNCATE не зачепив робочі дані."""
+    from app.infrastructure import db
+
+    name = name or f"{settings.db_name}_bench"
+    admin = await psycopg.AsyncConnection.connect(db._conninfo(), autocommit=True)
+    try:
+        cur = await admin.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (name,))
+        if await cur.fetchone() is None:
+            await admin.execute(f'CREATE DATABASE "{name}" ENCODING \'UTF8\' TEMPLATE template0;')
+    finally:
+        await admin.close()
+    settings.db_name = name
+    await db.ensure_migrations()
+    return name
+
+
+async def truncate() -> None:
+    from app.infrastructure.db import get_conn
+    from app.infrastructure.rollups import ROLLUP_TABLES
+
+    conn = await get_conn()
+    await conn.execute(
+        f"TRUNCATE TABLE events, batch_uploads, import_checkpoints, {', '.join(ROLLUP_TABLES)}, user_first_seen;"
+    )
+
+
+# ---------- import ----------
+
+def write_csv(path: Path, n: int, users: int, seed: int) -> None:
+    rnd = random.Random(seed)
+    start = datetime.combine(START, datetime.min.time(), tzinfo=timezone.utc)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["event_id", "occurred_at", "user_id", "event_type", "properties_json"])
+        for _ in range(n):
+            ts = start + timedelta(seconds=rnd.randrange(DAYS * 86400))
+            props = {"country": rnd.choice(COUNTRIES), "rand": rnd.randrange(1000)}
+            w.writerow([
+                str(UUID(int=rnd.getrandbits(128), version=4)), ts.isoformat(),
+                f"u{rnd.randint(1, users)}", rnd.choice(EVENT_TYPES), json.dumps(props),
+            ])
+
+
+async def bench_import(args: argparse.Namespace) -> List[Metric]:
+    from app.cli.main import _run_import
+
+    out: List[Metric] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.csv"
+        write_csv(path, args.import_rows, users=max(1000, args.import_rows // 10), seed=args.seed)
+        for batch_size in args.batch_sizes:
+            await truncate()
+            started = time.perf_counter()
+            await _run_import(str(path), None, batch_size, None, writers=args.import_writers)
+            elapsed = time.perf_counter() - started
+            out.append(metric(f"import.batch_{batch_size}.rows_per_sec", args.import_rows / elapsed, "rows/s", "higher"))
+            log(f"import batch={batch_size}: {args.import_rows / elapsed:,.0f} rows/s")
+    return out
+
+
+# ---------- ingest ----------
+
+def make_bodies(n_requests: int, batch: int, rnd: random.Random) -> List[bytes]:
+    start = datetime.combine(START, datetime.min.time(), tzinfo=timezone.utc)
+    bodies = []
+    for _ in range(n_requests):
+        bodies.append(json.dumps([
+            {
+                "event_id": str(UUID(int=rnd.getrandbits(128), version=4)),
+                "occurred_at": (start + timedelta(seconds=rnd.randrange(DAYS * 86400))).isoformat(),
+                "user_id": f"u{rnd.randint(1, 10_000)}",
+                "event_type": rnd.choice(EVENT_TYPES),
+                "properties": {"country": rnd.choice(COUNTRIES), "rand": rnd.randrange(1000)},
+            }
+            for _ in range(batch)
+        ]).encode())
+    return bodies
+
+
+def make_client(base_url: Optional[str]) -> AsyncClient:
+    if base_url:
+        return AsyncClient(base_url=base_url, timeout=60)
+    from app.main import app
+
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+
+async def bench_ingest(args: argparse.Namespace) -> List[Metric]:
+    rnd = random.Random(args.seed)
+    out: List[Metric] = []
+    async with make_client(args.base_url) as client:
+        for concurrency in args.concurrency:
+            await truncate()
+            bodies = make_bodies(args.ingest_requests, args.ingest_batch, rnd)
+            latencies: List[float] = []
+            pending = iter(bodies)
+
+            async def worker():
+                for body in pending:
+                    t0 = time.perf_counter()
+                    r = await client.post("/events", content=body, headers={"Content-Type": "application/json"})
+                    latencies.append(time.perf_counter() - t0)
+                    if r.status_code not in (201, 202):
+                        raise RuntimeError(f"POST /events -> {r.status_code}: {r.text[:200]}")
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            prefix = f"ingest.c{concurrency}.batch_{args.ingest_batch}"
+            events_per_sec = len(bodies) * args.ingest_batch / elapsed
+            out.append(metric(f"{prefix}.events_per_sec", events_per_sec, "events/s", "higher"))
+            out.extend(latency_metrics(prefix, latencies))
+            log(f"ingest c={concurrency}: {events_per_sec:,.0f} events/s, p95={percentile(latencies, 0.95) * 1000:.1f} ms")
+    return out
+
+
+# ---------- stats ----------
+
+GROW_SQL = """
+INSERT INTO events (event_id, occurred_at, user_id, event_type, properties)
+SELECT
+    md5('bench:' || g)::uuid,
+    %(start)s::timestamptz + random() * %(days)s * interval '1 day',
+    'u' || (1 + floor(random() * %(users)s))::int,
+    (ARRAY['signin', 'view', 'click', 'purchase'])[1 + floor(random() * 4)::int],
+    jsonb_build_object(
+        'country', (ARRAY['UA', 'PL', 'DE', 'US', 'GB'])[1 + floor(random() * 5)::int],
+        'rand', floor(random() * 1000)::int
+    )
+FROM generate_series(%(lo)s::bigint, %(hi)s::bigint) AS g
+ON CONFLICT DO NOTHING;
+"""
+
+STATS_QUERIES = {
+    "dau": "/stats/dau?from={lo}&to={hi}",
+    "dau_approx": "/stats/dau?from={lo}&to={hi}&approx=true",
+    "dau_segment": "/stats/dau?from={lo}&to={hi}&segment=event_type:purchase AND properties.country=UA",
+    "active_users": "/stats/active-users?from={lo}&to={hi}",
+    "top_events": "/stats/top-events?from={lo}&to={hi}&limit=10",
+    "retention": "/stats/retention?start_date={lo}&windows=3",
+    "retention_matrix": "/stats/retention/matrix?from={lo}&cohorts=4&windows=4&window_size=weekly",
+}
+
+
+async def grow_to(n: int, have: int, seed: int) -> None:
+    """Дописує рядки have..n одним SQL (детерміновано по seed) і перераховує rollups."""
+    from app.infrastructure import partitions
+    from app.infrastructure.db import get_conn
+    from app.infrastructure.rollups import rebuild_rollups
+
+    conn = await get_conn()
+    await partitions.ensure_partitions(conn, START, START + timedelta(days=DAYS))
+    await conn.execute("SELECT setseed(%s);", (((seed % 1000) / 1000.0),))
+    step = 1_000_000
+    for lo in range(have, n, step):
+        hi = min(n, lo + step) - 1
+        await conn.execute(GROW_SQL, {
+            "start": START, "days": DAYS, "users": max(10_000, n // 20), "lo": lo, "hi": hi,
+        })
+        log(f"  loaded {hi + 1:,} rows")
+    await rebuild_rollups(conn)
+    await conn.execute("ANALYZE events;")
+
+
+async def bench_stats(args: argparse.Namespace) -> List[Metric]:
+    settings.stats_cache_enabled = False
+    lo, hi = START, START + timedelta(days=DAYS - 1)
+    out: List[Metric] = []
+    await truncate()
+    have = 0
+    async with make_client(args.base_url) as client:
+        for n in sorted(args.stats_sizes):
+            await grow_to(n, have, args.seed)
+            have = n
+            for name, url in STATS_QUERIES.items():
+                url = url.format(lo=lo, hi=hi)
+                latencies = []
+                for i in range(args.stats_repeat + 1):
+                    t0 = time.perf_counter()
+                    r = await client.get(url)
+                    if r.status_code != 200:
+                        raise RuntimeError(f"GET {url} -> {r.status_code}: {r.text[:200]}")
+                    if i:  # перший запит — прогрів
+                        latencies.append(time.perf_counter() - t0)
+                out.extend(latency_metrics(f"stats.{name}.rows_{n}", latencies)[:2])
+                log(f"stats {name} rows={n:,}: p50={percentile(latencies, 0.5) * 1000:.1f} ms")
+    return out
+
+
+WORKLOADS: Dict[str, Callable[[argparse.Namespace], Awaitable[List[Metric]]]] = {
+    "import": bench_import,
+    "ingest": bench_ingest,
+    "stats": bench_stats,
+}
+
+
+# ---------- run / compare ----------
+
+def log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.infrastructure.db import get_conn, shutdown
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # ліміт інгесту міряє не те, що треба; middleware читає settings на першому запиті
+    settings.rate_limit_events_per_sec = settings.rate_limit_events_burst = 10**12
+    database = await use_bench_database(args.database)
+    conn = await get_conn()
+    server_version = (await (await conn.execute("SHOW server_version;")).fetchone())["server_version"]
+
+    metrics: List[Metric] = []
+    try:
+        for name in args.workloads:
+            log(f"== {name}")
+            metrics.extend(await WORKLOADS[name](args))
+    finally:
+        await shutdown()
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "postgres": server_version,
+            "database": database,
+            "partition_interval": settings.events_partition_interval,
+            "args": {k: v for k, v in vars(args).items() if k not in ("func", "baseline", "out")},
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Друкує таблицю змін; повертає кількість регресій (гірше більше ніж на threshold)."""
+    base = {m["name"]: m for m in baseline["metrics"]}
+    regressions = 0
+    print(f"{'metric':<52} {'baseline':>12} {'current':>12} {'change':>8}")
+    for m in current["metrics"]:
+        b = base.get(m["name"])
+        if b is None or not b["value"]:
+            print(f"{m['name']:<52} {'-':>12} {m['value']:>12,.1f} {'new':>8}")
+            continue
+        change = (m["value"] - b["value"]) / b["value"]
+        worse = -change if m["better"] == "higher" else change
+        flag = ""
+        if worse > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{m['name']:<52} {b['value']:>12,.1f} {m['value']:>12,.1f} {change:>+7.1%}{flag}")
+    print(f"{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="прогнати навантаження й записати JSON")
+    r.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    r.add_argument("--out", type=Path, default=None, help="куди записати JSON (інакше stdout)")
+    r.add_argument("--baseline", type=Path, default=None, help="одразу порівняти з цим JSON")
+    r.add_argument("--threshold", type=float, default=0.10)
+    r.add_argument("--database", default=None, help="база для бенчу (за замовчуванням <POSTGRES_DB>_bench)")
+    r.add_argument("--base-url", default=None, help="бити в запущений сервер замість ASGITransport")
+    r.add_argument("--seed", type=int, default=42)
+    r.add_argument("--import-rows", type=int, default=100_000)
+    r.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 2_000, 10_000])
+    r.add_argument("--import-writers", type=int, default=1)
+    r.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    r.add_argument("--ingest-requests", type=int, default=200)
+    r.add_argument("--ingest-batch", type=int, default=100)
+    r.add_argument("--stats-sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    r.add_argument("--stats-repeat", type=int, default=10)
+
+    c = sub.add_parser("compare", help="порівняти два JSON-результати")
+    c.add_argument("baseline", type=Path)
+    c.add_argument("current", type=Path)
+    c.add_argument("--threshold", type=float, default=0.10, help="допустиме погіршення (0.10 = 10%%)")
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        regressions = compare(json.loads(args.baseline.read_text()), json.loads(args.current.read_text()), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    # CLI імпорту друкує прогрес у stdout — там має лишитись тільки JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2, default=str)
+    if args.out:
+        args.out.write_text(text + "\n")
+        log(f"[OK] results -> {args.out}")
+    else:
+        print(text)
+    if args.baseline:
+        sys.exit(1 if compare(json.loads(args.baseline.read_text()), result, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
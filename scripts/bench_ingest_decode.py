@@ -0,0 +1,81 @@
+"""
+Мікробенчмарк декодування/валідації тіла POST /events (без БД).
+
+stock — що робить FastAPI: json.loads + List[EventIn] (з ensure_tz) + кортежі для INSERT.
+fast  — INGEST_FAST_PATH=1: validate_json у TypedDict одразу з байтів.
+
+    python scripts/bench_ingest_decode.py --sizes 100 1000 10000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, List
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.api import ingest_decode  # noqa: E402
+from app.api.routes_events import EventIn, _row  # noqa: E402
+
+_STOCK = TypeAdapter(List[EventIn])
+
+
+def make_body(n: int) -> bytes:
+    start = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    events = []
+    for i in range(n):
+        ts = start + timedelta(seconds=random.randint(0, 30 * 86400))
+        events.append({
+            "event_id": str(uuid4()),
+            # половина — "naive", щоб ensure_tz/нормалізація реально працювали
+            "occurred_at": ts.replace(tzinfo=None).isoformat() if i % 2 else ts.isoformat(),
+            "user_id": f"u{random.randint(1, 10_000)}",
+            "event_type": random.choice(["signin", "view", "click", "purchase"]),
+            "properties": {"country": random.choice(["UA", "PL", "DE"]), "rand": random.randint(0, 999)},
+        })
+    return json.dumps(events).encode()
+
+
+def stock(body: bytes):
+    return [_row(e) for e in _STOCK.validate_python(json.loads(body))]
+
+
+def fast(body: bytes):
+    return ingest_decode.decode_events(body)
+
+
+def bench(fn: Callable[[bytes], object], body: bytes, n: int, min_time: float) -> float:
+    fn(body)  # прогрів
+    runs, started = 0, time.perf_counter()
+    while True:
+        fn(body)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return runs * n / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    ap.add_argument("--min-time", type=float, default=1.0, help="секунд на кожне вимірювання")
+    args = ap.parse_args()
+
+    random.seed(42)
+    print(f"{'batch':>8} {'stock ev/s':>12} {'fast ev/s':>12} {'speedup':>8}")
+    for n in args.sizes:
+        body = make_body(n)
+        assert stock(body) == fast(body)
+        s = bench(stock, body, n, args.min_time)
+        f = bench(fast, body, n, args.min_time)
+        print(f"{n:>8} {s:>12,.0f} {f:>12,.0f} {f / s:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
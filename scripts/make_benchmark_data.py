@@ -1,41 +1,274 @@
-import csv
-import json
-import random
-from datetime import datetime, timedelta, timezone
-from uuid import uuid4
+"""
+Синтетичні події для бенчмарків: векторизовано (numpy) чанками, у кількох процесах, у шарди.
+
+Розподіли, близькі до реальних:
+  - активність користувачів — Zipf (--zipf; 0 = рівномірно), країна фіксована на користувача;
+  - реєстрація рівномірно по вікну, далі retention decay: вік події в днях від реєстрації ~ Lomax(--decay);
+  - churn: кожен день користувач іде назавжди з імовірністю --churn;
+  - добова крива: пік активності о --peak-hour UTC (--diurnal — амплітуда);
+  - типи подій нерівномірні (view > click > signin > purchase).
+
+Той самий --seed і --shards дають побайтово ті самі файли (незалежно від --procs).
+--format pgcopy пише бінарний COPY, що вантажиться напряму (rollups потім — rebuild_rollups):
+
+    python scripts/make_benchmark_data.py --n 100000 --out data/bench_100k.csv
+    python scripts/make_benchmark_data.py --n 100000000 --shards 64 --procs 8 --out data/bench_100m.csv --format both
+    \\copy events (event_id, occurred_at, user_id, event_type, properties) FROM 'data/bench_100m-00000.pgcopy' WITH (FORMAT binary)
+"""
 import argparse
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+EVENT_TYPES = np.array(["view", "click", "signin", "purchase"])
+EVENT_TYPE_P = np.array([0.55, 0.27, 0.13, 0.05])
+COUNTRIES = np.array(["UA", "PL", "DE", "US", "GB"])
+COUNTRY_P = np.array([0.4, 0.2, 0.15, 0.15, 0.1])
+
+PG_EPOCH = 946684800  # 2000-01-01T00:00:00Z у unix-секундах
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+
+@dataclass
+class Spec:
+    start: int  # unix-секунди початку вікна (UTC, північ)
+    days: int
+    users: int
+    zipf: float
+    decay: float
+    churn: float
+    diurnal: float
+    peak_hour: int
+    seed: int
+    chunk: int
+    formats: Tuple[str, ...]
+
+
+class Users:
+    """Модель користувачів — однакова в усіх процесах (будується з того самого seed)."""
+
+    def __init__(self, spec: Spec) -> None:
+        rng = np.random.default_rng(np.random.SeedSequence([spec.seed, 0]))
+        n = spec.users
+        ranks = rng.permutation(n) + 1
+        weight = ranks ** -spec.zipf if spec.zipf > 0 else np.ones(n)
+        self.signup = rng.integers(0, spec.days, size=n)
+        # останній можливий день активності (вік): до кінця вікна або до churn
+        horizon = spec.days - 1 - self.signup
+        if spec.churn > 0:
+            horizon = np.minimum(horizon, rng.geometric(spec.churn, size=n) - 1)
+        self.horizon = horizon
+        # вага = Zipf × частка retention-кривої, що влазить у горизонт,
+        # щоб користувач з коротким горизонтом не стискав усю активність у кілька днів
+        self.mass = 1.0 - (horizon + 2.0) ** -spec.decay
+        cdf = np.cumsum(weight * self.mass)
+        self.cdf = cdf / cdf[-1]
+        self.country = rng.choice(len(COUNTRIES), size=n, p=COUNTRY_P)
+
+
+def _hour_cdf(spec: Spec) -> np.ndarray:
+    hours = np.arange(24)
+    w = 1.0 + spec.diurnal * np.cos(2 * np.pi * (hours - spec.peak_hour) / 24)
+    cdf = np.cumsum(w)
+    return cdf / cdf[-1]
+
+
+def _chunk(rng: np.random.Generator, spec: Spec, users: Users, hour_cdf: np.ndarray, m: int) -> dict:
+    uid = np.searchsorted(users.cdf, rng.random(m), side="right")
+    # вік події ~ Lomax(decay), обрізаний до горизонту користувача (інверсія обрізаної CDF)
+    u = rng.random(m) * users.mass[uid]
+    age = np.minimum(np.floor((1.0 - u) ** (-1.0 / spec.decay) - 1.0).astype(np.int64), users.horizon[uid])
+    hour = np.searchsorted(hour_cdf, rng.random(m), side="right")
+
+    raw = rng.integers(0, 256, size=(m, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # UUID v4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return {
+        "uuid": raw,
+        "day": users.signup[uid] + age,
+        "second": hour * 3600 + rng.integers(0, 3600, size=m),
+        "user": uid + 1,
+        "type": rng.choice(len(EVENT_TYPES), size=m, p=EVENT_TYPE_P),
+        "country": users.country[uid],
+        "rand": rng.integers(0, 1000, size=m),
+    }
+
+
+# ----- форматування: усе — матриці байтів (m, width) + довжини, склеєні одним scatter -----
+
+Col = Tuple[np.ndarray, Optional[np.ndarray]]  # (байти (m|1, w), довжини або None = повна ширина)
+
+
+def _const(b: bytes) -> Col:
+    return np.frombuffer(b, dtype=np.uint8)[None, :], None
+
+
+def _fixed(values: np.ndarray, dtype: str) -> Col:
+    return np.ascontiguousarray(values, dtype=dtype).view(np.uint8).reshape(len(values), -1), None
+
+
+def _choice(labels: np.ndarray, idx: np.ndarray) -> Col:
+    """Рядок із малого словника за індексом (типи подій, країни)."""
+    b = labels.astype("S")
+    return np.frombuffer(b.tobytes(), np.uint8).reshape(len(b), b.itemsize)[idx], np.char.str_len(b)[idx]
+
+
+def _digits(x: np.ndarray) -> Col:
+    """Десятковий запис невід'ємних цілих, вирівняний уліво."""
+    n = np.maximum(1, np.floor(np.log10(np.maximum(x, 1))).astype(np.int64) + 1)
+    width = int(n.max())
+    shift = np.maximum(n[:, None] - 1 - np.arange(width)[None, :], 0)
+    return ((x[:, None] // 10 ** shift) % 10 + ord("0")).astype(np.uint8), n
+
+
+def _uuid_text(raw: np.ndarray) -> Col:
+    hexed = np.frombuffer(raw.tobytes().hex().encode(), dtype=np.uint8).reshape(-1, 32)
+    out = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+    out[:, [i for i in range(36) if i not in (8, 13, 18, 23)]] = hexed
+    return out, None
+
+
+def _timestamp_text(spec: Spec, day: np.ndarray, second: np.ndarray) -> Col:
+    """YYYY-MM-DDTHH:MM:SS+00:00: дата — з таблиці днів вікна, час — арифметикою."""
+    dates = np.datetime_as_string(
+        np.datetime64(spec.start, "s").astype("datetime64[D]") + np.arange(spec.days), unit="D"
+    ).astype("S10")
+    out = np.empty((len(day), 25), dtype=np.uint8)
+    out[:, :10] = np.frombuffer(dates.tobytes(), np.uint8).reshape(-1, 10)[day]
+    out[:, 10:] = np.frombuffer(b"T00:00:00+00:00", np.uint8)
+    for pos, part in ((11, second // 3600), (14, second // 60 % 60), (17, second % 60)):
+        out[:, pos] += (part // 10).astype(np.uint8)
+        out[:, pos + 1] += (part % 10).astype(np.uint8)
+    return out, None
+
+
+def _pack(m: int, cols: List[Col]) -> bytes:
+    """
+    Склеює колонки в рядки: усі колонки поруч у широкій матриці, маска відкидає
+    вирівнювання — вибірка за маскою в порядку рядків і є готовий потік байтів.
+    """
+    mats, keep = [], []
+    for mat, lens in cols:
+        mats.append(np.broadcast_to(mat, (m, mat.shape[1])))
+        width = np.arange(mat.shape[1])[None, :]
+        keep.append(np.broadcast_to(width < (mat.shape[1] if lens is None else lens[:, None]), (m, mat.shape[1])))
+    return np.concatenate(mats, axis=1)[np.concatenate(keep, axis=1)].tobytes()
+
+
+def _csv(spec: Spec, c: dict) -> bytes:
+    m = len(c["day"])
+    return _pack(m, [
+        _uuid_text(c["uuid"]), _const(b","),
+        _timestamp_text(spec, c["day"], c["second"]), _const(b",u"),
+        _digits(c["user"]), _const(b","),
+        _choice(EVENT_TYPES, c["type"]), _const(b',"{""country"": ""'),
+        _choice(COUNTRIES, c["country"]), _const(b'"", ""rand"": '),
+        _digits(c["rand"]), _const(b'}"\n'),
+    ])
+
+
+def _pgcopy(spec: Spec, c: dict) -> bytes:
+    """Кортежі бінарного COPY (event_id, occurred_at, user_id, event_type, properties)."""
+    m = len(c["day"])
+    user, user_len = _digits(c["user"])
+    etype, etype_len = _choice(EVENT_TYPES, c["type"])
+    country, country_len = _choice(COUNTRIES, c["country"])
+    rand, rand_len = _digits(c["rand"])
+    # jsonb у бінарному COPY: байт версії (1) + текст
+    props_head, props_mid, props_tail = b'\x01{"country": "', b'", "rand": ', b"}"
+    props_len = len(props_head) + country_len + len(props_mid) + rand_len + len(props_tail)
+    micros = (spec.start - PG_EPOCH + c["day"] * 86400 + c["second"]) * 1_000_000
+    return _pack(m, [
+        _const(struct.pack(">hi", 5, 16)), (c["uuid"], None),
+        _const(struct.pack(">i", 8)), _fixed(micros, ">i8"),
+        _fixed(user_len + 1, ">i4"), _const(b"u"), (user, user_len),
+        _fixed(etype_len, ">i4"), (etype, etype_len),
+        _fixed(props_len, ">i4"), _const(props_head), (country, country_len),
+        _const(props_mid), (rand, rand_len), _const(props_tail),
+    ])
+
+
+def write_shard(spec: Spec, shard: int, n: int, paths: List[Path]) -> int:
+    rng = np.random.default_rng(np.random.SeedSequence([spec.seed, 1, shard]))
+    users = Users(spec)
+    hour_cdf = _hour_cdf(spec)
+    files = {fmt: path.open("wb") for fmt, path in zip(spec.formats, paths)}
+    try:
+        if "csv" in files:
+            files["csv"].write(b"event_id,occurred_at,user_id,event_type,properties_json\n")
+        if "pgcopy" in files:
+            files["pgcopy"].write(PGCOPY_HEADER)
+        for lo in range(0, n, spec.chunk):
+            c = _chunk(rng, spec, users, hour_cdf, min(spec.chunk, n - lo))
+            if "csv" in files:
+                files["csv"].write(_csv(spec, c))
+            if "pgcopy" in files:
+                files["pgcopy"].write(_pgcopy(spec, c))
+        if "pgcopy" in files:
+            files["pgcopy"].write(PGCOPY_TRAILER)
+    finally:
+        for f in files.values():
+            f.close()
+    return n
+
+
+def shard_paths(out: Path, shards: int, formats: Tuple[str, ...]) -> List[List[Path]]:
+    ext = {"csv": ".csv", "pgcopy": ".pgcopy"}
+    if shards == 1:
+        return [[out.with_suffix(ext[f]) for f in formats]]
+    return [[out.with_name(f"{out.stem}-{i:05d}{ext[f]}") for f in formats] for i in range(shards)]
+
 
 def main():
-    ap = argparse.ArgumentParser()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     ap.add_argument("--n", type=int, default=100_000, help="кількість подій")
-    ap.add_argument("--out", type=Path, default=Path("data/bench_100k.csv"))
+    ap.add_argument("--out", type=Path, default=Path("data/bench_100k.csv"),
+                    help="файл (або префікс шардів: <stem>-00000.csv, ...)")
     ap.add_argument("--start", type=str, default="2025-08-01", help="start date (YYYY-MM-DD)")
     ap.add_argument("--days", type=int, default=30, help="скільки днів розкидати")
     ap.add_argument("--users", type=int, default=10_000, help="кількість унікальних користувачів")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--shards", type=int, default=1, help="кількість вихідних файлів")
+    ap.add_argument("--procs", type=int, default=os.cpu_count() or 1, help="процесів-генераторів")
+    ap.add_argument("--chunk", type=int, default=500_000, help="рядків на векторизований чанк")
+    ap.add_argument("--format", choices=["csv", "pgcopy", "both"], default="csv")
+    ap.add_argument("--zipf", type=float, default=0.8, help="експонента Zipf активності (0 — рівномірно)")
+    ap.add_argument("--decay", type=float, default=0.8, help="retention decay: більше — швидше відвал")
+    ap.add_argument("--churn", type=float, default=0.02, help="денна ймовірність піти назавжди")
+    ap.add_argument("--diurnal", type=float, default=0.6, help="амплітуда добової кривої (0..1)")
+    ap.add_argument("--peak-hour", type=int, default=19, help="година піку (UTC)")
     args = ap.parse_args()
 
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    spec = Spec(
+        start=int(start.timestamp()), days=args.days, users=args.users, zipf=args.zipf,
+        decay=args.decay, churn=args.churn, diurnal=args.diurnal, peak_hour=args.peak_hour,
+        seed=args.seed, chunk=args.chunk,
+        formats=("csv", "pgcopy") if args.format == "both" else (args.format,),
+    )
     args.out.parent.mkdir(parents=True, exist_ok=True)
+    paths = shard_paths(args.out, args.shards, spec.formats)
+    sizes = [args.n // args.shards + (1 if i < args.n % args.shards else 0) for i in range(args.shards)]
+
+    started = time.perf_counter()
+    procs = max(1, min(args.procs, args.shards))
+    if procs == 1:
+        total = sum(write_shard(spec, i, n, p) for i, (n, p) in enumerate(zip(sizes, paths)))
+    else:
+        with ProcessPoolExecutor(max_workers=procs) as ex:
+            total = sum(ex.map(write_shard, [spec] * args.shards, range(args.shards), sizes, paths))
+    elapsed = time.perf_counter() - started
+
+    print(f"[OK] wrote {total} rows → {len(paths)} shard(s) {paths[0][0]}… in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
 
-    start_date = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
-    event_types = ["signin", "view", "click", "purchase"]
-
-    with args.out.open("w", encoding="utf-8", newline="") as f:
-        w = csv.writer(f)
-        w.writerow(["event_id", "occurred_at", "user_id", "event_type", "properties_json"])
-
-        for i in range(args.n):
-            d = start_date + timedelta(days=random.randint(0, args.days - 1),
-                                       hours=random.randint(0, 23),
-                                       minutes=random.randint(0, 59),
-                                       seconds=random.randint(0, 59))
-            user_id = f"u{random.randint(1, args.users)}"
-            et = random.choice(event_types)
-            country = random.choice(["UA", "PL", "DE", "US", "GB"])
-            props = {"country": country, "rand": random.randint(0, 999)}
-            w.writerow([str(uuid4()), d.isoformat(), user_id, et, json.dumps(props)])
-
-    print(f"[OK] wrote {args.n} rows → {args.out}")
 
 if __name__ == "__main__":
     main()
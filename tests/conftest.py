@@ -3,19 +3,25 @@ import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 
 from app.main import app
-from app.infrastructure.db import get_conn
+from app.infrastructure.db import get_conn, ensure_migrations, shutdown
+from app.infrastructure.rollups import ROLLUP_TABLES
+from app.shared.cache import stats_cache
 
 
 @pytest_asyncio.fixture(autouse=True)
 async def _clean_db():
     """
-    Перед кожним тестом чистимо таблицю events,
-    щоб тести були детерміновані.
+    Перед кожним тестом накатуємо міграції (ідемпотентно) і чистимо events
+    разом з агрегатами, щоб тести були детерміновані.
     """
+    await ensure_migrations()
+    stats_cache.clear()
     conn = await get_conn()
     async with conn.cursor() as cur:
-        await cur.execute("TRUNCATE TABLE events;")
+        await cur.execute(f"TRUNCATE TABLE events, event_ids, batch_uploads, import_checkpoints, {', '.join(ROLLUP_TABLES)}, user_first_seen, cold_days;")
     yield
+    # пул прив'язаний до event loop конкретного тесту — закриваємо його після тесту
+    await shutdown()
 
 
 @pytest_asyncio.fixture
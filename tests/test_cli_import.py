@@ -0,0 +1,146 @@
+
+from pathlib import Path
+import pytest
+
+from app.cli import main as cli_main
+from app.cli.main import _run_import
+from app.infrastructure.db import get_conn
+
+SAMPLE = Path(__file__).resolve().parent.parent / "data" / "events_sample.csv"
+
+
+async def _count_events() -> int:
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events;")
+        return (await cur.fetchone())["n"]
+
+
+@pytest.mark.asyncio
+async def test_cli_copy_import_counts(capsys):
+    await _run_import(str(SAMPLE), None, 700, None)
+    out = capsys.readouterr().out
+    assert "[TOTAL] inserted=5000, duplicates=0" in out
+    assert await _count_events() == 5000
+
+    # повторний імпорт того ж файлу: все — дублі, нічого не вставлено
+    await _run_import(str(SAMPLE), None, 700, None)
+    out = capsys.readouterr().out
+    assert "[TOTAL] inserted=0, duplicates=5000" in out
+    assert await _count_events() == 5000
+
+
+@pytest.mark.asyncio
+async def test_cli_resumes_from_checkpoint(monkeypatch, capsys):
+    real_copy_merge = cli_main._copy_merge
+    calls = 0
+
+    async def crash_on_third_batch(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise ConnectionError("simulated crash")
+        return await real_copy_merge(*args, **kwargs)
+
+    monkeypatch.setattr(cli_main, "_copy_merge", crash_on_third_batch)
+    with pytest.raises(ConnectionError):
+        await _run_import(str(SAMPLE), None, 300, None)
+    assert await _count_events() == 600
+    monkeypatch.undo()
+    capsys.readouterr()
+
+    # продовжуємо з рядка 600: вже вставлені рядки не перечитуються і не пробуються
+    await _run_import(str(SAMPLE), None, 300, None)
+    out = capsys.readouterr().out
+    assert "resuming" in out and "from row 600" in out
+    assert "[TOTAL] inserted=4400, duplicates=0" in out
+    assert await _count_events() == 5000
+
+
+@pytest.mark.asyncio
+async def test_cli_resume_skips_finished_files_only_until_run_succeeds(tmp_path, monkeypatch, capsys):
+    lines = SAMPLE.read_text(encoding="utf-8").splitlines(keepends=True)
+    (tmp_path / "a.csv").write_text(lines[0] + "".join(lines[1:1001]), encoding="utf-8")
+    (tmp_path / "b.csv").write_text(lines[0] + "".join(lines[1001:2001]), encoding="utf-8")
+
+    real_copy_merge = cli_main._copy_merge
+    calls = 0
+
+    async def crash_in_second_file(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise ConnectionError("simulated crash")
+        return await real_copy_merge(*args, **kwargs)
+
+    monkeypatch.setattr(cli_main, "_copy_merge", crash_in_second_file)
+    with pytest.raises(ConnectionError):
+        await _run_import(str(tmp_path), None, 500, "*.csv")
+    monkeypatch.undo()
+    capsys.readouterr()
+
+    # перезапуск: a.csv завершений цим (упалим) запуском — пропускаємо з підказкою
+    await _run_import(str(tmp_path), None, 500, "*.csv")
+    out = capsys.readouterr().out
+    assert "[SKIP] file=a.csv" in out and "--restart" in out
+    assert "[TOTAL] inserted=1000, duplicates=0" in out
+    assert await _count_events() == 2000
+
+    # рядки a.csv видалили — після успішного запуску checkpoint-ів немає, імпорт їх повертає
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("DELETE FROM events;")
+    await _run_import(str(tmp_path / "a.csv"), None, 500, None)
+    assert "[TOTAL] inserted=1000, duplicates=0" in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_cli_parallel_import_of_directory(tmp_path, capsys):
+    # ділимо sample на 4 файли + один файл-дубль, щоб перевірити агрегацію підсумків
+    lines = SAMPLE.read_text(encoding="utf-8").splitlines(keepends=True)
+    header, rows = lines[0], lines[1:]
+    for i in range(4):
+        (tmp_path / f"part_{i}.csv").write_text(header + "".join(rows[i::4]), encoding="utf-8")
+    (tmp_path / "part_dup.csv").write_text(header + "".join(rows[:100]), encoding="utf-8")
+
+    await _run_import(str(tmp_path), "parallel-dir", 300, None, workers=3)
+    out = capsys.readouterr().out
+    assert "[TOTAL] inserted=5000, duplicates=100" in out
+    assert out.count("[DONE]") == 5
+    assert await _count_events() == 5000
+
+    # той самий ключ ідемпотентності — повторний запуск нічого не робить
+    await _run_import(str(tmp_path), "parallel-dir", 300, None, workers=3)
+    assert "already imported" in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_cli_pipelined_import_with_several_writers(monkeypatch, capsys):
+    progresses = []
+
+    class RecordingProgress(cli_main._Progress):
+        def __init__(self, rows: int, offset: int) -> None:
+            super().__init__(rows, offset)
+            progresses.append(self)
+
+    monkeypatch.setattr(cli_main, "_Progress", RecordingProgress)
+    await _run_import(str(SAMPLE), None, 250, None, writers=3, parse_procs=2, queue_depth=2)
+    out = capsys.readouterr().out
+    assert "[TOTAL] inserted=5000, duplicates=0" in out
+    assert await _count_events() == 5000
+
+    # батчі комітились не по порядку, але файл завершено з повним зсувом
+    [progress] = progresses
+    assert progress.rows == 5000 and progress.offset == SAMPLE.stat().st_size
+    # успішний запуск прибирає checkpoint-и
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM import_checkpoints;")
+        assert (await cur.fetchone())["n"] == 0
+
+
+def test_progress_checkpoint_is_contiguous_prefix():
+    p = cli_main._Progress(rows=0, offset=0)
+    # батч 1 комітиться раніше за батч 0 — checkpoint не має перескочити дірку
+    assert p.if_committed(1, 10, 200) == (0, 0)
+    p.commit(1, 10, 200)
+    assert p.if_committed(0, 10, 100) == (20, 200)
+    p.commit(0, 10, 100)
+    assert (p.rows, p.offset) == (20, 200)
@@ -0,0 +1,157 @@
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+from app.cli.main import _run_archive  # noqa: E402
+from app.infrastructure import cold  # noqa: E402
+from app.infrastructure.db import get_conn  # noqa: E402
+from app.infrastructure.rollups import rebuild_rollups  # noqa: E402
+from app.shared.cache import stats_cache  # noqa: E402
+from app.shared.segment import build_segment_filter  # noqa: E402
+from app.shared.settings import settings  # noqa: E402
+
+SEGMENTS = [
+    "event_type:purchase",
+    "properties.country=UA",
+    "properties.plan IN (pro, team) AND event_type IN (view, purchase)",
+    "properties.price >= 10 OR properties.flag=true",
+    "properties.code=7",
+    "properties.code='7'",
+]
+
+
+def _events():
+    out = []
+    for i in range(120):
+        props = {"country": ["UA", "PL", "DE"][i % 3], "plan": ["free", "pro", "team"][i % 5 % 3]}
+        if i % 4 == 0:
+            props["price"] = i / 3
+        if i % 7 == 0:
+            props["flag"] = i % 2 == 0
+        if i % 6 == 0:
+            props["code"] = 7 if i % 12 else "7"
+        out.append({
+            "event_id": str(uuid.UUID(int=i + 1)),
+            "occurred_at": f"2025-08-{1 + i % 5:02d}T{i % 24:02d}:15:00Z",
+            "user_id": f"u{i % 17}",
+            "event_type": ["view", "click", "purchase"][i % 3],
+            "properties": props,
+        })
+    return out
+
+
+@pytest.fixture
+def cold_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cold_storage_dir", str(tmp_path))
+    return tmp_path
+
+
+async def _snapshot(client):
+    out = {}
+    for seg in [None, *SEGMENTS]:
+        params = {"from": "2025-08-01", "to": "2025-08-05", **({"segment": seg} if seg else {})}
+        dau = (await client.get("/stats/dau", params=params)).json()
+        top = (await client.get("/stats/top-events", params={**params, "limit": 2})).json()
+        out[seg] = (dau, sorted((t["event_type"], t["count"]) for t in top))
+    return out
+
+
+@pytest.mark.asyncio
+async def test_archive_purge_keeps_stats(client, cold_dir):
+    assert (await client.post("/events", json=_events())).status_code == 201
+    before = await _snapshot(client)
+
+    await _run_archive(date(2025, 8, 4), purge=True)
+    assert sorted(p.parent.name for p in Path(cold_dir).glob("events/day=*/events.parquet")) == [
+        "day=2025-08-01", "day=2025-08-02", "day=2025-08-03",
+    ]
+    conn = await get_conn()
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT MIN(occurred_at)::date AS lo FROM events;")
+        assert (await cur.fetchone())["lo"] == date(2025, 8, 4)
+
+    stats_cache.clear()
+    assert await _snapshot(client) == before
+
+    # перерахунок агрегатів не стирає дні, яких уже немає в events
+    await rebuild_rollups(conn)
+    stats_cache.clear()
+    assert await _snapshot(client) == before
+
+
+@pytest.mark.asyncio
+async def test_duckdb_segments_match_postgres(client, cold_dir):
+    await client.post("/events", json=_events())
+    conn = await get_conn()
+    await cold.archive_day(conn, date(2025, 8, 2))
+    files = await cold.days_between(conn, date(2025, 8, 1), date(2025, 8, 5))
+    assert list(files) == [date(2025, 8, 2)]
+
+    for seg in SEGMENTS:
+        seg_sql, params = build_segment_filter(seg)
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT event_id::text AS id FROM events WHERE occurred_at::date = '2025-08-02' {seg_sql};", params
+            )
+            expected = {r["id"] for r in await cur.fetchall()}
+        got = {r[0] for r in await cold._run(files, "SELECT event_id FROM {source} {seg_sql}", seg)}
+        assert got == expected, seg
+        assert expected or seg == "properties.code='7'"
+
+
+@pytest.mark.asyncio
+async def test_purge_refuses_without_parquet(client, cold_dir):
+    await client.post("/events", json=_events())
+    conn = await get_conn()
+    await cold.archive_day(conn, date(2025, 8, 1))
+    (Path(cold_dir) / "events" / "day=2025-08-01" / "events.parquet").unlink()
+    with pytest.raises(cold.ColdStorageError):
+        await cold.purge_day(conn, date(2025, 8, 1))
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events WHERE occurred_at::date = '2025-08-01';")
+        assert (await cur.fetchone())["n"] > 0
+
+
+@pytest.mark.asyncio
+async def test_late_events_into_archived_days(client, cold_dir):
+    events = _events()
+    assert (await client.post("/events", json=events)).status_code == 201
+    conn = await get_conn()
+    await cold.archive_day(conn, date(2025, 8, 1))
+    await cold.purge_day(conn, date(2025, 8, 1))
+    await cold.archive_day(conn, date(2025, 8, 2))
+
+    late = [
+        {"event_id": str(uuid.uuid4()), "occurred_at": f"2025-08-0{d}T23:00:00Z", "user_id": f"late{d}",
+         "event_type": "purchase", "properties": {"country": "UA"}}
+        for d in (1, 2)
+    ]
+    assert (await client.post("/events", json=late)).status_code == 201
+    events += late
+
+    def expected_dau(day: int) -> int:
+        return len({e["user_id"] for e in events
+                    if e["occurred_at"].startswith(f"2025-08-0{day}") and e["properties"].get("country") == "UA"})
+
+    async def dau() -> list:
+        stats_cache.clear()
+        params = {"from": "2025-08-01", "to": "2025-08-02", "segment": "properties.country=UA"}
+        return [d["dau"] for d in (await client.get("/stats/dau", params=params)).json()]
+
+    # не видалений день, що відстав від агрегатів, одразу читається з Postgres
+    assert (await dau())[1] == expected_dau(2)
+
+    await _run_archive(date(2025, 8, 3), purge=False)
+    assert await dau() == [expected_dau(1), expected_dau(2)]
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events WHERE occurred_at::date = '2025-08-01';")
+        assert (await cur.fetchone())["n"] == 0  # пізній рядок видаленого дня перенесено в Parquet
+        await cur.execute("SELECT day, rows FROM cold_days ORDER BY day;")
+        assert [r["rows"] for r in await cur.fetchall()] == [
+            sum(e["occurred_at"].startswith(f"2025-08-0{d}") for e in events) for d in (1, 2)
+        ]
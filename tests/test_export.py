@@ -0,0 +1,122 @@
+import csv
+import gzip
+import io
+import json
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.cli.main import _run_import
+from app.infrastructure.db import get_conn
+from app.main import app
+from app.shared.settings import settings
+
+
+def _events(n: int):
+    return [
+        {
+            "event_id": str(uuid.UUID(int=i + 1)),
+            "occurred_at": f"2025-08-{1 + i % 3:02d}T{i % 24:02d}:00:00+00:00",
+            "user_id": f"u{i % 5}",
+            "event_type": "purchase" if i % 4 == 0 else "view",
+            "properties": {"country": "UA" if i % 2 else "PL", "note": 'a,"b"\nc', "n": i},
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_csv_streams_in_fetches(client, monkeypatch):
+    monkeypatch.setattr(settings, "export_fetch_size", 4)
+    events = _events(11)
+    assert (await client.post("/events", json=events)).status_code == 201
+
+    r = await client.get("/events/export", params={"from": "2025-08-01", "to": "2025-08-02"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    expected = [e for e in events if e["occurred_at"] < "2025-08-03"]
+    assert len(rows) == len(expected)
+    # упорядковано за часом; properties_json — валідний JSON з тими самими значеннями
+    assert [x["occurred_at"] for x in rows] == sorted(e["occurred_at"] for e in expected)
+    by_id = {e["event_id"]: e for e in expected}
+    for x in rows:
+        e = by_id[x["event_id"]]
+        assert (x["user_id"], x["event_type"]) == (e["user_id"], e["event_type"])
+        assert json.loads(x["properties_json"]) == e["properties"]
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_segment_and_gzip(client):
+    events = _events(20)
+    await client.post("/events", json=events)
+    params = {
+        "from": "2025-08-01", "to": "2025-08-31", "format": "ndjson",
+        "segment": "event_type:purchase AND properties.country=PL", "gzip": "true",
+    }
+    # без авто-розпаковки: перевіряємо, що тіло справді gzip
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as raw:
+        async with raw.stream("GET", "/events/export", params=params) as r:
+            assert r.status_code == 200
+            assert r.headers["content-encoding"] == "gzip"
+            body = b"".join([chunk async for chunk in r.aiter_raw()])
+    lines = [json.loads(x) for x in gzip.decompress(body).decode().splitlines()]
+    expected = {e["event_id"] for e in events if e["event_type"] == "purchase" and e["properties"]["country"] == "PL"}
+    assert {x["event_id"] for x in lines} == expected
+    assert all(set(x) == {"event_id", "occurred_at", "user_id", "event_type", "properties"} for x in lines)
+
+    r = await client.get("/events/export", params={"from": "2025-08-01", "to": "2025-08-31", "segment": "event_type IN ("})
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_csv_round_trips_through_importer(client, tmp_path):
+    events = _events(30)
+    await client.post("/events", json=events)
+    r = await client.get("/events/export", params={"from": "2025-08-01", "to": "2025-08-31"})
+    path = tmp_path / "export.csv"
+    path.write_bytes(r.content)
+
+    conn = await get_conn()
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT event_id, occurred_at, user_id, event_type, properties FROM events ORDER BY event_id;")
+        before = await cur.fetchall()
+        await cur.execute("TRUNCATE TABLE events, event_ids;")
+
+    await _run_import(str(path), None, 7, None)
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT event_id, occurred_at, user_id, event_type, properties FROM events ORDER BY event_id;")
+        assert await cur.fetchall() == before
+
+
+@pytest.mark.asyncio
+async def test_export_returns_connection_when_client_leaves_before_body(client):
+    import asyncio
+
+    from app.infrastructure.db import get_pool
+
+    assert (await client.post("/events", json=_events(3))).status_code == 201
+    pool = await get_pool()
+
+    def in_use() -> int:
+        stats = pool.get_stats()
+        return stats["pool_size"] - stats["pool_available"]
+
+    before = in_use()
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # клієнт не читає: chunks() так і не почне ітеруватись
+        await asyncio.sleep(3600)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/events/export", "raw_path": b"/events/export", "root_path": "",
+        "query_string": b"from=2025-08-01&to=2025-08-03", "headers": [], "client": ("test", 1), "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    assert in_use() == before
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.application.funnel import FunnelCounter
+
+T0 = datetime(2025, 8, 1, 10, 0, tzinfo=timezone.utc)
+STEPS = "login,view_item,add_to_cart,purchase"
+
+
+def _ev(user: str, event_type: str, hours: float, country: str = "UA"):
+    return {
+        "event_id": str(uuid4()),
+        "occurred_at": (T0 + timedelta(hours=hours)).isoformat(),
+        "user_id": user,
+        "event_type": event_type,
+        "properties": {"country": country},
+    }
+
+
+@pytest.mark.asyncio
+async def test_funnel_counts_ordered_steps_within_window(client):
+    batch = [
+        # повна воронка: 1h, 2h, 3h від входу
+        _ev("a", "login", 0), _ev("a", "view_item", 1), _ev("a", "add_to_cart", 2), _ev("a", "purchase", 3),
+        # без кошика: purchase не зараховується
+        _ev("b", "login", 0), _ev("b", "view_item", 3), _ev("b", "purchase", 4),
+        # перегляд до логіну — не по порядку
+        _ev("c", "view_item", -1), _ev("c", "login", 0, country="PL"),
+        # другий крок поза 24-годинним вікном
+        _ev("d", "login", 0), _ev("d", "view_item", 30),
+        # вхід до `from` — не у воронці
+        _ev("e", "login", -48), _ev("e", "view_item", 1),
+        # шум, що не є кроком
+        _ev("a", "app_open", 0.5),
+    ]
+    r = await client.post("/events", json=batch)
+    assert r.status_code == 201
+
+    params = {"from": "2025-08-01", "to": "2025-08-01", "steps": STEPS}
+    body = (await client.get("/stats/funnel", params=params)).json()
+    assert [s["step"] for s in body] == STEPS.split(",")
+    assert [s["users"] for s in body] == [4, 2, 1, 1]
+    assert body[1]["conversion"] == 0.5
+    assert body[0]["median_seconds_from_start"] is None
+    assert body[1]["median_seconds_from_start"] == 2 * 3600  # медіана з 1h (a) і 3h (b)
+    assert body[3]["median_seconds_from_start"] == 3 * 3600
+    assert body[3]["median_seconds_from_previous"] == 3600
+
+    # ширше вікно — d доходить до другого кроку
+    wide = (await client.get("/stats/funnel", params={**params, "window_hours": 48})).json()
+    assert [s["users"] for s in wide] == [4, 3, 1, 1]
+
+    seg = (await client.get("/stats/funnel", params={**params, "segment": "properties.country=PL"})).json()
+    assert [s["users"] for s in seg] == [1, 0, 0, 0]
+
+
+@pytest.mark.asyncio
+async def test_funnel_validates_params(client):
+    base = {"from": "2025-08-01", "to": "2025-08-02"}
+    assert (await client.get("/stats/funnel", params={**base, "steps": "login"})).status_code == 400
+    assert (await client.get("/stats/funnel", params={**base, "steps": "login,,purchase"})).status_code == 400
+    assert (await client.get("/stats/funnel", params={**base, "steps": STEPS, "segment": "bad="})).status_code == 400
+
+
+def test_latest_start_wins_and_repeated_steps():
+    c = FunnelCounter(["login", "purchase"], timedelta(hours=1))
+    # ранній login задалеко від покупки, пізніший — у вікні
+    c.feed("u", T0, "login")
+    c.feed("u", T0 + timedelta(hours=5), "login")
+    c.feed("u", T0 + timedelta(hours=5, minutes=30), "purchase")
+    assert c.users == [1, 1]
+
+    # одна подія не закриває два однакові кроки одразу
+    c = FunnelCounter(["view", "view"], timedelta(hours=1))
+    c.feed("u", T0, "view")
+    assert c.users == [1, 0]
+    c.feed("u", T0 + timedelta(minutes=5), "view")
+    assert c.users == [1, 1]
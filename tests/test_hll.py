@@ -0,0 +1,72 @@
+
+from datetime import date, timedelta
+from pathlib import Path
+import pytest
+
+from app.cli.main import _run_import
+from app.infrastructure.db import get_conn
+from app.shared import hll
+
+SAMPLE = Path(__file__).resolve().parent.parent / "data" / "events_sample.csv"
+
+# 4σ від стандартної похибки HLL, але не менше 1 користувача (округлення)
+def _close(approx: int, exact: int) -> bool:
+    return abs(approx - exact) <= max(1, 4 * hll.HLL_REL_ERROR * exact)
+
+
+async def _exact_window(day: date, days: int) -> int:
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute(
+            """
+            SELECT COUNT(DISTINCT user_id) AS n FROM events
+            WHERE occurred_at >= %(lo)s::date AND occurred_at < %(hi)s::date + INTERVAL '1 day';
+            """,
+            {"lo": day - timedelta(days=days - 1), "hi": day},
+        )
+        return (await cur.fetchone())["n"]
+
+
+@pytest.mark.asyncio
+async def test_approx_dau_close_to_exact(client):
+    await _run_import(str(SAMPLE), None, 1000, None)
+    params = {"from": "2025-08-01", "to": "2025-08-31"}
+
+    exact = (await client.get("/stats/dau", params=params)).json()
+    approx = (await client.get("/stats/dau", params={**params, "approx": "true"})).json()
+
+    assert [r["date"] for r in approx] == [r["date"] for r in exact]
+    for a, e in zip(approx, exact):
+        assert _close(a["dau"], e["dau"]), (a, e)
+
+
+@pytest.mark.asyncio
+async def test_active_users_wau_mau_close_to_exact(client):
+    await _run_import(str(SAMPLE), None, 1000, None)
+
+    res = await client.get("/stats/active-users", params={"from": "2025-08-01", "to": "2025-08-31"})
+    assert res.status_code == 200
+    rows = res.json()
+    assert len(rows) == 31
+
+    for r in rows[::5]:
+        day = date.fromisoformat(r["date"])
+        assert _close(r["wau"], await _exact_window(day, 7)), r
+        assert _close(r["mau"], await _exact_window(day, 30)), r
+        assert 0.0 <= r["stickiness"] <= 1.0
+
+
+@pytest.mark.asyncio
+async def test_approx_rejects_segment(client):
+    res = await client.get("/stats/dau", params={
+        "from": "2025-08-01", "to": "2025-08-02", "approx": "true", "segment": "event_type:login",
+    })
+    assert res.status_code == 400
+
+
+def test_union_and_sparse_match_register_max():
+    a = hll.from_sparse([1, 5, 5, 9], [3, 2, 7, 1])
+    b = hll.from_sparse([5, 9, 100], [4, 6, 2])
+    assert (a[5], a[9], a[1]) == (7, 1, 3)
+    assert hll.union(a, b) == bytes(map(max, a, b))
+    assert hll.union(hll.empty(), b) == b
+    assert hll.estimate(hll.empty()) == 0.0
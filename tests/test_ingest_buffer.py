@@ -0,0 +1,140 @@
+import asyncio
+import json
+import uuid
+
+import psycopg
+import pytest
+from prometheus_client import REGISTRY
+
+from app.api.ingest_decode import decode_events
+from app.api.routes_events import insert_rows, make_ingest_buffer
+from app.application import ingest_buffer
+from app.application.ingest_buffer import IngestBuffer
+from app.infrastructure.db import get_conn
+
+
+def _ev(i: int) -> dict:
+    return {
+        "event_id": str(uuid.UUID(int=i + 1)),
+        "occurred_at": "2025-08-01T10:00:00Z",
+        "user_id": f"u{i % 3}",
+        "event_type": "login",
+    }
+
+
+async def _count() -> int:
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events;")
+        return (await cur.fetchone())["n"]
+
+
+@pytest.fixture
+def use_buffer():
+    def install(**kwargs) -> IngestBuffer:
+        buf = make_ingest_buffer(**kwargs)
+        ingest_buffer.set_buffer(buf)
+        return buf
+    yield install
+    ingest_buffer.set_buffer(None)
+
+
+@pytest.mark.asyncio
+async def test_buffer_coalesces_small_requests(client, use_buffer):
+    flushed = []
+    buf = use_buffer(max_events=1000, flush_events=10, flush_interval=0.05)
+
+    async def recording_insert(rows):
+        flushed.append(len(rows))
+        return await insert_rows(rows)
+
+    buf._insert = recording_insert
+    buf.start()
+    for i in range(0, 25, 5):
+        r = await client.post("/events", json=[_ev(j) for j in range(i, i + 5)])
+        assert r.status_code == 202 and r.json() == {"accepted": 5}
+
+    # 25 подій з 5 запитів -> кілька великих батчів (по розміру + хвіст по таймеру)
+    for _ in range(50):
+        if await _count() == 25:
+            break
+        await asyncio.sleep(0.02)
+    assert await _count() == 25
+    assert sum(flushed) == 25 and max(flushed) == 10 and len(flushed) < 5
+    await buf.close()
+
+
+@pytest.mark.asyncio
+async def test_buffer_backpressure_and_flush_on_close(client, use_buffer):
+    # flusher не запущено — черга лише наповнюється
+    buf = use_buffer(max_events=8, flush_events=100, flush_interval=10)
+    assert (await client.post("/events", json=[_ev(i) for i in range(6)])).status_code == 202
+
+    r = await client.post("/events", json=[_ev(i) for i in range(6, 10)])
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    assert len(buf) == 6 and await _count() == 0
+
+    await buf.close()
+    assert len(buf) == 0 and await _count() == 6
+    # після close нові події не приймаються
+    assert not buf.offer([("x",)])
+
+
+@pytest.mark.asyncio
+async def test_buffer_retries_failed_flush(use_buffer):
+    calls = 0
+
+    async def flaky_insert(rows):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise psycopg.OperationalError("db down")
+        return await insert_rows(rows)
+
+    buf = use_buffer(max_events=100, flush_events=100, flush_interval=0.01)
+    buf._insert = flaky_insert
+    buf.start()
+    assert buf.offer(decode_events(json.dumps([_ev(i) for i in range(3)]).encode()))
+    await buf.close()
+    assert calls == 2 and await _count() == 3
+
+
+def _ingest_errors() -> float:
+    return REGISTRY.get_sample_value("ingest_events_total", {"result": "error"}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_buffer_retries_systemic_errors_instead_of_dropping(use_buffer):
+    calls = 0
+
+    async def revoked_insert(rows):
+        nonlocal calls
+        calls += 1
+        if calls <= 2:
+            # не помилка даних — бісекція й відкидання тут втратили б увесь батч
+            raise psycopg.errors.InsufficientPrivilege("permission denied for table events")
+        return await insert_rows(rows, count_errors=False)
+
+    buf = use_buffer(max_events=100, flush_events=100, flush_interval=0.01)
+    buf._insert = revoked_insert
+    buf.start()
+    errors = _ingest_errors()
+    assert buf.offer(decode_events(json.dumps([_ev(i) for i in range(4)]).encode()))
+    await buf.close()
+    assert calls == 3 and await _count() == 4
+    assert _ingest_errors() == errors
+
+
+@pytest.mark.asyncio
+async def test_buffer_drops_permanently_rejected_rows(client, use_buffer):
+    errors = _ingest_errors()
+    buf = use_buffer(max_events=100, flush_events=100, flush_interval=0.01)
+    buf.start()
+    bad = _ev(5) | {"user_id": "a\u0000b"}  # валідний JSON, але Postgres text не приймає NUL
+    r = await client.post("/events", json=[_ev(i) for i in range(5)] + [bad] + [_ev(i) for i in range(6, 9)])
+    assert r.status_code == 202
+    await buf.close()
+
+    # погана подія відкинута, решта записана, черга не застрягла
+    assert len(buf) == 0 and await _count() == 8
+    # бісекція робить кілька невдалих INSERT, але помилкою рахується лише відкинута подія
+    assert _ingest_errors() == errors + 1
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from pydantic import TypeAdapter
+
+from app.api import ingest_decode
+from app.api.routes_events import EventIn, _row
+from app.infrastructure.db import get_conn
+from app.infrastructure.rollups import ROLLUP_TABLES
+from app.shared.settings import settings
+
+
+def _ev(i: int, **overrides) -> dict:
+    ev = {
+        "event_id": f"00000000-0000-0000-0000-{i:012d}",
+        "occurred_at": "2025-08-01T10:00:00+03:00",
+        "user_id": f"u{i}",
+        "event_type": "login",
+        "properties": {"n": i, "nested": {"a": [1, 2]}},
+    }
+    ev.update(overrides)
+    return ev
+
+
+VALID = [
+    [_ev(1), _ev(2, occurred_at="2025-08-01T10:00:00"), _ev(3, occurred_at=1754042400)],
+    [{k: v for k, v in _ev(4).items() if k != "properties"}, _ev(5, extra_field="ignored")],
+    [_ev(6), _ev(6, user_id="dup")],
+]
+
+INVALID = [
+    "[]",
+    "{not json",
+    json.dumps({"event_id": "x"}),
+    json.dumps([_ev(1), "not an object"]),
+    json.dumps([_ev(1, event_id="nope")]),
+    json.dumps([_ev(1, user_id="")]),
+    json.dumps([_ev(1, user_id="x" * 257)]),
+    json.dumps([_ev(1, event_type=5)]),
+    json.dumps([_ev(1, properties=[1, 2])]),
+    json.dumps([_ev(1, occurred_at="yesterday")]),
+]
+
+
+def test_fast_decode_matches_event_in():
+    adapter = TypeAdapter(list[EventIn])
+    for payload in VALID:
+        body = json.dumps(payload).encode()
+        assert ingest_decode.decode_events(body) == [_row(e) for e in adapter.validate_json(body)]
+    # відмови швидкий шлях не формує — їх віддає звичайний шлях через EventIn
+    for body in INVALID:
+        assert ingest_decode.decode_events(body.encode()) in (None, [])
+
+
+async def _reset():
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute(f"TRUNCATE TABLE events, event_ids, user_first_seen, {', '.join(ROLLUP_TABLES)};")
+
+
+async def _stored():
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("SELECT event_id, occurred_at, user_id, event_type, properties FROM events ORDER BY event_id;")
+        return await cur.fetchall()
+
+
+@pytest.mark.asyncio
+async def test_fast_path_has_identical_http_semantics(client, monkeypatch):
+    headers = {"Content-Type": "application/json"}
+    bodies = [json.dumps(p) for p in VALID] + INVALID + [json.dumps([_ev(i) for i in range(10_001)])]
+    for body in bodies:
+        results = []
+        for fast in (False, True):
+            monkeypatch.setattr(settings, "ingest_fast_path", fast)
+            await _reset()
+            r = await client.post("/events", content=body, headers=headers)
+            results.append((r.status_code, r.json(), await _stored()))
+        assert results[0] == results[1], body[:200]
@@ -26,3 +26,20 @@ async def test_ingest_idempotency(client):
     body2 = r2.json()
     assert body2["ingested"] == 0
     assert body2["duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ingest_dedupes_within_payload(client):
+    event_id = str(uuid.uuid4())
+    item = {
+        "event_id": event_id,
+        "occurred_at": datetime(2025, 8, 1, 12, 0, tzinfo=timezone.utc).isoformat(),
+        "user_id": "u1",
+        "event_type": "signin",
+        "properties": {},
+    }
+    other = {**item, "event_id": str(uuid.uuid4())}
+
+    r = await client.post("/events", json=[item, item, other])
+    assert r.status_code == 200
+    assert r.json() == {"ingested": 2, "duplicates": 1}
@@ -0,0 +1,63 @@
+import json
+import uuid
+
+import pytest
+
+from app.shared.settings import settings
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def _line(i: int, **overrides) -> str:
+    ev = {
+        "event_id": str(uuid.UUID(int=i + 1)),
+        "occurred_at": "2025-08-01T10:00:00",
+        "user_id": f"u{i % 7}",
+        "event_type": "login",
+        "properties": {"n": i},
+    }
+    ev.update(overrides)
+    return json.dumps(ev)
+
+
+@pytest.mark.asyncio
+async def test_stream_ingest_in_chunks_with_line_errors(client, monkeypatch):
+    monkeypatch.setattr(settings, "ingest_stream_chunk", 4)
+    lines = [_line(i) for i in range(10)]
+    lines.insert(3, "{not json")
+    lines.insert(6, _line(99, user_id=""))
+    lines.insert(8, "")
+    lines.append(_line(0))  # дубль першого рядка
+
+    async def body():
+        # тіло приходить шматками, що ріжуть рядки посередині
+        data = ("\n".join(lines) + "\n").encode()
+        for i in range(0, len(data), 37):
+            yield data[i:i + 37]
+
+    r = await client.post("/events/stream", content=body(), headers=NDJSON)
+    assert r.status_code == 200
+    out = r.json()
+    assert (out["ingested"], out["duplicates"], out["rejected"]) == (10, 1, 2)
+    assert [e["line"] for e in out["errors"]] == [4, 7]
+    assert out["errors"][1]["error"].startswith("user_id:")
+
+    dau = await client.get("/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01"})
+    assert dau.json() == [{"date": "2025-08-01", "dau": 7}]
+
+    # повтор того ж потоку — лише дублі
+    r = await client.post("/events/stream", content="\n".join(lines[:3]), headers=NDJSON)
+    assert r.status_code == 200
+    assert (r.json()["ingested"], r.json()["duplicates"]) == (0, 3)
+
+
+@pytest.mark.asyncio
+async def test_stream_ingest_status_codes(client):
+    r = await client.post("/events/stream", content=_line(1) + "\n" + _line(2), headers=NDJSON)
+    assert r.status_code == 201 and r.json()["ingested"] == 2
+
+    r = await client.post("/events/stream", content="\n\n", headers=NDJSON)
+    assert r.status_code == 400
+
+    r = await client.post("/events/stream", content=_line(1), headers={"Content-Type": "application/json"})
+    assert r.status_code == 415
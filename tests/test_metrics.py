@@ -0,0 +1,58 @@
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.cli.main import _run_import
+from app.shared.settings import settings
+
+SAMPLE = Path(__file__).resolve().parent.parent / "data" / "events_sample.csv"
+
+
+def _count(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(f"{name}_count", labels) or 0.0
+
+
+def _events(n: int):
+    return [
+        {"event_id": str(uuid4()), "occurred_at": "2025-08-01T10:00:00Z", "user_id": f"u{i}", "event_type": "view"}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fast", [True, False])
+async def test_ingest_stages_observed(client, monkeypatch, fast):
+    monkeypatch.setattr(settings, "ingest_fast_path", fast)
+    stages = ("decode", "validate", "db_write", "response")
+    before = {s: _count("ingest_stage_seconds", source="api", stage=s) for s in stages}
+
+    r = await client.post("/events", json=_events(3))
+    assert r.status_code == 201
+    for s in stages:
+        assert _count("ingest_stage_seconds", source="api", stage=s) == before[s] + 1, s
+
+
+@pytest.mark.asyncio
+async def test_cli_import_stages_observed(capsys):
+    before = {s: _count("ingest_stage_seconds", source="cli", stage=s) for s in ("decode", "validate", "db_write")}
+    await _run_import(str(SAMPLE), None, 1000, None)
+    assert "read " in capsys.readouterr().out
+    # 5000 рядків по 1000 — п'ять батчів на кожній стадії
+    for s, n in before.items():
+        assert _count("ingest_stage_seconds", source="cli", stage=s) == n + 5, s
+
+
+@pytest.mark.asyncio
+async def test_stats_query_and_pool_metrics(client):
+    before = _count("stats_query_seconds", endpoint="top-events", backend="postgres")
+    r = await client.get("/stats/top-events", params={"from": "2025-08-01", "to": "2025-08-02", "segment": "properties.k=v"})
+    assert r.status_code == 200
+    assert _count("stats_query_seconds", endpoint="top-events", backend="postgres") == before + 1
+    assert _count("stats_query_rows", endpoint="top-events", backend="postgres") >= 1
+    assert _count("db_pool_wait_seconds", pool="primary") >= 1
+
+    # пул відкритий — gauges з'являються на scrape
+    assert REGISTRY.get_sample_value("db_pool_connections", {"pool": "primary", "state": "in_use"}) == 0
+    assert REGISTRY.get_sample_value("db_pool_connections", {"pool": "primary", "state": "max"}) == settings.db_pool_max
@@ -0,0 +1,122 @@
+
+from datetime import date
+import pytest
+
+from app.infrastructure.db import get_conn
+from app.infrastructure.partitions import detach_partitions_before, is_partitioned, partition_bounds, partitions_between
+
+
+def test_partition_bounds():
+    assert partition_bounds(date(2025, 8, 17), "month") == (date(2025, 8, 1), date(2025, 9, 1))
+    assert partition_bounds(date(2025, 12, 31), "month") == (date(2025, 12, 1), date(2026, 1, 1))
+    assert partition_bounds(date(2025, 8, 17), "week") == (date(2025, 8, 11), date(2025, 8, 18))
+    assert partition_bounds(date(2025, 8, 17), "day") == (date(2025, 8, 17), date(2025, 8, 18))
+    assert [lo for lo, _ in partitions_between(date(2025, 7, 31), date(2025, 9, 1), "month")] == [
+        date(2025, 7, 1), date(2025, 8, 1), date(2025, 9, 1),
+    ]
+    # останній місяць календаря — без OverflowError, межа обрізається до date.max
+    assert partition_bounds(date(9999, 12, 5), "month") == (date(9999, 12, 1), date.max)
+    assert partition_bounds(date.max, "day") == (date.max, date.max)
+    assert partitions_between(date(9999, 11, 20), date.max, "month")[-1] == (date(9999, 12, 1), date.max)
+
+
+@pytest.mark.asyncio
+async def test_outlier_timestamps_go_to_default_partition(client):
+    conn = await get_conn()
+    if not await is_partitioned(conn):
+        pytest.skip("events is not partitioned in this database")
+
+    async def partitions() -> set:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT inhrelid::regclass::text AS name FROM pg_inherits WHERE inhparent = 'events'::regclass;")
+            return {r["name"] for r in await cur.fetchall()}
+
+    before = await partitions()
+    items = [
+        {"event_id": f"55555555-5555-5555-5555-55555555555{i}", "occurred_at": ts, "user_id": "u1", "event_type": "view"}
+        for i, ts in enumerate(("0001-01-01T00:00:00+00:00", "2025-01-10T00:00:00+00:00", "9999-12-05T00:00:00+00:00"))
+    ]
+    r = await client.post("/events", json=items)
+    assert r.status_code == 201
+
+    # лише партиція самого 2025-01, а не десятки тисяч між 0001 і 9999 роком
+    assert (await partitions()) - before <= {"events_p20250101"}
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events_default WHERE user_id = 'u1';")
+        assert (await cur.fetchone())["n"] == 2
+
+
+@pytest.mark.asyncio
+async def test_range_query_prunes_partitions(client):
+    conn = await get_conn()
+    if not await is_partitioned(conn):
+        pytest.skip("events is not partitioned in this database")
+
+    items = [
+        {
+            "event_id": f"44444444-4444-4444-4444-44444444444{i}",
+            "occurred_at": f"2025-{m:02d}-10T12:00:00+00:00",
+            "user_id": "u1",
+            "event_type": "view",
+            "properties": {"country": "UA"},
+        }
+        for i, m in enumerate((6, 7, 8))
+    ]
+    r = await client.post("/events", json=items)
+    assert r.status_code == 201
+
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            EXPLAIN SELECT COUNT(*) FROM events
+            WHERE occurred_at >= %(from)s::date AND occurred_at < (%(to)s::date + INTERVAL '1 day');
+            """,
+            {"from": "2025-08-01", "to": "2025-08-31"},
+        )
+        plan = "\n".join(row["QUERY PLAN"] for row in await cur.fetchall())
+
+    assert "events_p20250801" in plan
+    assert "events_p20250601" not in plan and "events_p20250701" not in plan
+
+
+@pytest.mark.asyncio
+async def test_event_id_unique_across_timestamps(client):
+    # PK партиціонованої таблиці — (event_id, occurred_at); ретрай з іншим часом не має стати другою подією
+    event = {"event_id": "66666666-6666-6666-6666-666666666666", "user_id": "u1", "event_type": "purchase"}
+    r = await client.post("/events", json=[{**event, "occurred_at": "2025-08-10T12:00:00+00:00"}])
+    assert r.json() == {"ingested": 1, "duplicates": 0}
+    r = await client.post("/events", json=[{**event, "occurred_at": "2025-09-10T12:00:00+00:00"}])
+    assert r.json() == {"ingested": 0, "duplicates": 1}
+    # і в межах одного батчу
+    other = {**event, "event_id": "77777777-7777-7777-7777-777777777777"}
+    r = await client.post("/events", json=[
+        {**other, "occurred_at": "2025-08-11T12:00:00+00:00"}, {**other, "occurred_at": "2025-08-12T12:00:00+00:00"},
+    ])
+    assert r.json() == {"ingested": 1, "duplicates": 1}
+
+    conn = await get_conn()
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) AS n FROM events;")
+        assert (await cur.fetchone())["n"] == 2
+        await cur.execute("SELECT COALESCE(SUM(events), 0) AS n FROM daily_event_counts;")
+        assert (await cur.fetchone())["n"] == 2
+        # видалений рядок звільняє свій id
+        await cur.execute("DELETE FROM events WHERE event_id = %(id)s;", {"id": event["event_id"]})
+    r = await client.post("/events", json=[{**event, "occurred_at": "2025-09-10T12:00:00+00:00"}])
+    assert r.json() == {"ingested": 1, "duplicates": 0}
+
+
+@pytest.mark.asyncio
+async def test_detached_partition_frees_event_ids(client):
+    conn = await get_conn()
+    if not await is_partitioned(conn):
+        pytest.skip("events is not partitioned in this database")
+
+    event = {
+        "event_id": "88888888-8888-8888-8888-888888888888", "occurred_at": "2025-01-10T12:00:00+00:00",
+        "user_id": "u1", "event_type": "view",
+    }
+    assert (await client.post("/events", json=[event])).json() == {"ingested": 1, "duplicates": 0}
+    assert "events_p20250101" in await detach_partitions_before(conn, date(2025, 2, 1), drop=True)
+    # подія пішла з events разом з партицією — повторна доставка знову вставляється
+    assert (await client.post("/events", json=[event])).json() == {"ingested": 1, "duplicates": 0}
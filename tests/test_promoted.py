@@ -0,0 +1,179 @@
+import uuid
+
+import pytest
+
+from app.infrastructure import promoted
+from app.infrastructure.db import get_conn
+from app.shared import segment
+from app.shared.settings import settings
+
+
+def _ev(user_id: str, props: dict) -> dict:
+    return {
+        "event_id": str(uuid.uuid4()),
+        "occurred_at": "2025-08-01T10:00:00Z",
+        "user_id": user_id,
+        "event_type": "purchase",
+        "properties": props,
+    }
+
+
+async def _drop_promoted(conn, *keys: str) -> None:
+    """Прибирає все, що тест додав у спільну БД: конфіг, тригер, колонки й рядки promoted_properties."""
+    await promoted.ensure_promoted(conn)
+    async with conn.cursor() as cur:
+        for key in keys:
+            await cur.execute(f'ALTER TABLE events DROP COLUMN IF EXISTS "prop_{key}";')
+        await cur.execute("DELETE FROM promoted_properties WHERE key = ANY(%(k)s);", {"k": list(keys)})
+    await promoted.load_promoted(conn)
+
+
+def test_parse_spec():
+    assert promoted.parse_spec(" country:text, price:numeric,vip:boolean,plan") == {
+        "country": "text", "price": "numeric", "vip": "boolean", "plan": "text",
+    }
+    with pytest.raises(ValueError):
+        promoted.parse_spec("price:float")
+    with pytest.raises(ValueError):
+        promoted.parse_spec("bad-key:text")
+
+
+def test_segment_routes_to_promoted_columns(monkeypatch):
+    monkeypatch.setattr(segment, "_promoted", {"country": "text", "price": "numeric"})
+    assert segment.build_segment_filter("properties.country IN (UA, PL)")[0] == 'AND "prop_country" = ANY(%(seg_p0)s::text[])'
+    assert segment.build_segment_filter("properties.price >= 9.99")[0] == 'AND "prop_price" >= %(seg_p0)s::numeric'
+    # нечислове значення для numeric-колонки — назад у JSONB
+    assert "@>" in segment.build_segment_filter("properties.price=free")[0]
+    assert "@>" in segment.build_segment_filter("properties.plan=pro")[0]
+    # голе 5 — і число, і рядок "5": рядок колонка не містить, тож він лишається на @>
+    sql, params = segment.build_segment_filter("properties.price=5")
+    assert sql == 'AND ("prop_price" = %(seg_p0)s::numeric OR properties @> %(seg_p1)s::jsonb)'
+    assert params["seg_p1"] == '{"price": "5"}'
+    sql, params = segment.build_segment_filter("properties.country=5")
+    assert sql == 'AND ("prop_country" = %(seg_p0)s::text OR properties @> %(seg_p1)s::jsonb)'
+    assert params == {"seg_p0": "5", "seg_p1": '{"country": 5}'}
+    assert segment.build_segment_filter('properties.country="5"')[0] == 'AND "prop_country" = %(seg_p0)s::text'
+    assert "@>" in segment.build_segment_filter('properties.price="5"')[0]
+    assert "jsonb_path_exists" in segment.build_segment_filter("properties.country > 5")[0]
+
+
+@pytest.mark.asyncio
+async def test_promoted_column_backfill_and_routing(client, monkeypatch):
+    conn = await get_conn()
+    batch = [
+        _ev("u1", {"country": "UA", "price": 5}),
+        _ev("u2", {"country": "PL", "price": 25.5}),
+        _ev("u3", {"country": "UA", "price": "n/a"}),
+        _ev("u5", {"country": 5, "price": "5"}),
+    ]
+    assert (await client.post("/events", json=batch)).status_code == 201
+
+    async def dau(seg: str) -> int:
+        r = await client.get("/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01", "segment": seg})
+        assert r.status_code == 200, r.text
+        return r.json()[0]["dau"]
+
+    segments = (
+        "properties.price > 10", "properties.price <= 5", "properties.country=UA",
+        "properties.price=5", 'properties.price="5"', "properties.country=5", 'properties.country="5"',
+    )
+    before = {seg: await dau(seg) for seg in segments}
+    assert before == {
+        "properties.price > 10": 1, "properties.price <= 5": 1, "properties.country=UA": 2,
+        "properties.price=5": 2, 'properties.price="5"': 1, "properties.country=5": 1, 'properties.country="5"': 0,
+    }
+
+    monkeypatch.setattr(settings, "promoted_properties", "country:text,price:numeric")
+    try:
+        # нова колонка на непорожній таблиці — ще не маршрутизується
+        await promoted.ensure_promoted(conn)
+        assert "price" not in segment._promoted
+
+        # нові рядки заповнює тригер, старі — бекфіл
+        assert (await client.post("/events", json=[_ev("u4", {"price": 11})])).status_code == 201
+        updated = await promoted.backfill(conn, days_per_batch=1)
+        assert updated["price"] == 2
+        assert segment._promoted == {"country": "text", "price": "numeric"}
+        async with conn.cursor() as cur:
+            await cur.execute('SELECT user_id, "prop_price" AS price FROM events ORDER BY user_id;')
+            assert [(r["user_id"], r["price"]) for r in await cur.fetchall()] == [
+                ("u1", 5), ("u2", 25.5), ("u3", None), ("u4", 11), ("u5", None),
+            ]
+
+        # маршрутизація в колонки не змінює відповідей (u4 додав одну ціну > 10)
+        assert {seg: await dau(seg) for seg in segments} == {**before, "properties.price > 10": 2}
+
+        # EXPLAIN: сегмент по promoted-ключу йде через btree (col, occurred_at)
+        seg_sql, seg_params = segment.build_segment_filter("properties.price > 10")
+        async with conn.transaction(), conn.cursor() as cur:
+            await cur.execute("SET LOCAL enable_seqscan = off;")
+            await cur.execute(
+                f"EXPLAIN SELECT COUNT(*) FROM events WHERE occurred_at >= '2025-08-01' {seg_sql};", seg_params
+            )
+            plan = "\n".join(r["QUERY PLAN"] for r in await cur.fetchall())
+        assert "prop_price" in plan and "Index" in plan, plan
+    finally:
+        monkeypatch.undo()
+        await _drop_promoted(conn, "country", "price")
+
+
+@pytest.mark.asyncio
+async def test_readded_key_needs_backfill_again(client, monkeypatch):
+    conn = await get_conn()
+
+    async def dau() -> int:
+        r = await client.get(
+            "/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01", "segment": "properties.price > 10"}
+        )
+        return r.json()[0]["dau"]
+
+    try:
+        monkeypatch.setattr(settings, "promoted_properties", "price:numeric")
+        await promoted.ensure_promoted(conn)
+        assert (await client.post("/events", json=[_ev("u1", {"price": 20})])).status_code == 201
+        await promoted.backfill(conn)
+        assert segment._promoted == {"price": "numeric"}
+
+        # ключ прибрали: колонка лишилась, але тригер її більше не заповнює
+        monkeypatch.setattr(settings, "promoted_properties", "")
+        await promoted.ensure_promoted(conn)
+        assert (await client.post("/events", json=[_ev("u2", {"price": 30})])).status_code == 201
+
+        # повернули — до нового бекфілу сегмент іде через JSONB, а не в колонку з NULL для u2
+        monkeypatch.setattr(settings, "promoted_properties", "price:numeric")
+        await promoted.ensure_promoted(conn)
+        assert segment._promoted == {}
+        assert await dau() == 2
+        await promoted.backfill(conn)
+        assert segment._promoted == {"price": "numeric"}
+        assert await dau() == 2
+    finally:
+        monkeypatch.undo()
+        await _drop_promoted(conn, "price")
+
+
+@pytest.mark.asyncio
+async def test_startup_leaves_unchanged_trigger_alone(monkeypatch):
+    conn = await get_conn()
+
+    async def trigger_oid():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT oid FROM pg_trigger WHERE tgrelid = 'events'::regclass AND tgname = 'events_promoted_properties';"
+            )
+            row = await cur.fetchone()
+            return row and row["oid"]
+
+    monkeypatch.setattr(settings, "promoted_properties", "country:text")
+    try:
+        await promoted.ensure_promoted(conn)
+        first = await trigger_oid()
+        assert first is not None
+        # повторний старт з тим самим конфігом — без DROP/CREATE TRIGGER
+        await promoted.ensure_promoted(conn)
+        assert await trigger_oid() == first
+    finally:
+        monkeypatch.undo()
+        await _drop_promoted(conn, "country")
+    # PROMOTED_PROPERTIES порожній — тригера немає
+    assert await trigger_oid() is None
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from starlette.responses import PlainTextResponse
+
+from pydantic import ValidationError
+
+from app.infrastructure.db import get_conn
+from app.infrastructure.rate_limit import PostgresBucketStore
+from app.shared import settings as settings_module
+from app.shared.middleware import MemoryBucketStore, RateLimitMiddleware
+
+
+async def _ok(scope, receive, send):
+    # дочитуємо тіло, як це робить справжній хендлер
+    while (await receive()).get("more_body", False):
+        pass
+    await PlainTextResponse("ok")(scope, receive, send)
+
+
+def _events(n: int) -> bytes:
+    return json.dumps(
+        [{"event_id": f"00000000-0000-0000-0000-{i:012d}", "user_id": "u", "event_type": "view",
+          "occurred_at": "2025-01-01T00:00:00Z", "properties": {}} for i in range(n)]
+    ).encode()
+
+
+@pytest.mark.asyncio
+async def test_memory_store_caps_keys_and_evicts_idle():
+    store = MemoryBucketStore(capacity=10, refill_rate=1.0, max_keys=3)
+    for k in ("a", "b", "c", "d"):
+        assert await store.take(k, 5) == 0.0
+    # жорсткий ліміт: найдавніший ключ витіснено
+    assert len(store) == 3 and "a" not in store._buckets
+
+    # бакет, що встиг наповнитись, прибирається без втрати стану
+    store._buckets["b"].last -= 60
+    store._buckets["c"].last -= 60
+    assert await store.take("d", 1) == 0.0
+    assert list(store._buckets) == ["d"]
+
+
+@pytest.mark.asyncio
+async def test_memory_store_retry_after_reflects_deficit():
+    store = MemoryBucketStore(capacity=10, refill_rate=2.0, max_keys=100)
+    assert await store.take("k", 10) == 0.0
+    wait = await store.take("k", 4)
+    assert 1.9 < wait <= 2.0
+    await store.debit("k", 10)
+    assert await store.take("k", 1) > 5
+
+
+@pytest.mark.asyncio
+async def test_cost_follows_batch_size():
+    mw = RateLimitMiddleware(_ok, store=MemoryBucketStore(capacity=1000, refill_rate=1.0, max_keys=10))
+    mw.capacity, mw.bytes_per_event = 1000, 100
+    transport = ASGITransport(app=mw)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        body = _events(3)
+        # ~N/100 токенів за запит: 1000-токеновий бакет витримує кілька таких батчів
+        n_ok = 0
+        for _ in range(1000):
+            r = await ac.post("/events", content=body, headers={"Content-Type": "application/json"})
+            if r.status_code != 200:
+                break
+            n_ok += 1
+        assert n_ok == 1000 // mw._cost(len(body))
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+
+        # інші ключі й інші шляхи не зачеплені
+        r = await ac.post("/events", content=body, headers={"X-API-Key": "other"})
+        assert r.status_code == 200
+        assert (await ac.get("/stats/dau")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_chunked_body_is_charged_after_read():
+    store = MemoryBucketStore(capacity=100, refill_rate=0.001, max_keys=10)
+    mw = RateLimitMiddleware(_ok, store=store)
+    mw.capacity, mw.bytes_per_event = 100, 10
+
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 50
+
+    transport = ASGITransport(app=mw)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        r = await ac.post("/events/stream", content=chunks(), headers={"Content-Type": "application/x-ndjson"})
+        assert r.status_code == 200
+        # 500 байт / 10 = 50 подій списано попри відсутність Content-Length
+        assert store._buckets["ip:127.0.0.1"].tokens == pytest.approx(50, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_postgres_store_shares_buckets():
+    conn = await get_conn()
+    async with conn.cursor() as cur:
+        await cur.execute("TRUNCATE rate_limit_buckets;")
+
+    # два "процеси" з власними екземплярами бачать один баланс
+    a = PostgresBucketStore(capacity=10, refill_rate=0.01)
+    b = PostgresBucketStore(capacity=10, refill_rate=0.01)
+    assert await a.take("k", 6) == 0.0
+    assert await b.take("k", 6) > 0
+    assert await b.take("k", 4) == 0.0
+    await a.debit("k", 5)
+    assert await a.take("k", 1) > 100
+
+    async with conn.cursor() as cur:
+        await cur.execute("UPDATE rate_limit_buckets SET updated_at = updated_at - interval '1 hour';")
+    a._next_sweep = 0
+    assert await a.take("other", 1) == 0.0
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT key FROM rate_limit_buckets ORDER BY key;")
+        assert [r["key"] for r in await cur.fetchall()] == ["other"]
+
+
+def test_rate_limit_settings_are_validated(monkeypatch):
+    # старі імена рахували запити — без нових не перетлумачуємо їх мовчки
+    monkeypatch.setenv("RATE_LIMIT_RPS", "20")
+    monkeypatch.delenv("RATE_LIMIT_EVENTS_PER_SEC", raising=False)
+    with pytest.raises(RuntimeError, match="RATE_LIMIT_EVENTS_PER_SEC"):
+        settings_module._renamed("RATE_LIMIT_EVENTS_PER_SEC", "RATE_LIMIT_RPS", "20000")
+    monkeypatch.setenv("RATE_LIMIT_EVENTS_PER_SEC", "500")
+    assert settings_module._renamed("RATE_LIMIT_EVENTS_PER_SEC", "RATE_LIMIT_RPS", "20000") == "500"
+
+    with pytest.raises(ValidationError):
+        settings_module.Settings(rate_limit_events_per_sec=0)
+    with pytest.raises(ValidationError):
+        settings_module.Settings(rate_limit_backend="redis")
@@ -0,0 +1,107 @@
+import pytest
+
+from app.infrastructure import db
+from app.infrastructure.db import _conninfo, read_connection
+from app.shared.settings import settings
+
+
+def _reader_dsn(**overrides) -> str:
+    # той самий сервер під іншим application_name — імітує окремий read DSN (репліку)
+    from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+    params = conninfo_to_dict(_conninfo())
+    params.pop("options", None)
+    params.update(application_name="reader", **overrides)
+    return make_conninfo(**params)
+
+
+async def _app_name(conn) -> str:
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT current_setting('application_name') AS name;")
+        return (await cur.fetchone())["name"]
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_read_dsn(monkeypatch):
+    async with read_connection() as conn:
+        assert await _app_name(conn) != "reader"
+
+    monkeypatch.setattr(settings, "db_read_dsn", _reader_dsn())
+    async with read_connection() as conn:
+        assert await _app_name(conn) == "reader"
+        async with conn.cursor() as cur:
+            await cur.execute("SHOW TimeZone;")
+            assert (await cur.fetchone())["TimeZone"] == "UTC"
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back_to_primary(client, monkeypatch):
+    monkeypatch.setattr(settings, "db_read_dsn", _reader_dsn(port=1))
+    monkeypatch.setattr(settings, "db_read_timeout", 0.2)
+
+    r = await client.get("/stats/dau", params={"from": "2025-01-01", "to": "2025-01-02"})
+    assert r.status_code == 200
+    # репліку позначено недоступною — наступні запити не чекають на таймаут
+    assert db._read_down_until > 0
+    async with read_connection() as conn:
+        assert await _app_name(conn) != "reader"
+
+
+@pytest.mark.asyncio
+async def test_stale_replica_is_skipped(monkeypatch):
+    monkeypatch.setattr(settings, "db_read_dsn", _reader_dsn())
+
+    async def lag(conn):
+        return 120.0
+
+    monkeypatch.setattr(db, "_replica_lag", lag)
+    async with read_connection(max_staleness=5) as conn:
+        assert await _app_name(conn) != "reader"
+    # без обмеження на лаг — читаємо з репліки, хоч вона й відстає
+    async with read_connection(max_staleness=0) as conn:
+        assert await _app_name(conn) == "reader"
+
+
+@pytest.mark.asyncio
+async def test_saturated_replica_is_not_failed_over(monkeypatch):
+    from psycopg_pool import PoolTimeout
+
+    monkeypatch.setattr(settings, "db_read_dsn", _reader_dsn())
+    monkeypatch.setattr(settings, "db_read_pool_max", 1)
+    monkeypatch.setattr(settings, "db_read_timeout", 0.1)
+    monkeypatch.setattr(settings, "db_pool_timeout", 0.3)
+
+    async with read_connection() as busy:
+        assert await _app_name(busy) == "reader"
+        # єдине з'єднання зайняте: чекаємо й віддаємо PoolTimeout (503), а не йдемо на primary
+        with pytest.raises(PoolTimeout):
+            async with read_connection():
+                pass
+    assert db._read_down_until == 0
+    async with read_connection() as conn:
+        assert await _app_name(conn) == "reader"
+
+
+@pytest.mark.asyncio
+async def test_recompute_after_invalidation_reads_primary(monkeypatch):
+    from datetime import date
+
+    from app.shared.cache import stats_cache
+
+    monkeypatch.setattr(settings, "db_read_dsn", _reader_dsn())
+    day = date(2025, 8, 1)
+
+    async def source(key: str, lo: date = day, hi: date = day) -> str:
+        async def compute():
+            async with read_connection() as conn:
+                return await _app_name(conn)
+        return await stats_cache.get_or_compute("test", (key,), lo, hi, compute)
+
+    assert await source("a") == "reader"
+    # інгест скинув день: репліка може його ще не бачити — перерахунок іде на primary
+    stats_cache.invalidate_days([day])
+    assert await source("b") != "reader"
+    assert await source("c", date(2025, 8, 2), date(2025, 8, 3)) == "reader"
+    # поза вікном — знову репліка
+    monkeypatch.setattr(settings, "stats_cache_primary_window", 0)
+    assert await source("d") == "reader"
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+
+
+def _ev(user_id: str, occurred_at: str) -> dict:
+    return {
+        "event_id": str(uuid.uuid4()),
+        "occurred_at": occurred_at,
+        "user_id": user_id,
+        "event_type": "login",
+        "properties": {"country": "UA"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_retention_matrix_uses_first_seen(client):
+    events = [
+        # "old" був активний до початку — не новий юзер, у когорти не потрапляє
+        _ev("old", "2025-07-20T10:00:00Z"), _ev("old", "2025-08-01T10:00:00Z"),
+        # когорта 2025-08-01: a, b; a повертається 08-02 і 08-03
+        _ev("a", "2025-08-01T09:00:00Z"), _ev("a", "2025-08-02T09:00:00Z"), _ev("a", "2025-08-03T09:00:00Z"),
+        _ev("b", "2025-08-01T12:00:00Z"),
+        # когорта 2025-08-02: c, повертається 08-03
+        _ev("c", "2025-08-02T08:00:00Z"), _ev("c", "2025-08-03T08:00:00Z"),
+    ]
+    assert (await client.post("/events", json=events)).status_code == 201
+
+    r = await client.get("/stats/retention/matrix", params={
+        "from": "2025-08-01", "cohorts": 3, "windows": 3, "window_size": "daily",
+    })
+    assert r.status_code == 200
+    assert r.json() == [
+        {"cohort_start_date": "2025-08-01", "size": 2, "retention": [1.0, 0.5, 0.5]},
+        {"cohort_start_date": "2025-08-02", "size": 1, "retention": [1.0, 1.0, 0.0]},
+        {"cohort_start_date": "2025-08-03", "size": 0, "retention": [0.0, 0.0, 0.0]},
+    ]
+
+    # старий endpoint — перший рядок тієї ж матриці; з сегментом — той самий результат
+    for seg in (None, "properties.country=UA"):
+        params = {"start_date": "2025-08-01", "windows": 3}
+        if seg:
+            params["segment"] = seg
+        r = await client.get("/stats/retention", params=params)
+        assert r.json() == [{"cohort_start_date": "2025-08-01", "size": 2, "w0": 1.0, "w1": 0.5, "w2": 0.5}]
+
+    # backfill ранішої події b переносить його в ранішу когорту (і скидає кеш)
+    assert (await client.post("/events", json=[_ev("b", "2025-07-01T00:00:00Z")])).status_code == 201
+    r = await client.get("/stats/retention", params={"start_date": "2025-08-01", "windows": 3})
+    assert r.json() == [{"cohort_start_date": "2025-08-01", "size": 1, "w0": 1.0, "w1": 1.0, "w2": 1.0}]
+
+
+@pytest.mark.asyncio
+async def test_retention_matrix_validation(client):
+    r = await client.get("/stats/retention/matrix", params={"from": "2025-08-01", "cohorts": 0})
+    assert r.status_code == 400
+    r = await client.get("/stats/retention/matrix", params={"from": "2025-08-01", "window_size": "monthly"})
+    assert r.status_code == 422
@@ -0,0 +1,70 @@
+
+from pathlib import Path
+import pytest
+
+from app.cli.main import _run_import
+from app.infrastructure.db import get_conn
+from app.infrastructure.rollups import rebuild_rollups
+
+SAMPLE = Path(__file__).resolve().parent.parent / "data" / "events_sample.csv"
+
+
+async def _snapshot():
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("SELECT day, dau FROM daily_dau ORDER BY day;")
+        dau = await cur.fetchall()
+        await cur.execute("SELECT day, event_type, events FROM daily_event_counts ORDER BY day, event_type;")
+        counts = await cur.fetchall()
+        await cur.execute("SELECT user_id, first_seen FROM user_first_seen ORDER BY user_id;")
+        first_seen = await cur.fetchall()
+    return dau, counts, first_seen
+
+
+@pytest.mark.asyncio
+async def test_rollups_match_rebuild_from_raw_events(client):
+    # API + CLI наповнюють агрегати інкрементально, у т.ч. з дублями
+    await _run_import(str(SAMPLE), None, 1000, None)
+    await _run_import(str(SAMPLE), None, 1000, None, restart=True)
+    r = await client.post("/events", json=[{
+        "event_id": "33333333-3333-3333-3333-333333333333",
+        "occurred_at": "2025-08-05T10:00:00+00:00",
+        "user_id": "brand-new-user",
+        "event_type": "login",
+        "properties": {},
+    }])
+    assert r.status_code == 201
+    incremental = await _snapshot()
+    assert incremental[0]
+
+    # повний перерахунок з events дає ті ж самі агрегати
+    await rebuild_rollups(await get_conn())
+    assert await _snapshot() == incremental
+
+
+@pytest.mark.asyncio
+async def test_stats_from_rollups_match_raw_scan(client):
+    await _run_import(str(SAMPLE), None, 1000, None)
+    params = {"from": "2025-08-01", "to": "2025-08-31"}
+
+    dau = (await client.get("/stats/dau", params=params)).json()
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("""
+            SELECT occurred_at::date AS day, COUNT(DISTINCT user_id) AS dau FROM events
+            WHERE occurred_at >= '2025-08-01' AND occurred_at < '2025-09-01'
+            GROUP BY 1;
+        """)
+        raw = {r["day"].isoformat(): r["dau"] for r in await cur.fetchall()}
+    assert {d["date"]: d["dau"] for d in dau if d["dau"]} == raw
+
+    top = (await client.get("/stats/top-events", params={**params, "limit": 100})).json()
+    async with (await get_conn()).cursor() as cur:
+        await cur.execute("""
+            SELECT event_type, COUNT(*) AS cnt FROM events
+            WHERE occurred_at >= '2025-08-01' AND occurred_at < '2025-09-01'
+            GROUP BY 1;
+        """)
+        raw_top = {r["event_type"]: r["cnt"] for r in await cur.fetchall()}
+    assert {t["event_type"]: t["count"] for t in top} == raw_top
+
+    only_login = (await client.get("/stats/top-events", params={**params, "segment": "event_type:login"})).json()
+    assert only_login == [{"event_type": "login", "count": raw_top["login"]}]
@@ -0,0 +1,115 @@
+import re
+import uuid
+
+import pytest
+
+from app.infrastructure.db import get_conn
+from app.shared.segment import SegmentError, build_segment_filter, event_types_segment
+
+
+def test_segment_compiles_equality_to_containment():
+    assert build_segment_filter("properties.country=UA") == (
+        "AND properties @> %(seg_p0)s::jsonb", {"seg_p0": '{"country": "UA"}'}
+    )
+    # голе число — і рядок, і число; у лапках — лише рядок
+    sql, params = build_segment_filter("properties.n=42")
+    assert sql.count("@>") == 2 and set(params.values()) == {'{"n": "42"}', '{"n": 42}'}
+    sql, params = build_segment_filter('properties.n="42"')
+    assert sql.count("@>") == 1
+    # старий формат зі значенням з пробілами
+    assert build_segment_filter("properties.city=New York")[1] == {"seg_p0": '{"city": "New York"}'}
+
+
+def test_event_type_only_segments():
+    assert event_types_segment("event_type:login") == ["login"]
+    assert event_types_segment("event_type IN (purchase, login)") == ["login", "purchase"]
+    assert event_types_segment("event_type:login OR event_type:purchase") == ["login", "purchase"]
+    assert event_types_segment("event_type:login AND properties.country=UA") is None
+    assert event_types_segment(None) is None
+
+
+@pytest.mark.parametrize("bad", [
+    "foo=bar", "properties.price > abc", "properties.country=UA AND", "(event_type:a", "properties.a-b=1",
+    "properties.price=1e400", "properties.price > -1e400", "properties.price IN (1, 1e400)",
+])
+def test_segment_rejects_invalid(bad):
+    with pytest.raises(SegmentError):
+        build_segment_filter(bad)
+
+
+def _ev(user_id: str, event_type: str, props: dict) -> dict:
+    return {
+        "event_id": str(uuid.uuid4()),
+        "occurred_at": "2025-08-01T10:00:00Z",
+        "user_id": user_id,
+        "event_type": event_type,
+        "properties": props,
+    }
+
+
+@pytest.mark.asyncio
+async def test_segment_expressions_filter_events(client):
+    batch = [
+        _ev("u1", "purchase", {"country": "UA", "price": 10}),
+        _ev("u2", "purchase", {"country": "PL", "price": 99.5}),
+        _ev("u3", "login", {"country": "DE"}),
+        _ev("u4", "signup", {"country": "UA", "price": "n/a"}),
+        _ev("u5", "login", {"country": "UA", "plan": "pro"}),
+    ]
+    assert (await client.post("/events", json=batch)).status_code == 201
+
+    async def dau(segment: str) -> int:
+        r = await client.get("/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01", "segment": segment})
+        assert r.status_code == 200, r.text
+        return r.json()[0]["dau"]
+
+    assert await dau("properties.country IN (UA, PL)") == 4
+    assert await dau("event_type IN (purchase, login) AND properties.country=UA") == 2
+    assert await dau("properties.price > 20 OR properties.plan=pro") == 2
+    # нечислові значення ключа в порівняння не потрапляють
+    assert await dau("properties.price >= 10") == 2
+    assert await dau("properties.price=10") == 1
+
+    top = await client.get("/stats/top-events", params={
+        "from": "2025-08-01", "to": "2025-08-01", "segment": "event_type IN (login, signup)",
+    })
+    assert {t["event_type"]: t["count"] for t in top.json()} == {"login": 2, "signup": 1}
+
+    r = await client.get("/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01", "segment": "bogus"})
+    assert r.status_code == 400
+    # число поза float — 400, а не помилка ::jsonb; у лапках це звичайний рядок
+    r = await client.get("/stats/dau", params={"from": "2025-08-01", "to": "2025-08-01", "segment": "properties.price=1e400"})
+    assert r.status_code == 400
+    assert await dau('properties.price="1e400"') == 0
+
+
+@pytest.mark.asyncio
+async def test_equality_segment_uses_gin_index(client):
+    # UA рідкісна, а IN (login, purchase) покриває все: зі свіжою статистикою план не залежить
+    # від порядку тестів і обирає GIN, а не btree (event_type, occurred_at)
+    batch = [_ev(f"u{i}", "login", {"country": "UA" if i % 50 == 0 else "PL"}) for i in range(1000)]
+    assert (await client.post("/events", json=batch)).status_code == 201
+
+    seg_sql, seg_params = build_segment_filter("properties.country=UA AND event_type IN (login, purchase)")
+    conn = await get_conn()
+    async with conn.cursor() as cur:
+        await cur.execute("ANALYZE events;")
+    async with conn.transaction(), conn.cursor() as cur:
+        await cur.execute("SET LOCAL enable_seqscan = off;")
+        await cur.execute(
+            f"""
+            EXPLAIN SELECT COUNT(DISTINCT user_id) FROM events
+            WHERE occurred_at >= '2025-08-01' AND occurred_at < '2025-08-02' {seg_sql};
+            """,
+            seg_params,
+        )
+        plan = "\n".join(row["QUERY PLAN"] for row in await cur.fetchall())
+        # на партиціях індекс має автоматичне ім'я — перевіряємо, що це GIN по properties
+        used = set(re.findall(r"Bitmap Index Scan on (\S+)", plan))
+        await cur.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexdef ILIKE '%%USING gin (properties jsonb_path_ops)%%';"
+        )
+        gin = {r["indexname"] for r in await cur.fetchall()}
+
+    assert "idx_events_props_gin" in gin
+    assert used & gin, plan
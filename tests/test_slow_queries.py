@@ -0,0 +1,71 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.api.routes_debug import router as debug_router
+from app.infrastructure.slow_queries import SlowQueryLog, fingerprint, slow_queries
+from app.shared.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def _ring():
+    slow_queries.clear()
+    yield
+    slow_queries.clear()
+
+
+@pytest.mark.asyncio
+async def test_slow_stats_query_recorded_with_plan(client, monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_ms", 0.001)  # будь-який запит — повільний
+    monkeypatch.setattr(settings, "slow_query_explain_sample", 1.0)
+
+    r = await client.get(
+        "/stats/dau",
+        params={"from": "2025-08-01", "to": "2025-08-03", "segment": "event_type:purchase"},
+        headers={"X-Request-ID": "req-slow-1"},
+    )
+    assert r.status_code == 200
+    await slow_queries.drain()
+
+    # в основному app /debug/* без DEBUG_ENDPOINTS=1 не підключено
+    assert (await client.get("/debug/slow-queries")).status_code == 404
+    debug_app = FastAPI()
+    debug_app.include_router(debug_router)
+    debug = AsyncClient(transport=ASGITransport(app=debug_app), base_url="http://test")
+
+    body = (await debug.get("/debug/slow-queries")).json()
+    [entry] = body["queries"]
+    assert entry["endpoint"] == "dau"
+    assert entry["request_id"] == "req-slow-1"
+    assert entry["params"]["from"] == "2025-08-01"
+    assert "purchase" in entry["params"].values()
+    assert "actual time=" in entry["plan"]
+
+    # фільтр за формою запиту
+    other = (await debug.get("/debug/slow-queries", params={"fingerprint": "0" * 16})).json()
+    assert other["queries"] == []
+    await debug.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fast_queries_and_disabled_threshold_skip_ring(client, monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_ms", 60_000)
+    assert (await client.get("/stats/top-events", params={"from": "2025-08-01", "to": "2025-08-02"})).status_code == 200
+    monkeypatch.setattr(settings, "slow_query_ms", 0)
+    assert slow_queries.observe("dau", "SELECT 1", {}, 100.0) is None
+    assert len(slow_queries) == 0
+
+
+def test_fingerprint_ignores_whitespace_and_comments():
+    a = fingerprint("SELECT 1\n  FROM t -- коментар\nWHERE x = %(x)s")
+    assert a == fingerprint("SELECT 1 FROM t WHERE x = %(x)s")
+    assert a != fingerprint("SELECT 1 FROM t WHERE y = %(y)s")
+
+
+def test_ring_is_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_ms", 1)
+    monkeypatch.setattr(settings, "slow_query_explain_sample", 0.0)
+    ring = SlowQueryLog(size=3)
+    for i in range(5):
+        ring.observe("dau", f"SELECT {i}", {}, 1.0)
+    assert [e.sql for e in ring.entries()] == ["SELECT 4", "SELECT 3", "SELECT 2"]
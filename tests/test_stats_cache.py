@@ -0,0 +1,91 @@
+
+from datetime import date
+import pytest
+
+from app.shared.cache import StatsCache, stats_cache
+
+
+def test_cache_invalidates_only_overlapping_ranges():
+    c = StatsCache(max_entries=10, max_bytes=10_000, ttl=60)
+    c.put("aug1-3", [1], date(2025, 8, 1), date(2025, 8, 3))
+    c.put("aug5-9", [2], date(2025, 8, 5), date(2025, 8, 9))
+    c.put("sep", [3], date(2025, 9, 1), date(2025, 9, 30))
+
+    assert c.invalidate_days([date(2025, 8, 4), date(2025, 8, 9)]) == 1
+    assert c.get("t", "aug1-3") == [1]
+    assert c.get("t", "aug5-9") is None
+    assert c.get("t", "sep") == [3]
+
+    assert c.invalidate_days(None) == 2
+    assert len(c) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_compute_is_not_lost():
+    c = StatsCache(max_entries=10, max_bytes=10_000, ttl=60)
+    aug = (date(2025, 8, 1), date(2025, 8, 3))
+
+    async def racing_compute():
+        # NOTIFY прийшов, поки запит ще рахувався на старих даних
+        c.invalidate_days([date(2025, 8, 2)])
+        return ["stale"]
+
+    assert await c.get_or_compute("t", ("k",), *aug, racing_compute) == ["stale"]
+    assert len(c) == 0
+
+    # інвалідація інших днів не заважає закешувати результат
+    async def unrelated():
+        c.invalidate_days([date(2025, 9, 1)])
+        return ["fresh"]
+
+    assert await c.get_or_compute("t", ("k",), *aug, unrelated) == ["fresh"]
+    assert c.get("t", ("t", "k")) == ["fresh"]
+
+
+def test_cache_lru_memory_and_ttl_limits():
+    c = StatsCache(max_entries=2, max_bytes=10_000, ttl=60)
+    d = date(2025, 8, 1)
+    c.put("a", [1], d, d)
+    c.put("b", [2], d, d)
+    assert c.get("t", "a") == [1]          # "a" стає найсвіжішим
+    c.put("c", [3], d, d)                   # витісняє "b"
+    assert c.get("t", "b") is None and c.get("t", "c") == [3]
+
+    small = StatsCache(max_entries=100, max_bytes=40, ttl=60)
+    small.put("x", "a" * 20, d, d)
+    small.put("y", "b" * 20, d, d)          # не влазить разом з "x"
+    assert small.get("t", "x") is None and small.get("t", "y") == "b" * 20
+
+    expired = StatsCache(max_entries=10, max_bytes=10_000, ttl=0)
+    expired.put("z", [1], d, d)
+    assert expired.get("t", "z") is None
+
+
+def _event(eid: str, day: str, user: str):
+    return {
+        "event_id": eid,
+        "occurred_at": f"{day}T10:00:00+00:00",
+        "user_id": user,
+        "event_type": "view",
+        "properties": {},
+    }
+
+
+@pytest.mark.asyncio
+async def test_ingest_invalidates_cached_stats(client):
+    await client.post("/events", json=[_event("55555555-5555-5555-5555-555555555501", "2025-08-01", "u1")])
+    params = {"from": "2025-08-01", "to": "2025-08-02"}
+
+    first = (await client.get("/stats/dau", params=params)).json()
+    assert first == [{"date": "2025-08-01", "dau": 1}, {"date": "2025-08-02", "dau": 0}]
+    assert len(stats_cache) == 1
+
+    # подія поза діапазоном — кешований запис лишається
+    await client.post("/events", json=[_event("55555555-5555-5555-5555-555555555502", "2025-08-20", "u2")])
+    assert len(stats_cache) == 1
+
+    # подія в діапазоні — запис скинуто, нова відповідь бачить свіжі дані
+    await client.post("/events", json=[_event("55555555-5555-5555-5555-555555555503", "2025-08-02", "u3")])
+    assert len(stats_cache) == 0
+    second = (await client.get("/stats/dau", params=params)).json()
+    assert second == [{"date": "2025-08-01", "dau": 1}, {"date": "2025-08-02", "dau": 1}]